@@ -0,0 +1,227 @@
+# dataset.py
+# Training data as a Parquet dataset instead of one ever-growing CSV.
+#
+# Layout (hive partitioning by the day rows were ingested):
+#   Output/dataset/
+#     ingest_date=2025-01-01/part-20250101T120000123456-ab12cd34.parquet
+#     ingest_date=2025-01-02/...
+# Every append writes a new file, so nothing is ever re-read or rewritten when feedback arrives.
+# Files sort by name in ingestion order, and load() keeps that order, so row positions are
+# stable as the dataset grows (model.py --warm-start relies on this, as it did with the CSV).
+#
+# Column types: features float32, Label int8, MFR_NAME / ENTERPRISE dictionary-encoded
+# (pandas "category"), ids and URLs plain strings. load(columns=...) reads only those columns
+# from each file; nothing else is parsed or held in memory.
+#
+# Usage:
+#   python dataset.py migrate Output/images_with_features_new.csv   # one-time CSV -> dataset
+#
+# The legacy CSV's rows always come first. Imported files are named part-<MIGRATED_STAMP>-*,
+# which sorts before any appended file, so migrate also works on a dataset that already has
+# rows, and the name marks the CSV as imported: process_feedback.py migrates it before its
+# first append, and model.py refuses to train while a CSV sits next to a dataset without it.
+#   python dataset.py info                                          # rows / files / partitions
+
+import argparse
+import hashlib
+import os
+import uuid
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except Exception:
+    pa = ds = pq = None
+
+DATASET_DIR = "Output/dataset"
+LEGACY_CSV = "Output/images_with_features_new.csv"  # training data before this dataset
+MIGRATED_STAMP = "00000000T000000000000"            # file stamp of imported rows: sorts first
+PARTITION_COLUMN = "ingest_date"
+ID_COLUMN = "[<ID>]"
+IMAGE_COLUMN = "PRIMARY_IMAGE"
+LABEL_COLUMN = "Label"
+CATEGORY_COLUMNS = ["MFR_NAME", "ENTERPRISE"]
+FEATURE_COLUMNS = ["MFRSimilarity", "Entropy", "Sharpness", "Resolution", "Brightness", "WhiteRatio", "WhiteBorderRatio"]
+COMPRESSION = "zstd"
+CSV_CHUNK_ROWS = 200_000
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("the Parquet dataset needs pyarrow (pip install pyarrow)")
+
+
+def schema():
+    _require_pyarrow()
+    return pa.schema(
+        [pa.field(ID_COLUMN, pa.string()), pa.field(IMAGE_COLUMN, pa.string())]
+        + [pa.field(c, pa.dictionary(pa.int32(), pa.string())) for c in CATEGORY_COLUMNS]
+        + [pa.field(c, pa.float32()) for c in FEATURE_COLUMNS]
+        + [pa.field(LABEL_COLUMN, pa.int8())]
+    )
+
+
+def to_table(df):
+    """Coerce a DataFrame (or list of row dicts) to the dataset schema; unknown columns are dropped."""
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame(list(df))
+    out = {}
+    for field in schema():
+        col = df[field.name] if field.name in df.columns else pd.Series([None] * len(df), index=df.index)
+        if field.name in FEATURE_COLUMNS:
+            out[field.name] = pd.to_numeric(col, errors="coerce").astype(np.float32)
+        elif field.name == LABEL_COLUMN:
+            out[field.name] = pd.to_numeric(col, errors="coerce").astype("Int8")
+        else:
+            out[field.name] = col.astype("string")
+    return pa.Table.from_pandas(pd.DataFrame(out), schema=schema(), preserve_index=False)
+
+
+def append(rows, dataset_dir=DATASET_DIR, ingest_date=None, name=None):
+    """
+    Write `rows` (DataFrame or row dicts) as one new file in today's (or `ingest_date`'s)
+    partition, named `name` (default: part-<now>-<random>.parquet).
+    """
+    table = to_table(rows)
+    if table.num_rows == 0:
+        return None
+    day = (ingest_date or datetime.now(timezone.utc).date()).isoformat()
+    part_dir = os.path.join(dataset_dir, f"{PARTITION_COLUMN}={day}")
+    os.makedirs(part_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(part_dir, name or f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, path)  # readers only ever see complete files
+    return path
+
+
+def write_file(rows, path):
+    """Write `rows` as a single Parquet file with the dataset schema (replacing `path`)."""
+    tmp = path + ".tmp"
+    pq.write_table(to_table(rows), tmp, compression=COMPRESSION)
+    os.replace(tmp, path)
+    return path
+
+
+def files(dataset_dir=DATASET_DIR):
+    """Data files in ingestion order."""
+    out = []
+    for part in sorted(os.listdir(dataset_dir)) if os.path.isdir(dataset_dir) else []:
+        part_dir = os.path.join(dataset_dir, part)
+        if part.startswith(f"{PARTITION_COLUMN}=") and os.path.isdir(part_dir):
+            out.extend(os.path.join(part_dir, f) for f in sorted(os.listdir(part_dir)) if f.endswith(".parquet"))
+    return out
+
+
+def migrated(dataset_dir=DATASET_DIR):
+    """True once a CSV has been imported into `dataset_dir`."""
+    return any(os.path.basename(p).startswith(f"part-{MIGRATED_STAMP}-") for p in files(dataset_dir))
+
+
+def needs_migration(dataset_dir=DATASET_DIR, csv_path=LEGACY_CSV):
+    return os.path.exists(csv_path) and not migrated(dataset_dir)
+
+
+def is_dataset(path):
+    return os.path.isdir(path) or path.endswith(".parquet")
+
+
+def load(dataset_dir=DATASET_DIR, columns=None, since=None):
+    """
+    DataFrame with only `columns` (all by default, plus ingest_date if asked for), in ingestion
+    order. `since` (a date or "YYYY-MM-DD") skips older partitions without opening them.
+    """
+    _require_pyarrow()
+    if dataset_dir.endswith(".parquet"):
+        return pq.read_table(dataset_dir, columns=columns).to_pandas()
+    paths = files(dataset_dir)
+    if since is not None:
+        since = str(since)
+        paths = [p for p in paths if os.path.basename(os.path.dirname(p)).split("=", 1)[1] >= since]
+    if not paths:
+        return pd.DataFrame({c: pd.Series(dtype="float32") for c in (columns or [])})
+    dataset = ds.dataset(paths, schema=schema(), format="parquet",
+                         partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+                         partition_base_dir=dataset_dir)
+    table = dataset.to_table(columns=columns)  # fragments in the order given: ingestion order
+    return table.unify_dictionaries().to_pandas()
+
+
+def fingerprint(dataset_dir=DATASET_DIR):
+    """sha256 over the data files (names and bytes), for the model manifest."""
+    h = hashlib.sha256()
+    for path in files(dataset_dir) if os.path.isdir(dataset_dir) else [dataset_dir]:
+        h.update(os.path.relpath(path, dataset_dir).encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def migrate_csv(csv_path, dataset_dir=DATASET_DIR, ingest_date=None, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    One-time import of a training CSV, ahead of any rows already in the dataset. Rows keep their
+    order; they all land in one partition (`ingest_date`, default the CSV's modification day, or
+    the first existing partition if that is earlier). Returns the number of rows written.
+    """
+    if migrated(dataset_dir):
+        raise SystemExit(f"{dataset_dir} already holds an imported CSV")
+    existing = files(dataset_dir)
+    first_day = date.fromisoformat(os.path.basename(os.path.dirname(existing[0])).split("=", 1)[1]) if existing else None
+    if ingest_date is None:
+        ingest_date = datetime.fromtimestamp(os.path.getmtime(csv_path), timezone.utc).date()
+        if first_day is not None:
+            ingest_date = min(ingest_date, first_day)
+    elif first_day is not None and ingest_date > first_day:
+        raise SystemExit(f"--ingest-date {ingest_date} would put the CSV after rows from {first_day}")
+    rows = 0
+    chunks = pd.read_csv(csv_path, chunksize=chunk_rows, dtype={ID_COLUMN: "string", IMAGE_COLUMN: "string"})
+    for n, chunk in enumerate(chunks):
+        append(chunk, dataset_dir, ingest_date=ingest_date, name=f"part-{MIGRATED_STAMP}-{n:06d}.parquet")
+        rows += len(chunk)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parquet training dataset tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="Import a training CSV ahead of the dataset's rows")
+    m.add_argument("csv", nargs="?", default=LEGACY_CSV)
+    m.add_argument("--dataset", default=DATASET_DIR)
+    m.add_argument("--ingest-date", type=date.fromisoformat, default=None,
+                   help="Partition for the imported rows (default: the CSV's modification date)")
+    i = sub.add_parser("info", help="Rows, files and partitions")
+    i.add_argument("--dataset", default=DATASET_DIR)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "migrate":
+        before = len(load(args.dataset, columns=[LABEL_COLUMN]))
+        rows = migrate_csv(args.csv, args.dataset, args.ingest_date)
+        check = load(args.dataset, columns=[LABEL_COLUMN])
+        if len(check) != before + rows:
+            raise SystemExit(f"row count mismatch after migration: wrote {rows}, read back {len(check) - before}")
+        if before:
+            print(f"{rows} rows imported ahead of {before} existing ones: retrain in full "
+                  f"(no --warm-start) from models trained on the dataset alone")
+        csv_mb = os.path.getsize(args.csv) / 2**20
+        pq_mb = sum(os.path.getsize(p) for p in files(args.dataset)) / 2**20
+        print(f"{rows} rows migrated to {args.dataset} ({csv_mb:.1f} MiB CSV -> {pq_mb:.1f} MiB Parquet)")
+        return
+
+    paths = files(args.dataset)
+    parts = sorted({os.path.basename(os.path.dirname(p)) for p in paths})
+    rows = sum(pq.ParquetFile(p).metadata.num_rows for p in paths)
+    size = sum(os.path.getsize(p) for p in paths) / 2**20
+    print(f"{args.dataset}: {rows} rows in {len(paths)} file(s), {len(parts)} partition(s), {size:.1f} MiB")
+    for part in parts[-10:]:
+        print(f"  {part}")
+
+
+if __name__ == "__main__":
+    main()
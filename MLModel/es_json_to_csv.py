@@ -1,37 +1,30 @@
-import json
+import argparse
 import csv
+import hashlib
+import json
 import os
-from pathlib import Path
 import re
-import requests
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from urllib.parse import urlparse
 
-INPUT_PATH = "../../rejected.json"
+import requests
+
+try:
+    import ijson  # type: ignore # optional; faster incremental parser for large exports
+except Exception:
+    ijson = None
+
+INPUT_PATH = "../../rejected.json"              # ES search response dump, or NDJSON with one hit per line
 OUTPUT_DIR = "Output"                           # Output CSV dir
-os.makedirs(OUTPUT_DIR, exist_ok=True)          # Create output dir if it doesn't already exist                    
 OUTPUT_CSV_PATH = os.path.join(OUTPUT_DIR, "image_metadata.csv") # Output CSV file name
 IMAGES_DIR = OUTPUT_DIR + "/Images"
-os.makedirs(IMAGES_DIR, exist_ok=True)
 LOG_FILE = Path(OUTPUT_DIR) / "image_download_exceptions.log"
 
-
-with open(INPUT_PATH, "r", encoding="utf-8") as f:
-    raw_text = f.read()
-
-# 1. Replace invalid triple quotes with regular quotes
-raw_text = raw_text.replace('"""', '"')
-
-# 2. Escape unescaped double quotes inside string values that are likely problematic
-#    (only within part_number fields or similar)
-raw_text = re.sub(r'"part_number"\s*:\s*.*?,\s*\n', '', raw_text)
-
-# 3. Try parsing JSON safely
-try:
-    data = json.loads(raw_text)
-except json.JSONDecodeError as e:
-    raise ValueError(f"JSON parsing failed even after sanitization: {e}")
-
-hits = data.get("hits", {}).get("hits", [])
+DOWNLOAD_WORKERS = 8                            # Concurrent image downloads
+READ_CHUNK = 1 << 16                            # Characters read from the export at a time
 
 # Define output fields and mapping
 fields = {
@@ -41,54 +34,256 @@ fields = {
     "image_url": "PRIMARY IMAGE",
 }
 
-# Write to CSV 
-with open(OUTPUT_CSV_PATH, "w", newline="", encoding="utf-8") as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(["[<ID>]", "ITEM_NO", "MFR_NAME", "PRIMARY IMAGE"])
-
-    for h in hits:
-        src = h.get("_source", {})
-        sku = src.get("sku_number")
-        item_no = src.get("item_number")
-        manufacturer = src.get("manufacturer")
-        image_url = src.get("image_url")
-        # Use end of image_url as filename
-        parsed_url = urlparse(image_url)
-        filename = os.path.basename(parsed_url.path)
-        success = True
-
-        # Download image from image_url
+FORBIDDEN_RETRY_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0 Safari/537.36"
+    ),
+    "Referer": "https://www.google.com/",
+    "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+}
+
+# Same clean-up the old whole-file version applied, done one line at a time:
+# 1. Replace invalid triple quotes with regular quotes
+# 2. Drop part_number fields, whose values often contain unescaped quotes
+PART_NUMBER_LINE = re.compile(r'"part_number"\s*:\s*.*?,[ \t\r]*\n')
+
+
+class SanitizingReader:
+    """
+    File-like view of the export with the clean-up applied while reading.
+    Reads at most READ_CHUNK characters at a time, so even a single-line dump never
+    has to fit in memory. Returns bytes, as ijson expects.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.carry = ""  # trailing quotes held back in case a triple quote spans two chunks
+
+    def _fill(self):
+        line = self.f.readline(READ_CHUNK)
+        if not line:
+            out, self.carry = self.carry, ""
+            return out
+        line = self.carry + line
+        self.carry = ""
+        if line.endswith("\n"):
+            line = PART_NUMBER_LINE.sub("", line)
+        else:
+            stripped = line.rstrip('"')
+            self.carry = line[len(stripped):]
+            line = stripped
+        return line.replace('"""', '"')
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buf) < size:
+            more = self._fill()
+            if not more:
+                if not self.carry:
+                    break
+                continue
+            self.buf += more
+        if size < 0:
+            out, self.buf = self.buf, ""
+        else:
+            out, self.buf = self.buf[:size], self.buf[size:]
+        return out.encode("utf-8")
+
+
+def _iter_array_items(reader):
+    """
+    Fallback when ijson isn't installed: decode the items of the response's hits.hits
+    array one at a time with raw_decode, keeping only the unparsed tail in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    eof = False
+
+    def more():
+        nonlocal buf, eof
+        chunk = reader.read(READ_CHUNK).decode("utf-8")
+        eof = not chunk
+        buf += chunk
+
+    # Find the outer "hits": { ... "hits": [
+    start = re.compile(r'"hits"\s*:\s*\{.*?"hits"\s*:\s*\[', re.S)
+    while True:
+        m = start.search(buf)
+        if m:
+            buf = buf[m.end():]
+            break
+        if eof:
+            return
+        more()
+
+    while True:
+        buf = buf.lstrip().lstrip(",").lstrip()
+        if buf.startswith("]"):
+            return
         try:
-            # Default request (no headers)
-            response = requests.get(image_url, timeout=10)
-
-            # Retry with headers if forbidden
-            if response.status_code == 403:
-                headers = {
-                    "User-Agent": (
-                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/120.0 Safari/537.36"
-                    ),
-                    "Referer": "https://www.google.com/",
-                    "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-                }
-                response = requests.get(image_url, headers=headers, timeout=10)
+            item, end = decoder.raw_decode(buf)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("JSON parsing failed even after sanitization")
+            more()
+            continue
+        buf = buf[end:]
+        yield item
 
-            response.raise_for_status()
 
-            filepath = Path(IMAGES_DIR) / filename
+def iter_hits_from_file(path, ndjson=False):
+    """Yield hits from an ES search response dump (or NDJSON, one hit per line) without loading it whole."""
+    with open(path, "r", encoding="utf-8") as f:
+        if ndjson:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.replace('"""', '"'))
+            return
+        reader = SanitizingReader(f)
+        if ijson is not None:
+            yield from ijson.items(reader, "hits.hits.item", use_float=True)
+        else:
+            yield from _iter_array_items(reader)
+
+
+def iter_hits_from_es(index, status, page_size):
+    """Page hits straight from Elasticsearch with a point-in-time (no dump file needed)."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MotionAppFiles"))
+    from es_client import get_es, iter_pit_pages
+
+    query = {"term": {"status.keyword": status}} if status else {"match_all": {}}
+    sort = [{"timestamp": {"order": "asc", "unmapped_type": "date"}}, {"_shard_doc": "asc"}]
+    source = ["sku_number", "item_number", "manufacturer", "image_url"]
+    for hits in iter_pit_pages(get_es(), index, query, page_size, sort, source=source):
+        yield from hits
+
+
+def iter_hits_from_mirror(index, status):
+    """Hits from the local mirror of the index (python es_mirror.py sync); the cluster isn't queried."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MotionAppFiles"))
+    import es_mirror
+
+    if not es_mirror.available(index):
+        raise SystemExit(f"no local mirror of {index} in {es_mirror.MIRROR_DIR}; run: python es_mirror.py sync --index {index}")
+    df = es_mirror.load(index, columns=["sku_number", "item_number", "manufacturer", "image_url", "status"])
+    if status:
+        df = df[df["status"] == status]
+    for hits in es_mirror.iter_hits(index, df=df.drop(columns=["status"])):
+        yield from hits
 
+
+def download_image(image_url, filepath):
+    """Stream one image to disk. Returns None on success, else the exception."""
+    try:
+        # Default request (no headers)
+        response = requests.get(image_url, timeout=10, stream=True)
+
+        # Retry with headers if forbidden
+        if response.status_code == 403:
+            response.close()
+            response = requests.get(image_url, headers=FORBIDDEN_RETRY_HEADERS, timeout=10, stream=True)
+
+        with response:
+            response.raise_for_status()
             with open(filepath, "wb") as img_file:
-                img_file.write(response.content)
-
-            # print(filepath)
-        except Exception as e:
-            with open(LOG_FILE, "a", encoding="utf-8") as log:
-                log.write(f"Failed to download image for SKU={sku}, URL={image_url}\n")
-                log.write(f"Error: {e}\n\n")
-            success = False
-        
-        writer.writerow([sku, item_no, manufacturer, filename, success])
-
-print(f"CSV created successfully: {OUTPUT_CSV_PATH}")
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    img_file.write(chunk)
+        return None
+    except Exception as e:
+        if os.path.exists(filepath):
+            os.remove(filepath)  # don't leave truncated images behind
+        return e
+
+
+def image_filename(image_url):
+    """
+    End of image_url plus a short hash of the whole URL: different CDNs all serve "image.jpg"
+    or "1.jpg", and two downloads must never share a file. "" when the URL has no basename.
+    """
+    basename = os.path.basename(urlparse(image_url or "").path)
+    if not basename:
+        return ""
+    stem, ext = os.path.splitext(basename)
+    return f"{stem}-{hashlib.sha1(image_url.encode('utf-8')).hexdigest()[:8]}{ext}"
+
+
+def convert(hits, output_csv=OUTPUT_CSV_PATH, images_dir=IMAGES_DIR, log_file=LOG_FILE, workers=DOWNLOAD_WORKERS):
+    os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    rows = failed = 0
+
+    # At most 2*workers downloads in flight; rows are written in input order as they complete
+    pending = deque()
+    started = {}  # filename -> future, so a URL seen twice is downloaded (and written) once
+
+    def flush_one(writer, log):
+        nonlocal rows, failed
+        (sku, item_no, manufacturer, filename, image_url), fut = pending.popleft()
+        error = fut.result() if fut is not None else ValueError("missing image_url")
+        if error is not None:
+            log.write(f"Failed to download image for SKU={sku}, URL={image_url}\n")
+            log.write(f"Error: {error}\n\n")
+            failed += 1
+        writer.writerow([sku, item_no, manufacturer, filename, error is None])
+        rows += 1
+
+    with open(output_csv, "w", newline="", encoding="utf-8") as csvfile, \
+            open(log_file, "a", encoding="utf-8") as log, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        writer = csv.writer(csvfile)
+        writer.writerow(["[<ID>]", "ITEM_NO", "MFR_NAME", "PRIMARY IMAGE"])
+
+        for h in hits:
+            src = h.get("_source", h)  # NDJSON exports may hold bare documents
+            sku = src.get("sku_number")
+            item_no = src.get("item_number")
+            manufacturer = src.get("manufacturer")
+            image_url = src.get("image_url")
+            filename = image_filename(image_url)
+
+            fut = None
+            if image_url and filename:
+                fut = started.get(filename)
+                if fut is None:
+                    fut = started[filename] = pool.submit(download_image, image_url, Path(images_dir) / filename)
+            pending.append(((sku, item_no, manufacturer, filename, image_url), fut))
+            if len(pending) >= 2 * workers:
+                flush_one(writer, log)
+
+        while pending:
+            flush_one(writer, log)
+
+    return rows, failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert an image_metadata export to CSV and download its images.")
+    ap.add_argument("--input", default=INPUT_PATH, help="ES response dump or NDJSON (default: %(default)s)")
+    ap.add_argument("--ndjson", action="store_true", help="Input has one hit per line")
+    ap.add_argument("--from-es", action="store_true", help="Read hits from Elasticsearch instead of a file")
+    ap.add_argument("--from-mirror", action="store_true", help="Read hits from the local mirror (es_mirror.py)")
+    ap.add_argument("--index", default="image_metadata")
+    ap.add_argument("--status", default="rejected", help="With --from-es / --from-mirror: status to export ('' for all)")
+    ap.add_argument("--page-size", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    ap.add_argument("--output", default=OUTPUT_CSV_PATH)
+    args = ap.parse_args()
+
+    if args.from_mirror:
+        hits = iter_hits_from_mirror(args.index, args.status)
+    elif args.from_es:
+        hits = iter_hits_from_es(args.index, args.status, args.page_size)
+    else:
+        ndjson = args.ndjson or args.input.endswith((".ndjson", ".jsonl"))
+        hits = iter_hits_from_file(args.input, ndjson=ndjson)
+
+    rows, failed = convert(hits, output_csv=args.output, workers=args.workers)
+    print(f"CSV created successfully: {args.output} ({rows} rows, {failed} failed downloads, see {LOG_FILE})")
+
+
+if __name__ == "__main__":
+    main()
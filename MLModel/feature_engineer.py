@@ -1,4 +1,5 @@
 import os
+import sys
 import logging
 import cv2
 import numpy as np
@@ -7,6 +8,11 @@ from skimage import measure
 from rapidfuzz import fuzz
 from tqdm import tqdm
 
+# Shared pipeline modules (feature store, model registry) live next to the scraper
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MotionAppFiles"))
+from feature_store import FeatureStore
+import dataset
+
 # === CONFIGURATION ===
 CSV_PATH = "Output/images_with_features3.csv"          # CSV of image filenames + corresponding manufacturers and item no's
 IMAGE_DIR = "Output/Images"                    # Directory containing image files
@@ -14,8 +20,13 @@ IMAGE_COLUMN = "PRIMARY_IMAGE"                  # Name of column containing imag
 MFR_COLUMN = "MFR_NAME"                         # manufacturer names
 OUTPUT_DIR = "Output"                           # Output CSV and log saved here
 os.makedirs(OUTPUT_DIR, exist_ok=True)          # Create output dir if it doesn't already exist                    
-OUTPUT_CSV_PATH = os.path.join(OUTPUT_DIR, "images_with_features_new.csv") # Output CSV file name
+OUTPUT_PATH = os.path.join(OUTPUT_DIR, "images_with_features_new.parquet") # Typed output (dataset.py schema); model.py --data accepts it
 LOG_PATH = os.path.join(OUTPUT_DIR, "exceptions.log") # Any exceptions are logged in this file
+USE_FEATURE_STORE = True                        # Reuse features already computed for identical image bytes
+
+# Bump whenever analyze_image output changes so stale cached features are not reused.
+# Must match MotionAppFiles/feature_engineer.py while both copies compute the same values.
+FEATURE_VERSION = "1"
 
 # === LOGGING SETUP ===
 logging.basicConfig(
@@ -31,6 +42,7 @@ WHITE_V_MIN = 225     # white should be very bright
 WHITE_RGB_MIN = 200   # optional extra guard: each RGB channel fairly high
 ALPHA_VISIBLE_MIN = 250  # for PNGs: treat alpha >= 250 as visible pixel
 BORDER_FRAC = 0.05    # examine a 5% border band for WhiteBorderRatio
+ALLOWED_EXTS = {".png", ".jpg", ".jpeg", ".webp"}  # analyze_image skips any other file type
 
 def compute_filename_features(filename, manufacturer):
     """Compute string similarity features from filename."""
@@ -107,9 +119,8 @@ def analyze_image(image_path):
         return None, None, None, None, None, None
     
     # Only process these file types
-    allowed_exts = {".png", ".jpg", ".jpeg", ".webp"}
     ext = os.path.splitext(image_path)[-1].lower()
-    if ext not in allowed_exts:
+    if ext not in ALLOWED_EXTS:
         return None, None, None, None, None, None
 
     try:
@@ -156,6 +167,13 @@ def analyze_image(image_path):
         return None, None, None, None, None, None
     
     return resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio
+
+def analyze_image_cached(image_path, store=None):
+    """analyze_image, served from the feature store when these exact bytes were analyzed before."""
+    # Same file-type gate as analyze_image: the store is keyed by bytes, not by name
+    if store is None or not os.path.exists(image_path) or os.path.splitext(image_path)[-1].lower() not in ALLOWED_EXTS:
+        return analyze_image(image_path)
+    return store.get_or_compute(image_path, analyze_image)
     
 def main():
     df = pd.read_csv(CSV_PATH)
@@ -169,6 +187,8 @@ def main():
     df["WhiteRatio"] = None
     df["WhiteBorderRatio"] = None
 
+    store = FeatureStore(FEATURE_VERSION) if USE_FEATURE_STORE else None
+
     print(f"Processing {len(df)} images...")
 
     for idx, row in tqdm(df.iterrows(), total=len(df)):
@@ -177,7 +197,7 @@ def main():
         image_path = os.path.join(IMAGE_DIR, str(filename))
 
         mfr_similarity = compute_filename_features(filename, mfr)
-        resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image(image_path)
+        resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image_cached(image_path, store)
         # print(resolution, entropy, sharpness, brightness)
 
         df.at[idx, "MFRSimilarity"] = mfr_similarity
@@ -188,10 +208,12 @@ def main():
         df.at[idx, "WhiteRatio"] = white_ratio
         df.at[idx, "WhiteBorderRatio"] = white_border_ratio
 
-    # Save results
+    # Save results: float32 features, categorical manufacturer, as in the training dataset
     print(df.head())
-    df.to_csv(OUTPUT_CSV_PATH, index=False)
-    print(f"\nFinished processing, results saved to '{OUTPUT_CSV_PATH}'")
+    dataset.write_file(df, OUTPUT_PATH)
+    print(f"\nFinished processing, results saved to '{OUTPUT_PATH}'")
+    if store is not None:
+        print(f"Feature store: {store.hits} cached, {store.misses} computed")
 
 
 if __name__ == "__main__":
@@ -1,64 +1,215 @@
+import argparse
+import hashlib
+import os
+import sys
 import xgboost as xgb
+import numpy as np
 import pandas as pd
-import joblib
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import roc_auc_score, classification_report, confusion_matrix
 
-# Load data
-df = pd.read_csv("Output/images_with_features_new.csv")
-# df = df.tail(568).reset_index(drop=True)
-# print(len(df))
+# Shared pipeline modules (feature store, model registry) live next to the scraper
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MotionAppFiles"))
+from feature_store import sha256_file
+from model_registry import MODELS_DIR, save_model, latest_version, read_manifest, load_booster
+import dataset
 
-# Features and labels
-X = df.drop(columns=["[<ID>]", "ITEM_NO", "ENTERPRISE_NAME", "MFR_NAME", "PRIMARY_IMAGE", "Label", "Resolution"])
-y = df["Label"]
+# === CONFIGURATION ===
+DATASET_CSV = dataset.LEGACY_CSV                      # legacy; `python dataset.py migrate` converts it
+DATASET_DIR = dataset.DATASET_DIR                     # Parquet dataset, used when it has data
+# Models are published to the scraper's registry (MotionAppFiles/models) as UBJSON + manifest.json
 
-# Split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2
-)
+# Feature order must match the vector built in image_scraper.download_images
+FEATURE_COLUMNS = ["MFRSimilarity", "Entropy", "Sharpness", "Brightness", "WhiteRatio", "WhiteBorderRatio"]
+LABEL_COLUMN = "Label"
+SPLIT_KEY_COLUMN = "PRIMARY_IMAGE"   # rows with the same image always land in the same split
 
+SEED = 42
+TEST_SIZE = 0.2
+VALID_SIZE = 0.1                     # carved out of the remaining rows, used for early stopping
+DECISION_THRESHOLD = 0.2
 
-ratio = (len(y_train) - sum(y_train)) / sum(y_train)
-model = xgb.XGBClassifier(
-    objective="binary:logistic",
-    eval_metric="logloss",
-    use_label_encoder=False,
-    # scale_pos_weight=ratio,  # tells XGBoost to pay more attention to the minority (bad) class
-)
-model.fit(X_train, y_train)
 
-# Save trained model in same directory as scraper
-joblib.dump(model, "../MotionAppFiles/image_classifier_confidence.pkl")
+def default_data():
+    if not dataset.files(DATASET_DIR):
+        return DATASET_CSV
+    if dataset.needs_migration(DATASET_DIR, DATASET_CSV):
+        # training on the dataset alone would silently drop the CSV's history
+        raise SystemExit(f"{DATASET_DIR} has rows but {DATASET_CSV} was never imported; "
+                         f"run: python dataset.py migrate (or pass --data)")
+    return DATASET_DIR
 
-# Evaluate
-y_pred_proba = model.predict_proba(X_test)[:, 1]
-y_pred = (y_pred_proba > 0.2).astype(int)
 
-print("AUC:", roc_auc_score(y_test, y_pred_proba))
-print(confusion_matrix(y_test, y_pred))
-print(classification_report(y_test, y_pred, target_names=["Rejected", "Approved"]))
+def load_dataset(path=None):
+    path = path or default_data()
+    # Only the columns training uses: features, label, split key
+    columns = FEATURE_COLUMNS + [LABEL_COLUMN, SPLIT_KEY_COLUMN]
+    if dataset.is_dataset(path):
+        df = dataset.load(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=lambda c: c in columns, dtype={c: "float32" for c in FEATURE_COLUMNS})
+    # Rows without features (download failed, unreadable image) can't be used for training
+    return df.dropna(subset=FEATURE_COLUMNS + [LABEL_COLUMN]).reset_index(drop=True)
 
-importances = model.feature_importances_
-feature_importance_df = pd.DataFrame({
-    'Feature': X.columns,
-    'Importance': importances
-}).sort_values(by='Importance', ascending=False)
 
-# Print top features
-print(feature_importance_df.head(20))
+def data_sha256(path):
+    return dataset.fingerprint(path) if dataset.is_dataset(path) else sha256_file(path)
 
-results = pd.DataFrame({
-    "Actual": y_test.values,
-    "Predicted": y_pred,
-    "Confidence (%)": (y_pred_proba * 100).round(2)
-})
 
-# Optionally add row indices or image identifiers if you have them
-# results["Image_ID"] = X_test.index  # or df.loc[X_test.index, "PRIMARY_IMAGE"]
+def split_buckets(df, seed=SEED, test_size=TEST_SIZE, valid_size=VALID_SIZE):
+    """
+    Deterministic train/valid/test assignment from a hash of the split key.
+    Unlike a random split, a row keeps its bucket as the dataset grows, so a
+    warm-started model never trains on rows that an earlier run held out.
+    """
+    if SPLIT_KEY_COLUMN in df.columns:
+        keys = df[SPLIT_KEY_COLUMN].astype(str)
+    else:
+        keys = df.index.astype(str)
+    u = np.array([
+        int(hashlib.sha256(f"{seed}:{k}".encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        for k in keys
+    ])
+    return np.where(u < test_size, "test", np.where(u < test_size + valid_size, "valid", "train"))
 
-# Sort by confidence to see most/least certain predictions
-results_sorted = results.sort_values(by="Confidence (%)", ascending=False)
 
-# Show 10 examples
-print(results_sorted.head(10))
+def build_model(n_estimators, learning_rate, max_depth, early_stopping_rounds, n_jobs, tree_method, seed):
+    return xgb.XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        n_estimators=n_estimators,
+        learning_rate=learning_rate,
+        max_depth=max_depth,
+        early_stopping_rounds=early_stopping_rounds,
+        n_jobs=n_jobs,
+        tree_method=tree_method,
+        random_state=seed,
+        # scale_pos_weight=ratio,  # tells XGBoost to pay more attention to the minority (bad) class
+    )
+
+
+def trimmed_booster(model):
+    """Booster cut to its best iteration, so the saved artifact scores exactly like predict_proba."""
+    booster = model.get_booster()
+    best = getattr(model, "best_iteration", None)
+    if best is not None and best + 1 < booster.num_boosted_rounds():
+        booster = booster[: best + 1]
+    return booster
+
+
+def evaluate(model, X_test, y_test, threshold=DECISION_THRESHOLD):
+    y_pred_proba = model.predict_proba(X_test)[:, 1]
+    y_pred = (y_pred_proba > threshold).astype(int)
+
+    auc = roc_auc_score(y_test, y_pred_proba) if len(set(y_test)) > 1 else float("nan")
+    print("AUC:", auc)
+    print(confusion_matrix(y_test, y_pred))
+    print(classification_report(y_test, y_pred, target_names=["Rejected", "Approved"]))
+
+    importances = model.feature_importances_
+    feature_importance_df = pd.DataFrame({
+        'Feature': FEATURE_COLUMNS,
+        'Importance': importances
+    }).sort_values(by='Importance', ascending=False)
+
+    # Print top features
+    print(feature_importance_df.head(20))
+
+    results = pd.DataFrame({
+        "Actual": y_test.values,
+        "Predicted": y_pred,
+        "Confidence (%)": (y_pred_proba * 100).round(2)
+    })
+
+    # Sort by confidence to see most/least certain predictions
+    results_sorted = results.sort_values(by="Confidence (%)", ascending=False)
+
+    # Show 10 examples
+    print(results_sorted.head(10))
+    return {"auc": float(auc), "test_rows": int(len(y_test))}
+
+
+def train(args):
+    args.data = args.data or default_data()
+    df = load_dataset(args.data)
+    buckets = split_buckets(df, seed=args.seed)
+
+    start_row = 0
+    xgb_model = None
+    parent = None
+    if args.warm_start:
+        parent = latest_version()
+        if parent is None:
+            raise SystemExit(f"--warm-start needs a published model under {MODELS_DIR}")
+        manifest = read_manifest(parent)
+        if manifest.get("seed", args.seed) != args.seed:
+            raise SystemExit(f"--warm-start must reuse the previous seed ({manifest['seed']}) to keep splits stable")
+        # Only rows appended since the last run are new feedback; earlier rows are already in the booster
+        start_row = manifest.get("rows_seen", 0) if args.new_rows_from is None else args.new_rows_from
+        xgb_model = load_booster(parent)
+
+    is_new = np.arange(len(df)) >= start_row
+    train_mask = (buckets == "train") & is_new
+    if not train_mask.any():
+        print(f"No new training rows after row {start_row}; nothing to do.")
+        return
+
+    X, y = df[FEATURE_COLUMNS], df[LABEL_COLUMN].astype(int)
+    X_train, y_train = X[train_mask], y[train_mask]
+    # Validation/test always use every held-out row, old and new, so warm-started
+    # models are compared on the same footing as full retrains
+    X_valid, y_valid = X[buckets == "valid"], y[buckets == "valid"]
+    X_test, y_test = X[buckets == "test"], y[buckets == "test"]
+
+    model = build_model(
+        n_estimators=args.rounds,
+        learning_rate=args.learning_rate,
+        max_depth=args.max_depth,
+        early_stopping_rounds=args.early_stopping_rounds if len(X_valid) else None,
+        n_jobs=args.n_jobs,
+        tree_method=args.tree_method,
+        seed=args.seed,
+    )
+    fit_kwargs = {"verbose": False, "xgb_model": xgb_model}
+    if len(X_valid):
+        fit_kwargs["eval_set"] = [(X_valid, y_valid)]
+    model.fit(X_train, y_train, **fit_kwargs)
+
+    mode = "warm-start" if args.warm_start else "full"
+    print(f"Trained ({mode}) on {len(X_train)} rows; boosted rounds={model.get_booster().num_boosted_rounds()}"
+          f", best_iteration={getattr(model, 'best_iteration', None)}")
+
+    metrics = evaluate(model, X_test, y_test)
+
+    version = save_model(
+        trimmed_booster(model),
+        features=FEATURE_COLUMNS,
+        training_data_sha256=data_sha256(args.data),
+        metrics=metrics,
+        params={k: v for k, v in vars(args).items() if k not in ("data",)},
+        extra={"rows_seen": int(len(df)), "seed": args.seed, "mode": mode, "parent": parent},
+        promote=not args.no_promote,
+    )
+    print(f"Saved model {version} to {MODELS_DIR}" + ("" if args.no_promote else " (now LATEST)"))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Train the image confidence classifier.")
+    p.add_argument("--data", default=None,
+                   help=f"Parquet dataset dir or training CSV (default: {DATASET_DIR} if it has data, else {DATASET_CSV})")
+    p.add_argument("--warm-start", action="store_true",
+                   help="Continue boosting the saved model on rows added since the last run")
+    p.add_argument("--new-rows-from", type=int, default=None,
+                   help="With --warm-start: first row index treated as new (default: rows seen by the last run)")
+    p.add_argument("--rounds", type=int, default=100, help="Boosting rounds to add (default: %(default)s)")
+    p.add_argument("--early-stopping-rounds", type=int, default=20)
+    p.add_argument("--learning-rate", type=float, default=0.3)
+    p.add_argument("--max-depth", type=int, default=6)
+    p.add_argument("--n-jobs", type=int, default=-1, help="Training threads (-1 = all cores)")
+    p.add_argument("--tree-method", default="hist", choices=["hist", "approx", "exact"])
+    p.add_argument("--seed", type=int, default=SEED)
+    p.add_argument("--no-promote", action="store_true", help="Save the version without pointing LATEST at it")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    train(parse_args())
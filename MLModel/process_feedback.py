@@ -1,35 +1,82 @@
-import pandas as pd
-from feature_engineer import analyze_image, compute_filename_features
+from feature_engineer import analyze_image_cached, compute_filename_features, FEATURE_VERSION
+from feature_store import FeatureStore
 from elasticsearch import Elasticsearch
 import requests
+import json
 import os
+import dataset
+import es_mirror
+
+# Both the feedback mirror and the training dataset are Parquet
+if dataset.pa is None:
+    raise SystemExit("process_feedback.py needs pyarrow (pip install pyarrow)")
 
 es = Elasticsearch("http://localhost:9200")
 
 index_name = "feedback"
-scroll_timeout = "5m"
 batch_size = 200
 
 IMAGES_DIR = "Output/Images"
 os.makedirs(IMAGES_DIR, exist_ok=True)
-DATASET_CSV = "Output/images_with_features_new.csv"
-
-# === Start scroll search ===
-page = es.search(
-    index=index_name,
-    scroll=scroll_timeout,
-    size=batch_size,
-    body={"query": {"match_all": {}}}
-)
+# Rows go to the Parquet training dataset (dataset.py), one new file per FLUSH_ROWS rows
+DATASET_DIR = dataset.DATASET_DIR
+FLUSH_ROWS = 5000
+pending_rows = []
+# Per-shard _seq_no of the last mirrored feedback doc already in the dataset
+# ("_" prefix: Parquet readers scanning the directory skip it)
+PROCESSED_PATH = os.path.join(DATASET_DIR, "_feedback_processed.json")
+
+# The first append would otherwise start a dataset without the legacy CSV's rows
+if dataset.needs_migration(DATASET_DIR):
+    print(f"Importing {dataset.LEGACY_CSV} into {DATASET_DIR} first")
+    dataset.migrate_csv(dataset.LEGACY_CSV, DATASET_DIR)
+
+# Features for images seen before (same bytes) come from the store instead of being recomputed
+store = FeatureStore(FEATURE_VERSION)
+
+
+def read_processed():
+    if not os.path.exists(PROCESSED_PATH):
+        return None
+    with open(PROCESSED_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_processed(index_uuid, shards):
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    with open(PROCESSED_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"index_uuid": index_uuid, "shards": shards}, f, indent=2)
+    os.replace(PROCESSED_PATH + ".tmp", PROCESSED_PATH)
+
+
+# === Read feedback ===
+# Only the docs added since the last run are pulled from ES into the local mirror
+# (es_mirror.py), and only the mirrored docs past PROCESSED_PATH's watermarks become dataset rows.
+# Runs before PROCESSED_PATH existed handled everything mirrored at the time
+processed = read_processed() or es_mirror.read_state(index_name)
+es_mirror.sync(es, index_name)
+mirror_state = es_mirror.read_state(index_name)
+done = dict(processed.get("shards", {})) if processed.get("index_uuid") == mirror_state["index_uuid"] else {}
+mirrored = es_mirror.load(index_name, extra=True)
+new_docs = mirrored[mirrored["_seq_no"] > mirrored["_shard"].map(lambda shard: done.get(str(shard), -1))]
+print(f"{len(new_docs)} of {len(mirrored)} feedback docs not yet in the dataset")
+pages = es_mirror.iter_hits(index_name, batch_size=batch_size, df=new_docs)
+
+
+def flush(pages_done):
+    """Append the pending rows, then move the watermarks past the pages they came from."""
+    if pending_rows:
+        dataset.append(pending_rows, DATASET_DIR)
+        pending_rows.clear()
+    last = new_docs.iloc[:pages_done * batch_size].groupby("_shard")["_seq_no"].max()
+    done.update({str(shard): int(seq_no) for shard, seq_no in last.items()})
+    write_processed(mirror_state["index_uuid"], done)
 
-scroll_id = page["_scroll_id"]
 total_downloaded = 0
 
-while True:
-    hits = page["hits"]["hits"]
-    if not hits:
-        break
-
+pages_done = 0
+for hits in pages:
+    pages_done += 1
     for doc in hits:
         source = doc["_source"]
         image_url = source.get("PRIMARY_IMAGE")
@@ -47,20 +94,21 @@ while True:
 
             if os.path.exists(filepath):
                 print(f"Skipped (already exists): {filepath}")
-                resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image(filepath)
+                resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image_cached(filepath, store)
             else:
                 response = requests.get(image_url, timeout=10)
                 if response.status_code == 200:
                     with open(filepath, "wb") as f:
                         f.write(response.content)
                 
-                    resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image(filepath)
+                    resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image_cached(filepath, store)
                 else:
                     print(f"Skipped {filename} (HTTP {response.status_code})")
 
             data = {
                 "[<ID>]": source.get("[<ID>]"),
                 "MFR_NAME": source.get("MFR_NAME"),
+                "ENTERPRISE": source.get("ENTERPRISE"),
                 "PRIMARY_IMAGE": source.get("PRIMARY_IMAGE"),
                 "MFRSimilarity": mfr_similarity,
                 "Entropy": entropy,
@@ -71,17 +119,13 @@ while True:
                 "WhiteRatio": white_ratio,
                 "WhiteBorderRatio": white_border_ratio
             }
-            df_new = pd.DataFrame(data, index=[0])
-
-            # Append mode, don't overwrite
-            df_new.to_csv(DATASET_CSV, mode='a', index=False, header=not os.path.exists(DATASET_CSV))
+            pending_rows.append(data)
 
         except Exception as e:
             print(f"Failed to download {image_url}: {e}")
 
-    # Next batch
-    page = es.scroll(scroll_id=scroll_id, scroll=scroll_timeout)
-    scroll_id = page["_scroll_id"]
+    if len(pending_rows) >= FLUSH_ROWS:
+        flush(pages_done)
 
-# Clear scroll context
-es.clear_scroll(scroll_id=scroll_id)
\ No newline at end of file
+flush(pages_done)
+print(f"Feature store: {store.hits} cached, {store.misses} computed")
\ No newline at end of file
@@ -0,0 +1,286 @@
+# tune.py
+# Cross-validated hyperparameter search for the confidence classifier.
+#
+#   python tune.py --trials 40 --workers 4
+#   python tune.py --trials 80 --workers 4      # resumes: the first 40 come from the cache
+#
+# - The data is loaded once (only the columns model.py trains on) and each worker process builds
+#   its fold DMatrix objects once; every trial it runs reuses them.
+# - Trials are sampled from SEARCH_SPACE in a fixed order (--seed), so asking for more trials
+#   extends the same search. Each finished trial is appended to the cache (JSON lines), keyed by
+#   its parameters, folds and a fingerprint of the data; an interrupted search picks up where
+#   it stopped, and a changed dataset starts a fresh one.
+# - Per trial: out-of-fold AUC and logloss (early stopping per fold), the decision threshold that
+#   maximises --threshold-metric on the out-of-fold predictions, and the scoring latency of a
+#   fold model for one candidate and for one SKU's 20 candidates (model_registry.LoadedModel,
+#   so MODEL_INFERENCE_BACKEND applies, as on the scraper).
+# - Selection: the best mean AUC, except that any trial within --auc-tolerance of it wins if it
+#   is shallower (then fewer trees, then faster); depth drives scoring cost on the hot path.
+# - The chosen parameters are retrained on train+valid rows, evaluated on the test bucket, and
+#   published through the model registry with the tuned decision threshold in the manifest.
+#   A latency-vs-AUC report is written next to the cache.
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import f1_score, log_loss, roc_auc_score, balanced_accuracy_score
+
+import dataset
+from model import (FEATURE_COLUMNS, LABEL_COLUMN, SEED, SPLIT_KEY_COLUMN, data_sha256, default_data, load_dataset,
+                   split_buckets)
+from model_registry import LoadedModel, MODELS_DIR, save_model
+
+CACHE_FILE = "Output/tune_trials.jsonl"
+REPORT_FILE = "Output/tune_report.txt"
+
+SEARCH_SPACE = {
+    "max_depth": [2, 3, 4, 6, 8],
+    "eta": [0.03, 0.1, 0.3],
+    "min_child_weight": [1, 5, 20],
+    "subsample": [0.8, 1.0],
+    "colsample_bytree": [0.7, 1.0],
+    "lambda": [1.0, 5.0],
+}
+FIXED_PARAMS = {"objective": "binary:logistic", "eval_metric": "logloss", "tree_method": "hist", "max_bin": 256}
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 30
+THRESHOLDS = np.round(np.arange(0.05, 0.951, 0.01), 2)
+THRESHOLD_METRICS = {
+    "f1": lambda y, p: f1_score(y, p, zero_division=0),
+    "balanced_accuracy": balanced_accuracy_score,
+}
+LATENCY_BATCHES = (1, 20)
+
+
+def sample_trials(n, seed=SEED):
+    """The first `n` distinct parameter sets of a fixed shuffle of the grid."""
+    keys = sorted(SEARCH_SPACE)
+    grid = [dict(zip(keys, combo)) for combo in itertools.product(*(SEARCH_SPACE[k] for k in keys))]
+    random.Random(seed).shuffle(grid)
+    return grid[:n]
+
+
+def fold_ids(keys, n_folds, seed=SEED):
+    """Fold number per row from a hash of the split key, so a row's fold never changes as data grows."""
+    return np.array([int(hashlib.sha256(f"cv{seed}:{k}".encode("utf-8")).hexdigest()[:8], 16) % n_folds for k in keys])
+
+
+def trial_key(params, context):
+    return hashlib.sha256(json.dumps({"params": params, **context}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# === Worker side: data set up once per process, then one trial per call ===
+_W = {}
+
+
+def _init_worker(X, y, folds, nthread):
+    _W["nthread"] = nthread
+    _W["y"] = y
+    _W["folds"] = []
+    full = xgb.DMatrix(X, label=y, feature_names=FEATURE_COLUMNS, nthread=nthread)
+    for f in range(int(folds.max()) + 1):
+        tr, va = np.flatnonzero(folds != f), np.flatnonzero(folds == f)
+        _W["folds"].append((tr, va, full.slice(tr), full.slice(va)))
+    _W["sample"] = X[: max(LATENCY_BATCHES)]
+
+
+def _latency(booster, backend_rows):
+    model = LoadedModel("trial", {"features": FEATURE_COLUMNS}, booster=booster)
+    out = {}
+    for n in LATENCY_BATCHES:
+        rows = backend_rows[:n]
+        model.predict(rows)
+        times = []
+        for _ in range(200):
+            t0 = time.perf_counter()
+            model.predict(rows)
+            times.append(time.perf_counter() - t0)
+        out[f"latency_us_{n}"] = statistics.median(times) * 1e6
+    return out
+
+
+def run_trial(params, threshold_metric):
+    y = _W["y"]
+    oof = np.zeros(len(y), dtype=np.float64)
+    rounds, booster = [], None
+    t0 = time.perf_counter()
+    for tr, va, dtr, dva in _W["folds"]:
+        booster = xgb.train({**FIXED_PARAMS, **params, "nthread": _W["nthread"]}, dtr, num_boost_round=MAX_ROUNDS,
+                            evals=[(dva, "valid")], early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+        best = booster.best_iteration + 1
+        rounds.append(best)
+        oof[va] = booster.predict(dva, iteration_range=(0, best))
+    train_s = time.perf_counter() - t0
+
+    scores = [THRESHOLD_METRICS[threshold_metric](y, (oof > t).astype(int)) for t in THRESHOLDS]
+    best_t = int(np.argmax(scores))
+    result = {
+        "params": params,
+        "auc": float(roc_auc_score(y, oof)) if len(set(y)) > 1 else float("nan"),
+        "logloss": float(log_loss(y, np.clip(oof, 1e-7, 1 - 1e-7), labels=[0, 1])),
+        "rounds": int(round(statistics.mean(rounds))),
+        "threshold": float(THRESHOLDS[best_t]),
+        "threshold_score": float(scores[best_t]),
+        "train_s": train_s,
+    }
+    result.update(_latency(booster[: rounds[-1]], _W["sample"]))
+    return result
+
+
+# === Driver ===
+def load_cache(path, context):
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # half-written last line from an interrupted run
+                if rec.get("context") == context:
+                    done[rec["key"]] = rec
+    return done
+
+
+def select(results, tolerance):
+    """Best AUC, unless a shallower (then smaller, then faster) trial is within `tolerance` of it."""
+    best_auc = max(r["auc"] for r in results)
+    close = [r for r in results if r["auc"] >= best_auc - tolerance]
+    return min(close, key=lambda r: (r["params"]["max_depth"], r["rounds"], r["latency_us_20"], -r["auc"]))
+
+
+def pareto(results):
+    """Trials no other trial beats on both AUC and 20-row latency."""
+    front, best_auc = [], -1.0
+    for r in sorted(results, key=lambda r: (r["latency_us_20"], -r["auc"])):
+        if r["auc"] > best_auc:
+            front.append(r)
+            best_auc = r["auc"]
+    return front
+
+
+def format_report(results, chosen, test_metrics, tolerance):
+    lines = [f"{len(results)} trial(s); chosen within {tolerance} AUC of the best, shallowest first", ""]
+    header = f"{'depth':>5}{'eta':>6}{'mcw':>5}{'sub':>5}{'col':>5}{'lam':>5}{'rounds':>7}{'cv auc':>9}{'thr':>6}{'1 row us':>10}{'20 rows us':>11}"
+    lines.append(header)
+    front = {id(r) for r in pareto(results)}
+    for r in sorted(results, key=lambda r: -r["auc"]):
+        p = r["params"]
+        mark = (" <- chosen" if r is chosen else "") + (" (pareto)" if id(r) in front else "")
+        lines.append(f"{p['max_depth']:>5}{p['eta']:>6}{p['min_child_weight']:>5}{p['subsample']:>5}{p['colsample_bytree']:>5}"
+                     f"{p['lambda']:>5}{r['rounds']:>7}{r['auc']:>9.4f}{r['threshold']:>6.2f}"
+                     f"{r['latency_us_1']:>10.1f}{r['latency_us_20']:>11.1f}{mark}")
+    lines += ["", "Latency vs AUC (pareto front, fastest first):"]
+    for r in pareto(results):
+        lines.append(f"  depth {r['params']['max_depth']}, {r['rounds']} trees: AUC {r['auc']:.4f}, "
+                     f"{r['latency_us_20']:.0f} us per SKU (20 rows)")
+    if test_metrics:
+        lines += ["", f"Chosen model on the test bucket: {json.dumps(test_metrics)}"]
+    return lines
+
+
+def tune(args):
+    args.data = args.data or default_data()
+    df = load_dataset(args.data)
+    buckets = split_buckets(df, seed=args.seed)
+    cv_mask = buckets != "test"
+    X = df[FEATURE_COLUMNS].to_numpy(np.float32)
+    y = df[LABEL_COLUMN].astype(int).to_numpy()
+    keys = df[SPLIT_KEY_COLUMN].astype(str) if SPLIT_KEY_COLUMN in df.columns else df.index.astype(str)
+    folds = fold_ids(keys[cv_mask], args.folds, args.seed)
+    context = {"data": data_sha256(args.data), "folds": args.folds, "seed": args.seed,
+               "threshold_metric": args.threshold_metric, "fixed": FIXED_PARAMS, "max_rounds": MAX_ROUNDS}
+
+    trials = sample_trials(args.trials, args.seed)
+    cache = load_cache(args.cache, context)
+    todo = [p for p in trials if trial_key(p, context) not in cache]
+    print(f"{int(cv_mask.sum())} CV rows ({args.folds} folds), {int((~cv_mask).sum())} test rows; "
+          f"{len(trials)} trial(s), {len(trials) - len(todo)} cached, {len(todo)} to run on {args.workers} worker(s)")
+
+    cores = os.cpu_count() or 1
+    nthread = max(1, cores // args.workers)
+    init = (X[cv_mask], y[cv_mask], folds, nthread)
+    os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+    with open(args.cache, "a", encoding="utf-8") as out:
+        def record(result):
+            key = trial_key(result["params"], context)
+            cache[key] = {"key": key, "context": context, **result}
+            out.write(json.dumps(cache[key]) + "\n")
+            out.flush()
+            print(f"  depth {result['params']['max_depth']} eta {result['params']['eta']}: AUC {result['auc']:.4f} "
+                  f"({result['rounds']} trees, {result['train_s']:.1f} s)")
+
+        if args.workers > 1 and todo:
+            with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=init) as pool:
+                for fut in concurrent.futures.as_completed([pool.submit(run_trial, p, args.threshold_metric) for p in todo]):
+                    record(fut.result())
+        elif todo:
+            _init_worker(*init)
+            for p in todo:
+                record(run_trial(p, args.threshold_metric))
+
+    results = [cache[trial_key(p, context)] for p in trials]
+    chosen = select(results, args.auc_tolerance)
+    print(f"Chosen: {chosen['params']} ({chosen['rounds']} trees, CV AUC {chosen['auc']:.4f}, "
+          f"threshold {chosen['threshold']:.2f})")
+
+    # Final model: chosen params on every non-test row, scored on the held-out test bucket
+    dtrain = xgb.DMatrix(X[cv_mask], label=y[cv_mask], feature_names=FEATURE_COLUMNS)
+    booster = xgb.train({**FIXED_PARAMS, **chosen["params"]}, dtrain, num_boost_round=chosen["rounds"])
+    test_metrics = {"cv_auc": chosen["auc"], "threshold": chosen["threshold"], "test_rows": int((~cv_mask).sum())}
+    if (~cv_mask).any() and len(set(y[~cv_mask])) > 1:
+        proba = booster.inplace_predict(X[~cv_mask])
+        test_metrics["auc"] = float(roc_auc_score(y[~cv_mask], proba))
+        test_metrics[args.threshold_metric] = float(
+            THRESHOLD_METRICS[args.threshold_metric](y[~cv_mask], (proba > chosen["threshold"]).astype(int)))
+
+    report = format_report(results, chosen, test_metrics, args.auc_tolerance)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write("\n".join(report) + "\n")
+    print("\n".join(report[-(len(pareto(results)) + 3):]))
+    print(f"Report written to {args.report}")
+
+    if args.no_save:
+        return
+    version = save_model(
+        booster,
+        features=FEATURE_COLUMNS,
+        training_data_sha256=context["data"],
+        metrics=test_metrics,
+        params={**FIXED_PARAMS, **chosen["params"], "num_boost_round": chosen["rounds"]},
+        extra={"rows_seen": int(len(df)), "seed": args.seed, "mode": "tuned", "decision_threshold": chosen["threshold"],
+               "tuning": {"trials": len(results), "folds": args.folds, "threshold_metric": args.threshold_metric,
+                          "auc_tolerance": args.auc_tolerance}},
+        promote=not args.no_promote,
+    )
+    print(f"Saved model {version} to {MODELS_DIR}" + ("" if args.no_promote else " (now LATEST)"))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Cross-validated hyperparameter + threshold search for the confidence model.")
+    p.add_argument("--data", default=None, help=f"Parquet dataset dir or training CSV (default: {dataset.DATASET_DIR} if it has data)")
+    p.add_argument("--trials", type=int, default=40, help="Parameter sets to evaluate (grid sampled in a fixed order)")
+    p.add_argument("--folds", type=int, default=5)
+    p.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)), help="Trials run in parallel")
+    p.add_argument("--threshold-metric", default="f1", choices=sorted(THRESHOLD_METRICS))
+    p.add_argument("--auc-tolerance", type=float, default=0.002,
+                   help="A shallower model within this much CV AUC of the best is preferred")
+    p.add_argument("--cache", default=CACHE_FILE, help="Trial results (JSON lines); reused on the next run")
+    p.add_argument("--report", default=REPORT_FILE)
+    p.add_argument("--seed", type=int, default=SEED)
+    p.add_argument("--no-save", action="store_true", help="Report only; don't publish a model")
+    p.add_argument("--no-promote", action="store_true", help="Publish the version without pointing LATEST at it")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    tune(parse_args())
@@ -1,42 +1,201 @@
+import io
 import os
 from PIL import Image # pip install Pillow
-def resize_images(input_folder, output_folder):
-# Code takes all images from a folder location and creates two new images, one formatted to 496x496 and the other 64x64.
-# When outputting the picture it appends "_496" and "_64" to the end of the original file name respectfully.
+import scraper_metrics as metrics
 
-# Input folder directory (format with // instead of \)
-# Code assumes all files in folder are images, no error handling for non images
-# Output folder directory (format with // instead of \)
-    
+try:
+    import pillow_avif  # AVIF for Pillow < 11.2 (pip install pillow-avif-plugin); newer Pillow has it built in
+except Exception:
+    pillow_avif = None
 
-    dir_list = os.listdir(input_folder) # Creates list with all original image file names
-    i = 0 # Counter for appending to end of file name
+try:
+    from PIL import ImageCms
+except Exception:
+    ImageCms = None
 
-    for pic in dir_list: # Runs for each image name
-        imageopen = os.path.join(input_folder, pic) # Appends filename to end of open path
-        i += 1 # Increments counter for next image    
-        try:
-            image = Image.open(imageopen) # Opens image
-            image2 = Image.open(imageopen) # Opens image for second
-        except IOError:
-            print(f"Unable to open {pic}. Skipping.")
+# Rendition policy
+# Every staged image becomes a 496x496 and a 64x64 rendition in <dest>/496 and <dest>/64.
+# Each size is written once per format in RENDITION_FORMATS:
+#   jpeg  progressive + optimized; always written, so "<name>.jpg" keeps working for every consumer
+#   webp  typically 25-35% smaller than the JPEG at the same visual quality
+#   avif  smaller still, but slow to encode; opt in with SCRAPER_RENDITION_FORMATS=jpeg,webp,avif
+# Line art (PNG/GIF sources with a small palette: diagrams, logos, dimension drawings) is
+# also kept lossless: "<name>.png" (optimized, re-paletted) plus lossless WebP alongside the
+# JPEG, so consumers that can pick a format get thin lines without JPEG ringing.
+# EXIF/XMP and other metadata are dropped. Embedded colour profiles are converted to sRGB first
+# (when ImageCms is available), so stripping them doesn't shift colours. Transparency is
+# flattened onto white, which is the background the review UI shows.
+RENDITION_SIZES = {"496": (496, 496), "64": (64, 64)}
+RENDITION_FORMATS = [f.strip().lower() for f in os.getenv("SCRAPER_RENDITION_FORMATS", "jpeg,webp").split(",") if f.strip()]
+LOSSLESS_LINE_ART = os.getenv("SCRAPER_RENDITION_LOSSLESS_LINE_ART", "1") not in ("", "0")
+LINE_ART_MAX_COLORS = 256
+
+# Encoder settings per format and size. Small thumbnails get a little more quality (artifacts
+# are proportionally larger), and the big rendition gets the slower, denser encoder effort.
+QUALITY = {
+    "jpeg": {"496": dict(quality=82, optimize=True, progressive=True, subsampling="4:2:0"),
+             "64": dict(quality=85, optimize=True, progressive=False, subsampling="4:4:4")},
+    "webp": {"496": dict(quality=78, method=6),
+             "64": dict(quality=82, method=4)},
+    "avif": {"496": dict(quality=55, speed=6),
+             "64": dict(quality=65, speed=8)},
+}
+LOSSLESS = {
+    "png": dict(optimize=True),
+    "webp": dict(lossless=True, quality=100, method=6),
+}
+EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "avif": ".avif", "png": ".png"}
+SKIP_SUFFIXES = (".json",)  # sidecars live next to the staged images
+
+
+def _supported(fmt):
+    if fmt in ("jpeg", "png"):
+        return True
+    try:
+        from PIL import features
+        return bool(features.check(fmt))
+    except Exception:
+        return fmt == "avif" and pillow_avif is not None
+
+
+def _to_srgb(image):
+    """Convert an image with an embedded ICC profile to sRGB so the profile can be dropped."""
+    icc = image.info.get("icc_profile")
+    if not icc or ImageCms is None:
+        return image
+    try:
+        src = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        dst = ImageCms.createProfile("sRGB")
+        if image.mode not in ("RGB", "RGBA", "CMYK", "L"):
+            image = image.convert("RGBA" if image.mode in ("LA", "PA") or "transparency" in image.info else "RGB")
+        return ImageCms.profileToProfile(image, src, dst, outputMode="RGBA" if image.mode == "RGBA" else "RGB")
+    except Exception:
+        return image  # broken profile: keep the pixels as they are
+
+
+def _flatten(image):
+    """RGB on a white background (alpha and palette transparency composited, not dropped)."""
+    if image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def _is_line_art(image, source_format):
+    """Palette-style PNG/GIF: few distinct colours, where lossless output is both smaller and sharper."""
+    if not LOSSLESS_LINE_ART or source_format not in ("PNG", "GIF"):
+        return False
+    if image.mode == "P":
+        return True
+    return image.getcolors(LINE_ART_MAX_COLORS) is not None
+
+
+def _encode(image, fmt, options):
+    buf = io.BytesIO()
+    image.save(buf, fmt.upper(), **options)  # no exif/icc_profile/xmp passed: metadata is stripped
+    return buf.getvalue()
+
+
+def render(image, source_format):
+    """
+    Encode one opened image per RENDITION_SIZES x formats.
+    Returns {size: [(format, bytes), ...]}; the first entry per size is the compatibility format (jpeg).
+    """
+    line_art = _is_line_art(image, source_format)
+    image = _flatten(_to_srgb(image))
+    out = {}
+    for size_name, size in RENDITION_SIZES.items():
+        resized = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        encoded = [("jpeg", _encode(resized, "jpeg", QUALITY["jpeg"][size_name]))]
+        if line_art:
+            # back to an adaptive palette: resampling adds in-between colours the source never had
+            paletted = resized.quantize(colors=LINE_ART_MAX_COLORS, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+            encoded.append(("png", _encode(paletted, "png", LOSSLESS["png"])))
+            if "webp" in RENDITION_FORMATS and _supported("webp"):
+                encoded.append(("webp", _encode(resized, "webp", LOSSLESS["webp"])))
+        else:
+            for fmt in [f for f in RENDITION_FORMATS if f != "jpeg"]:
+                if fmt in QUALITY and _supported(fmt):
+                    encoded.append((fmt, _encode(resized, fmt, QUALITY[fmt][size_name])))
+        out[size_name] = encoded
+    return out
+
+
+def new_report():
+    return {"images": 0, "source_bytes": 0, "bytes": {}, "saved_vs_jpeg": {}}
+
+
+def format_report(report):
+    """Human-readable lines: bytes written per format, and what the modern formats save over JPEG."""
+    lines = [f"{report['images']} image(s), {report['source_bytes'] / 1024:.0f} KiB staged"]
+    for fmt, n in sorted(report["bytes"].items()):
+        line = f"  {fmt:<5} {n / 1024:>10.1f} KiB"
+        saved = report["saved_vs_jpeg"].get(fmt)
+        if saved is not None and report["bytes"].get("jpeg"):
+            line += f"  saves {saved / 1024:.1f} KiB ({100.0 * saved / report['bytes']['jpeg']:.1f}%) vs jpeg"
+        lines.append(line)
+    return lines
+
+
+def resize_images(input_folder, output_folder, report=None):
+# Code takes all images from a folder location and creates two renditions of each, one 496x496 and
+# the other 64x64, in <output_folder>/496 and <output_folder>/64 under the original file name
+# (one file per format, see the rendition policy above).
+# Non-image files (sidecar .json) are skipped; anything that fails to open is logged and skipped.
+# Returns the size report (pass `report` to accumulate over several folders).
+
+    report = report if report is not None else new_report()
+    for size_name in RENDITION_SIZES:
+        os.makedirs(os.path.join(output_folder, size_name), exist_ok=True)
+
+    for pic in sorted(os.listdir(input_folder)): # Runs for each image name
+        if pic.lower().endswith(SKIP_SUFFIXES):
             continue
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB') # Converts image to RGB
-            image2 = image2.convert('RGB')
+        imageopen = os.path.join(input_folder, pic) # Appends filename to end of open path
+        stem = os.path.splitext(pic)[0]
+        with metrics.stage("resize"):
+            try:
+                with Image.open(imageopen) as image: # Opens image once for both sizes
+                    source_format = image.format
+                    if source_format == "JPEG":
+                        image.draft("RGB", RENDITION_SIZES["496"])  # DCT-domain downscale on decode, never below 496
+                    image.load()
+                    renditions = render(image, source_format)
+            except (IOError, ValueError) as e:
+                print(f"Unable to open {pic}. Skipping. ({e})")
+                continue
 
-        new_496 = image.resize((496, 496)) # Reformats to 496x496
-        new_64 = image2.resize((64, 64)) # Reformats to 64x64
+            jpeg_bytes = {}
+            for size_name, encoded in renditions.items():
+                for fmt, data in encoded:
+                    with open(os.path.join(output_folder, size_name, stem + EXTENSIONS[fmt]), "wb") as f:
+                        f.write(data)
+                    metrics.RENDITION_BYTES.inc(len(data), format=fmt, size=size_name)
+                    report["bytes"][fmt] = report["bytes"].get(fmt, 0) + len(data)
+                    if fmt == "jpeg":
+                        jpeg_bytes[size_name] = len(data)
+                for fmt, data in encoded:
+                    if fmt != "jpeg" and size_name in jpeg_bytes:
+                        report["saved_vs_jpeg"][fmt] = report["saved_vs_jpeg"].get(fmt, 0) + jpeg_bytes[size_name] - len(data)
+            report["images"] += 1
+            report["source_bytes"] += os.path.getsize(imageopen)
+            metrics.IMAGES_RESIZED.inc()
+    return report
 
-        out496 = pic # Appends "_496 to end of file name"
-        out64 = pic # Appends "_64 to end of file name"
 
-        out496 = os.path.join(output_folder + "/496", out496) # Appends new 496 filename to end of output path
-        out64 = os.path.join(output_folder + "/64", out64) # Appends new 64 filename to end of output path
-        
-        os.makedirs(output_folder + "/496", exist_ok=True)
-        os.makedirs(output_folder + "/64", exist_ok=True)
+# Try the policy on a folder of images, e.g. a staging folder or an existing rendition tree:
+#   python autoimage.py <input_folder> [<output_folder>]
+if __name__ == "__main__":
+    import sys
+    import tempfile
 
-        new_496.save(out496, new_496.format) # Saves 496 image to output folder
-        new_64.save(out64, new_64.format) # Saves 64 image to output folder
\ No newline at end of file
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python autoimage.py <input_folder> [<output_folder>]")
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix="renditions_")
+    for line in format_report(resize_images(sys.argv[1], out_dir)):
+        print(line)
+    print(f"renditions in {out_dir}")
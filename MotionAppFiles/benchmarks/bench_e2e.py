@@ -0,0 +1,265 @@
+# bench_e2e.py
+# Offline end-to-end throughput benchmark for the scraper.
+#
+# Starts benchmarks/fake_services.py (fake Bing, Google, image CDN and Elasticsearch),
+# points image_scraper at it through SCRAPER_BING_URL / SCRAPER_GOOGLE_URL /
+# ELASTICSEARCH_URL, generates input and context spreadsheets for N SKUs and runs
+# start_scraping over them. Reports SKUs/sec, p50/p99 per-SKU latency, peak RSS and
+# the per-stage breakdown from run_metrics.json. No network access needed.
+#
+# Half of the manufacturers have the fake CDN as their OEM site (site: search succeeds),
+# the rest point at a vendor whose results are all off-site, so the fallback chain runs too.
+#
+# With --workers N the SKUs are put on a SQLite work queue (work_queue.py) instead and
+# drained by N `image_scraper.py --worker` processes; per-SKU latencies aren't available
+# then, the report shows per-worker job counts instead.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_e2e.py --skus 50
+#   python benchmarks/bench_e2e.py --skus 200 --search-latency-ms 150 --error-rate 0.05 --json e2e.json
+#   python benchmarks/bench_e2e.py --skus 200 --workers 4
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+try:
+    import resource  # Unix only
+except Exception:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..")
+
+
+def start_fake_services(args):
+    cmd = [
+        sys.executable, os.path.join(HERE, "fake_services.py"), "--port", "0",
+        "--results", str(args.results),
+        "--search-latency-ms", str(args.search_latency_ms),
+        "--image-latency-ms", str(args.image_latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("listening on "):
+        proc.kill()
+        raise SystemExit(f"fake_services failed to start: {line!r}")
+    return proc, f"http://127.0.0.1:{int(line.split()[-1])}"
+
+
+def write_sheets(workdir, base, n_skus, n_manufacturers):
+    import pandas as pd
+
+    manufacturers = [f"BENCHCO{i:02d}" for i in range(n_manufacturers)]
+    rows = [{
+        "MFR_NAME": manufacturers[i % n_manufacturers],
+        "Part Number": f"PN-{i:05d}",
+        "ITEM_NO": f"{100000 + i}",
+        "Product Description": f"Bench part {i}",
+        "[<ID>]": f"{900000 + i}",
+    } for i in range(n_skus)]
+    context = []
+    for i, mfr in enumerate(manufacturers):
+        if i % 2 == 0:
+            context.append({"MFR_NAME": mfr, "URL": base, "ENTERPRISE_NAME": mfr})  # OEM site = fake CDN
+        else:
+            context.append({"MFR_NAME": mfr, "URL": "https://vendor.invalid", "ENTERPRISE_NAME": "DISTRIBUTOR"})
+    input_path = os.path.join(workdir, "input.xlsx")
+    context_path = os.path.join(workdir, "context.xlsx")
+    pd.DataFrame(rows).to_excel(input_path, index=False)
+    pd.DataFrame(context).to_excel(context_path, index=False)
+    return input_path, context_path
+
+
+def publish_synthetic_model(models_dir, seed):
+    """A small 6-feature model in a throwaway registry, so inference runs like in production."""
+    import xgboost as xgb
+    from model_registry import LEGACY_FEATURES, save_model
+
+    rng = np.random.default_rng(seed)
+    X = rng.random((2000, len(LEGACY_FEATURES))).astype(np.float32)
+    y = (X[:, 1] + 0.5 * X[:, 4] > 0.8).astype(int)
+    model = xgb.XGBClassifier(n_estimators=100, max_depth=4, tree_method="hist", random_state=seed)
+    model.fit(X, y)
+    return save_model(model.get_booster(), features=LEGACY_FEATURES, training_data_sha256=None,
+                      metrics={}, root=models_dir)
+
+
+def peak_rss_mb(who=None):
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+def run_inline(args, image_scraper, input_path, context_path, output_dir):
+    """One start_scraping run in this process, timing each SKU through on_progress."""
+    image_scraper.profile_enabled = args.profile
+    args.keep = args.keep or args.profile
+    marks = []
+    image_scraper.on_progress = lambda current, total: marks.append(time.perf_counter())
+
+    t0 = time.perf_counter()
+    image_scraper.start_scraping(input_path, 0, 0, context_path, output_dir)
+    wall = time.perf_counter() - t0
+    marks.append(time.perf_counter())
+
+    per_sku = np.diff(marks) if len(marks) > 1 else np.array([])
+    with open(os.path.join(output_dir, "run_metrics.json"), "r", encoding="utf-8") as f:
+        run_metrics = json.load(f)
+    return {
+        "skus": len(per_sku),
+        "wall_s": round(wall, 3),
+        "skus_per_sec": round(len(per_sku) / wall, 3) if wall else None,
+        "sku_latency_p50_ms": round(float(np.percentile(per_sku, 50)) * 1000, 1) if len(per_sku) else None,
+        "sku_latency_p99_ms": round(float(np.percentile(per_sku, 99)) * 1000, 1) if len(per_sku) else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+        "stages": run_metrics.get("stages", {}),
+        "counters": run_metrics.get("counters", {}),
+    }
+
+
+def merge_stages(summaries):
+    """Add up per-worker stage timings; p95 is the worst worker's (an upper bound, not a true quantile)."""
+    stages = {}
+    for summary in summaries:
+        for name, st in summary.get("stages", {}).items():
+            m = stages.setdefault(name, {"count": 0, "total_s": 0.0, "p95_s": 0.0})
+            m["count"] += st["count"]
+            m["total_s"] += st["total_s"]
+            m["p95_s"] = max(m["p95_s"], st.get("p95_s") or 0.0)
+    for m in stages.values():
+        m["mean_s"] = m["total_s"] / m["count"] if m["count"] else 0.0
+    return stages
+
+
+def run_queue(args, image_scraper, input_path, context_path, output_dir, workdir):
+    """Enqueue the sheet on a SQLite queue and drain it with --workers worker processes."""
+    from work_queue import open_queue
+
+    queue_path = os.path.join(workdir, "queue.sqlite")
+    queue = open_queue(queue_path)
+    image_scraper.enqueue_entries(queue, input_path, context_path)
+
+    cmd = [sys.executable, os.path.join(APP_DIR, "image_scraper.py"), "--worker", "--queue", queue_path,
+           "--output", output_dir, "--log-level", args.log_level, "--max-jobs", "0"]
+    t0 = time.perf_counter()
+    workers = [subprocess.Popen(cmd + ["--worker-id", f"bench{i}"], cwd=APP_DIR) for i in range(args.workers)]
+    for w in workers:
+        w.wait()
+    wall = time.perf_counter() - t0
+
+    summaries, per_worker = [], {}
+    for i in range(args.workers):
+        path = os.path.join(output_dir, f"run_metrics.bench{i}.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                summaries.append(json.load(f))
+        jsonl = os.path.join(output_dir, f"sku_metadata.bench{i}.jsonl")
+        per_worker[f"bench{i}"] = sum(1 for _ in open(jsonl, encoding="utf-8")) if os.path.exists(jsonl) else 0
+    stats = queue.stats()
+    queue.close()
+    skus = stats["done"]
+    return {
+        "skus": skus,
+        "wall_s": round(wall, 3),
+        "skus_per_sec": round(skus / wall, 3) if wall else None,
+        "sku_latency_p50_ms": None,
+        "sku_latency_p99_ms": None,
+        "peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1) if resource is not None else None,
+        "workers": per_worker,
+        "queue": stats,
+        "stages": merge_stages(summaries),
+        "counters": {},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline end-to-end scraper benchmark.")
+    ap.add_argument("--skus", type=int, default=50)
+    ap.add_argument("--manufacturers", type=int, default=4)
+    ap.add_argument("--results", type=int, default=8, help="Candidate URLs per search page")
+    ap.add_argument("--search-latency-ms", type=float, default=50.0)
+    ap.add_argument("--image-latency-ms", type=float, default=20.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--model", choices=("synthetic", "registry"), default="synthetic",
+                    help="synthetic = throwaway 6-feature model; registry = the real models/ LATEST")
+    ap.add_argument("--log-level", default="CRITICAL", help="Scraper log level (default: quiet)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--profile", action="store_true", help="Run with the sampling profiler (implies --keep)")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Drain a work queue with this many worker processes (default 0 = one in-process run)")
+    ap.add_argument("--keep", action="store_true", help="Keep the work dir (output images, logs)")
+    ap.add_argument("--json", default="", help="Also write the report here")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    proc, base = start_fake_services(args)
+    try:
+        # Everything the scraper reads from the environment must be set before it is imported
+        os.environ.update({
+            "SCRAPER_BING_URL": f"{base}/images/search",
+            "SCRAPER_GOOGLE_URL": f"{base}/search",
+            "ELASTICSEARCH_URL": base,
+            "ELASTICSEARCH_PASSWORD": "bench",
+            "FEATURE_STORE_PATH": os.path.join(workdir, "feature_store.sqlite"),
+            "SCRAPER_HOST_REPUTATION_PATH": os.path.join(workdir, "host_reputation.sqlite"),
+            "SCRAPER_ES_SPOOL_DIR": os.path.join(workdir, "es_spool"),
+            "SCRAPER_LOG_FILE": os.path.join(workdir, "scraper_logs.txt"),
+        })
+        sys.path.insert(0, APP_DIR)
+        if args.model == "synthetic":
+            os.environ["MODEL_REGISTRY_DIR"] = os.path.join(workdir, "models")
+            publish_synthetic_model(os.environ["MODEL_REGISTRY_DIR"], args.seed)
+
+        input_path, context_path = write_sheets(workdir, base, args.skus, args.manufacturers)
+        output_dir = os.path.join(workdir, "out")
+        os.makedirs(output_dir)
+
+        import image_scraper
+        from scraper_logging import configure_logging
+
+        configure_logging(level=args.log_level)
+        if args.workers:
+            report = run_queue(args, image_scraper, input_path, context_path, output_dir, workdir)
+        else:
+            report = run_inline(args, image_scraper, input_path, context_path, output_dir)
+        with urllib.request.urlopen(f"{base}/_bench/stats") as r:
+            server_stats = json.load(r)
+        report["server"] = server_stats
+        report["config"] = vars(args)
+
+        print(f"SKUs: {report['skus']}  wall: {report['wall_s']:.2f} s  throughput: {report['skus_per_sec']} SKUs/s")
+        print(f"per-SKU latency: p50 {report['sku_latency_p50_ms']} ms  p99 {report['sku_latency_p99_ms']} ms")
+        print(f"peak RSS: {report['peak_rss_mb']} MB")
+        if "workers" in report:
+            print(f"jobs per worker: {report['workers']}  queue: {report['queue']}")
+        print(f"server: {server_stats}")
+        print(f"\n{'stage':<14}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}")
+        for name, s in sorted(report["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+            print(f"{name:<14}{s['count']:>8}{s['total_s']:>10.2f}{s['mean_s'] * 1000:>10.1f}"
+                  f"{(s['p95_s'] or 0) * 1000:>10.1f}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if args.keep:
+            print(f"\nwork dir kept: {workdir}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
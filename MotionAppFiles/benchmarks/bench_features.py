@@ -0,0 +1,219 @@
+# bench_features.py
+# Micro-benchmarks for the feature-extraction and scoring kernels:
+#   compute_white_ratio, analyze_image, compute_filename_features, model scoring
+# over a fixed, generated image set (400^2, 1000^2, 4000^2; RGB, RGBA, grayscale).
+#
+# For every kernel and input it records the median time per call and the peak
+# Python-tracked allocation of one call (tracemalloc; covers NumPy/OpenCV arrays
+# returned to Python). It also checks that MotionAppFiles/feature_engineer.py and
+# MLModel/feature_engineer.py return identical features for every image, and exits
+# non-zero if they don't.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_features.py                       # all sizes
+#   python benchmarks/bench_features.py --sizes 400 1000 --json before.json
+#   python benchmarks/bench_features.py --compare before.json   # show change vs a saved run
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, ".."))
+MLMODEL_DIR = os.path.abspath(os.path.join(APP_DIR, "..", "MLModel"))
+
+SIZES = (400, 1000, 4000)
+# mode -> file format the image is stored in (what the scraper and the feedback export produce)
+MODES = {"RGB": "jpg", "RGBA": "png", "L": "png"}
+FILENAMES = [
+    ("timken-set-5-bearing-front.jpg", "TIMKEN"),
+    ("IMG_20240101_0001.jpg", "SKF"),
+    ("https___cdn.example.com_products_ab-12345_main.jpg", "ALLEN-BRADLEY (ROCKWELL)"),
+]
+
+
+@contextlib.contextmanager
+def _cwd(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def load_copy(name, path, workdir):
+    """Import one feature_engineer.py under its own module name (the MLModel copy creates Output/ on import)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    with _cwd(workdir):
+        spec.loader.exec_module(module)
+    return module
+
+
+def make_image(side, mode, seed):
+    """White background with a textured product in the middle, like a typical catalogue shot."""
+    rng = np.random.default_rng(seed)
+    img = np.full((side, side, 3), 255, dtype=np.uint8)
+    lo, hi = side // 4, 3 * side // 4
+    tint = rng.integers(30, 200, 3)
+    img[lo:hi, lo:hi] = np.clip(rng.normal(0, 25, (hi - lo, hi - lo, 3)) + tint, 0, 255).astype(np.uint8)
+    pil = Image.fromarray(img)
+    if mode == "RGBA":
+        alpha = np.full((side, side), 255, dtype=np.uint8)
+        alpha[: side // 10] = 0  # transparent top band exercises the alpha mask
+        pil.putalpha(Image.fromarray(alpha))
+    elif mode == "L":
+        pil = pil.convert("L")
+    return pil
+
+
+def build_corpus(workdir, sizes):
+    cases = []
+    for side in sizes:
+        for i, (mode, ext) in enumerate(MODES.items()):
+            path = os.path.join(workdir, f"bench_{side}_{mode}.{ext}")
+            img = make_image(side, mode, seed=side + i)
+            if ext == "jpg":
+                img.save(path, quality=90)
+            else:
+                img.save(path)
+            cases.append((f"{side}x{side} {mode}", path))
+    return cases
+
+
+def time_call(fn, min_time, max_repeats=1000):
+    fn()  # warm-up
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats and (time.perf_counter() - start) < min_time:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), len(times)
+
+
+def peak_alloc(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def same(a, b):
+    if isinstance(a, (tuple, list)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+
+def check_copies(app, ml, cases):
+    """Both feature_engineer copies must agree exactly; returns the mismatches."""
+    mismatches = []
+    for label, path in cases:
+        a, b = app.analyze_image(path), ml.analyze_image(path)
+        if not same(a, b):
+            mismatches.append(f"analyze_image {label}: app={a} mlmodel={b}")
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is not None and img.ndim == 3:
+            a, b = app.compute_white_ratio(img), ml.compute_white_ratio(img)
+            if not same(a, b):
+                mismatches.append(f"compute_white_ratio {label}: app={a} mlmodel={b}")
+    for fname, mfr in FILENAMES:
+        a, b = app.compute_filename_features(fname, mfr), ml.compute_filename_features(fname, mfr)
+        if not same(a, b):
+            mismatches.append(f"compute_filename_features {fname!r}: app={a} mlmodel={b}")
+    return mismatches
+
+
+def scoring_model():
+    """Synthetic 6-feature model behind the same LoadedModel the scraper uses."""
+    import xgboost as xgb
+    from model_registry import LEGACY_FEATURES, LoadedModel
+
+    rng = np.random.default_rng(0)
+    X = rng.random((2000, len(LEGACY_FEATURES))).astype(np.float32)
+    y = (X[:, 1] + 0.5 * X[:, 4] > 0.8).astype(int)
+    model = xgb.XGBClassifier(n_estimators=100, max_depth=6, tree_method="hist", random_state=0).fit(X, y)
+    return LoadedModel("bench", {"features": LEGACY_FEATURES}, booster=model.get_booster())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark feature-extraction and scoring kernels.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    ap.add_argument("--min-time", type=float, default=0.5, help="Seconds of timing per kernel/input")
+    ap.add_argument("--json", default="", help="Save results (for --compare later)")
+    ap.add_argument("--compare", default="", help="Earlier --json output to compare against")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_features_")
+    try:
+        sys.path.insert(0, APP_DIR)
+        app = load_copy("feature_engineer_app", os.path.join(APP_DIR, "feature_engineer.py"), workdir)
+        ml = load_copy("feature_engineer_mlmodel", os.path.join(MLMODEL_DIR, "feature_engineer.py"), workdir)
+        cases = build_corpus(workdir, args.sizes)
+
+        mismatches = check_copies(app, ml, cases)
+        print(f"feature_engineer copies: {'identical' if not mismatches else f'{len(mismatches)} MISMATCHES'}"
+              f" on {len(cases)} images")
+        for m in mismatches:
+            print(f"  {m}")
+
+        kernels = []
+        for label, path in cases:
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if img.ndim == 3:  # compute_white_ratio expects BGR or BGRA
+                kernels.append(("compute_white_ratio", label, lambda img=img: app.compute_white_ratio(img)))
+            kernels.append(("analyze_image", label, lambda path=path: app.analyze_image(path)))
+        for fname, mfr in FILENAMES:
+            kernels.append(("compute_filename_features", fname[:32], lambda f=fname, m=mfr: app.compute_filename_features(f, m)))
+        model = scoring_model()
+        rng = np.random.default_rng(1)
+        for n in (1, 20):
+            X = rng.random((n, len(model.features))).astype(np.float32)
+            kernels.append(("score", f"batch {n}", lambda X=X: model.predict(X)))
+
+        baseline = {}
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                baseline = {(r["kernel"], r["input"]): r for r in json.load(f)["results"]}
+
+        results = []
+        print(f"\n{'kernel':<27}{'input':<34}{'median':>12}{'calls':>7}{'peak alloc':>13}" + ("    vs base" if baseline else ""))
+        for kernel, label, fn in kernels:
+            t, n = time_call(fn, args.min_time)
+            peak = peak_alloc(fn)
+            results.append({"kernel": kernel, "input": label, "median_s": t, "calls": n, "peak_alloc_bytes": peak})
+            t_str = f"{t * 1e6:.1f} us" if t < 1e-3 else f"{t * 1e3:.2f} ms"
+            line = f"{kernel:<27}{label:<34}{t_str:>12}{n:>7}{peak / 1024:>10.0f} KiB"
+            base = baseline.get((kernel, label))
+            if base:
+                line += f"  {100.0 * (t / base['median_s'] - 1):+8.1f}%"
+            print(line)
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"sizes": args.sizes, "results": results, "copies_identical": not mismatches}, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# bench_hashing.py
+# Archive hashing: the per-image path (imagehash.phash + hashlib, one image at a time, as
+# json_sidecar did) against image_hashing.hash_files (threaded read/sha256/resize, one DCT per batch).
+#
+# Generates a set of images (JPEG/PNG/WebP; RGB, RGBA, palette, grayscale; 400px up to --max-size),
+# checks that every sha256 and pHash from hash_files equals the per-image reference (exit 1
+# otherwise), and reports images/s for both.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_hashing.py
+#   python benchmarks/bench_hashing.py --images 400 --workers 1 2 4 8 --dir /path/to/archive
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))
+
+import image_hashing  # noqa: E402
+
+try:
+    import imagehash
+except Exception:
+    imagehash = None
+
+FORMATS = [("RGB", "jpg"), ("RGBA", "png"), ("P", "png"), ("L", "jpg"), ("RGB", "webp")]
+
+
+def make_images(directory, n, max_size, seed):
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    paths = []
+    for i in range(n):
+        mode, ext = FORMATS[i % len(FORMATS)]
+        w, h = pick.randint(400, max_size), pick.randint(400, max_size)
+        # smooth gradients + a few shapes + noise: DCT energy spread like a product photo
+        y, x = np.mgrid[0:h, 0:w]
+        base = (np.sin(x / pick.uniform(20, 200)) + np.cos(y / pick.uniform(20, 200))) * 60 + 128
+        rgb = np.stack([base + rng.normal(0, 12, (h, w)) for _ in range(3)], axis=-1)
+        cx, cy, r = pick.randint(0, w), pick.randint(0, h), pick.randint(50, 300)
+        rgb[(x - cx) ** 2 + (y - cy) ** 2 < r * r] = [pick.randint(0, 255) for _ in range(3)]
+        im = Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB")
+        if mode == "RGBA":
+            im.putalpha(Image.fromarray((x % 255).astype(np.uint8)))
+        elif mode == "P":
+            im = im.quantize(64)
+        elif mode == "L":
+            im = im.convert("L")
+        path = os.path.join(directory, f"img_{i:05d}.{ext}")
+        im.save(path, quality=88) if ext in ("jpg", "webp") else im.save(path)
+        paths.append(path)
+    return paths
+
+
+def reference(paths):
+    """What the sidecar code did per image: hash the bytes, open, imagehash.phash."""
+    out = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        h = hashlib.sha256()
+        h.update(data)
+        with Image.open(path) as im:
+            out[path] = (h.hexdigest(), str(imagehash.phash(im)))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark batched pHash + threaded sha256 against the per-image path.")
+    ap.add_argument("--images", type=int, default=200)
+    ap.add_argument("--max-size", type=int, default=1600)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--batch-size", type=int, default=image_hashing.BATCH_SIZE)
+    ap.add_argument("--dir", default="", help="Hash this archive instead of generated images")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if imagehash is None or image_hashing.fftpack is None:
+        raise SystemExit("needs imagehash and scipy for the reference")
+    workdir = None
+    if args.dir:
+        paths = image_hashing.find_images([args.dir])
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench_hashing_")
+        paths = make_images(workdir, args.images, args.max_size, args.seed)
+    try:
+        t0 = time.perf_counter()
+        ref = reference(paths)
+        t_ref = time.perf_counter() - t0
+        print(f"{len(paths)} images, {sum(os.path.getsize(p) for p in paths) / 2**20:.1f} MiB")
+        print(f"{'per-image (imagehash)':<28}{t_ref:>8.2f} s{len(paths) / t_ref:>9.0f} img/s")
+
+        mismatches = 0
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            got = {p: (d, h) for p, d, h, _ in image_hashing.hash_files(paths, workers, args.batch_size)}
+            t = time.perf_counter() - t0
+            bad = [p for p in paths if got.get(p) != ref[p]]
+            mismatches += len(bad)
+            for p in bad[:3]:
+                print(f"  MISMATCH {p}: {got.get(p)} != {ref[p]}")
+            print(f"{f'hash_files workers={workers}':<28}{t:>8.2f} s{len(paths) / t:>9.0f} img/s"
+                  f"{t_ref / t:>7.1f}x  {'identical' if not bad else f'{len(bad)} differ'}")
+
+        arrays = [image_hashing.prepare(Image.open(p)) for p in paths[:256]]
+        t0 = time.perf_counter()
+        single = [image_hashing.phash_batch([a])[0] for a in arrays]
+        t_single = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        batched = image_hashing.phash_batch(arrays)
+        t_batch = time.perf_counter() - t0
+        if single != batched:
+            mismatches += 1
+            print("  MISMATCH between single and batched DCT")
+        print(f"DCT+median only ({len(arrays)} prepared): one by one {t_single * 1000:.1f} ms, batched {t_batch * 1000:.1f} ms")
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
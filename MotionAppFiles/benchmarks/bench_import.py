@@ -0,0 +1,83 @@
+# bench_import.py
+# Import-time budget for the scraper modules that CLI tools and worker processes load.
+#
+# Runs `python -X importtime -c "import <module>"` in a fresh interpreter, reports the
+# cumulative import time and the slowest imports, and fails if the budget is exceeded
+# or a heavy dependency (GUI, OpenCV, pandas, Elasticsearch, ...) is pulled in eagerly.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_import.py                       # image_scraper, default budget
+#   python benchmarks/bench_import.py --module rescore --budget-ms 2000 --allow-heavy
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DEFAULT_MODULE = "image_scraper"
+DEFAULT_BUDGET_MS = 150.0
+REPEATS = 5
+
+# Must only be imported on first use
+HEAVY_MODULES = (
+    "tkinter", "PIL", "bs4", "cv2", "skimage", "rapidfuzz", "numpy", "pandas",
+    "elasticsearch", "xgboost", "sklearn", "joblib", "imagehash", "requests",
+)
+
+
+def import_profile(module):
+    """{module: cumulative import time in us} for one cold interpreter."""
+    code = f"import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=HERE, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line.split(":", 1)[1].split("|")
+        name = name.strip()
+        cumulative[name] = max(cumulative.get(name, 0), int(cum_us))
+    return cumulative
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the import-time budget of a scraper module.")
+    ap.add_argument("--module", default=DEFAULT_MODULE)
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--repeats", type=int, default=REPEATS, help="Best of N cold imports")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--allow-heavy", action="store_true", help="Don't fail on eager heavy imports")
+    args = ap.parse_args()
+
+    runs = [import_profile(args.module) for _ in range(max(1, args.repeats))]
+    best = min(runs, key=lambda r: r.get(args.module, 0))
+    total_ms = best.get(args.module, 0) / 1000.0
+
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {len(runs)}, budget {args.budget_ms:.0f} ms)")
+    print("slowest imports:")
+    for name, us in sorted(best.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {us / 1000.0:8.1f} ms  {name}")
+
+    heavy = sorted({name.split(".")[0] for name in best} & set(HEAVY_MODULES))
+    failed = False
+    if heavy and not args.allow_heavy:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
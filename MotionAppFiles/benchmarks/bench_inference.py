@@ -0,0 +1,105 @@
+# bench_inference.py
+# Compare confidence-model scoring paths at the batch sizes the pipeline uses:
+#   1     -> one candidate in download_images
+#   20    -> one SKU's candidate list
+#   10000 -> bulk re-scoring
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_inference.py                 # synthetic 6-feature model
+#   python benchmarks/bench_inference.py --registry      # LATEST model from models/
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tree_inference import FlatForest
+from model_registry import LoadedModel, LEGACY_FEATURES
+
+BATCH_SIZES = (1, 20, 10_000)
+N_FEATURES = 6
+TOLERANCE = 1e-5
+
+
+def synthetic_model(n_estimators=100, max_depth=6, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((5000, N_FEATURES)).astype(np.float32)
+    y = (X[:, 1] + 0.5 * X[:, 4] * rng.random(5000) > 0.8).astype(int)
+    model = xgb.XGBClassifier(n_estimators=n_estimators, max_depth=max_depth, tree_method="hist", random_state=seed)
+    model.fit(X, y)
+    return model
+
+
+def registry_model():
+    from model_registry import MODELS_DIR, MODEL_FILE, ModelRegistry
+
+    loaded = ModelRegistry(backend="xgboost").get()
+    if loaded.booster is not None:
+        # Rebuild a classifier wrapper around the native booster to time the predict_proba path
+        model = xgb.XGBClassifier()
+        model.load_model(os.path.join(MODELS_DIR, loaded.version, MODEL_FILE))
+        return model
+    return loaded._sk_model
+
+
+def bench(fn, X, min_time=0.5, max_repeats=10_000):
+    fn(X)  # warm-up
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats and (time.perf_counter() - start) < min_time:
+        t0 = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark confidence-model inference backends.")
+    ap.add_argument("--registry", action="store_true", help="Benchmark the LATEST registry model")
+    ap.add_argument("--trees", type=int, default=100)
+    ap.add_argument("--depth", type=int, default=6)
+    args = ap.parse_args()
+
+    model = registry_model() if args.registry else synthetic_model(args.trees, args.depth)
+    booster = model.get_booster()
+    flat = FlatForest.from_booster(booster)
+    # What the scraper / re-scorer actually call with MODEL_INFERENCE_BACKEND=flat
+    hybrid = LoadedModel("bench", {"features": LEGACY_FEATURES}, booster=booster, backend="flat")
+    print(f"model: {flat.num_trees} trees, max depth {flat.max_depth}, xgboost {xgb.__version__}")
+
+    paths = {
+        "predict_proba": lambda X: model.predict_proba(X)[:, 1],
+        "inplace_predict": lambda X: booster.inplace_predict(X),
+        "flat (numpy)": flat.predict,
+        "LoadedModel(flat)": hybrid.predict,
+    }
+
+    rng = np.random.default_rng(1)
+    X_all = rng.random((max(BATCH_SIZES), booster.num_features())).astype(np.float32)
+    X_all[rng.random(X_all.shape) < 0.02] = np.nan  # exercise default (missing) branches
+
+    # Equivalence check first: a fast path that scores differently is useless
+    ref = paths["predict_proba"](X_all)
+    for name, fn in paths.items():
+        diff = float(np.max(np.abs(fn(X_all) - ref)))
+        status = "ok" if diff <= TOLERANCE else "MISMATCH"
+        print(f"  {name:<16} max |dp| = {diff:.2e}  {status}")
+        if diff > TOLERANCE:
+            sys.exit(1)
+
+    print(f"\n{'batch':>7} " + " ".join(f"{name:>18}" for name in paths) + "   (median per call)")
+    for n in BATCH_SIZES:
+        X = X_all[:n]
+        cells = []
+        for fn in paths.values():
+            t = bench(fn, X)
+            cells.append(f"{t * 1e6:>12.1f} us/call" if t < 1e-2 else f"{t * 1e3:>12.2f} ms/call")
+        print(f"{n:>7} " + " ".join(f"{c:>18}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# bench_search_extract.py
+# Search-result extraction backends (search_extract.py) on saved result pages.
+#
+# For every page and backend it checks the full candidate list against the bs4 reference
+# (exit 1 on any difference) and times two cases:
+#   all     extract every candidate on the page
+#   first   stop after 20 candidates, the way fetch_image_urls uses it
+#
+# Pages come from --pages DIR: *.html files whose names start with "bing" or "google", e.g.
+# saved by running the scraper with SCRAPER_SAVE_SEARCH_PAGES=DIR. Without --pages, a
+# synthetic set is generated. It is sized like real result pages (~0.5-1 MB of inline script and
+# page furniture) and salted with the awkward cases: candidates inside scripts and comments, ">" inside
+# attribute values, upper-case and unquoted markup, entities, mad/murl2 fallbacks and broken JSON.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/bench_search_extract.py
+#   python benchmarks/bench_search_extract.py --pages saved_pages/ --json extract.json
+
+import argparse
+import glob
+import html
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))
+
+import search_extract  # noqa: E402
+
+NUM_IMAGES = 20
+
+
+def _script(rng, kb):
+    """Inline JS blob with result-looking markup in strings, which must not be extracted."""
+    decoys = [
+        '"<a class=\\"iusc\\" m=\\"{&quot;murl&quot;:&quot;https://decoy.example/s.jpg&quot;}\\">"',
+        "'<img src=\"https://decoy.example/script.jpg\">'",
+        "x<y&&y>z",
+    ]
+    parts = []
+    while sum(map(len, parts)) < kb * 1024:
+        parts.append(f"var v{rng.randrange(1 << 30)}={json.dumps(rng.random())};"
+                     f"f({rng.choice(decoys)},{rng.randrange(1000)});")
+    return "<script>" + "".join(parts) + "</script>"
+
+
+def _chrome(rng, n):
+    """Page furniture: nested elements with attributes, the bulk of a real results page's markup."""
+    out = []
+    for i in range(n):
+        attrs = f'class="b_{rng.randrange(500)} c{i % 13}" data-tag="{rng.randrange(1 << 20)}" aria-label="item {i}"'
+        out.append(f'<li {attrs}><div class="wrap"><span role="link" tabindex="0">{i} &amp; more</span>'
+                   f'<a href="/search?q={i}&amp;FORM=HDRSC2" h="ID=SERP,{i}">related</a></div></li>')
+    return "<ul>" + "".join(out) + "</ul>"
+
+
+def synthetic_bing(rng, n, script_kb):
+    anchors = []
+    for i in range(n):
+        url = f"https://cdn{i % 7}.example.com/p/{i}.jpg?w=1200&h=800"
+        meta = {"murl": url, "turl": f"https://tse{i % 4 + 1}.mm.bing.net/th?id={i}", "t": f"Part {i} > spec"}
+        kind = i % 9
+        if kind == 1:
+            meta = {"murl2": url}
+        elif kind == 2:
+            anchors.append(f'<a class="iuscp" mad="{html.escape(json.dumps(meta), quote=True)}" href="#">x</a>')
+            continue
+        elif kind == 3:
+            anchors.append(f'<A CLASS="thumb iusc" M=\'{json.dumps(meta)}\' HREF=#>x</A>')
+            continue
+        elif kind == 4:
+            anchors.append('<a class="iusc" m="{not json" href="#">x</a>')
+            continue
+        elif kind == 5:
+            anchors.append(f'<a class="iuscx" m="{html.escape(json.dumps(meta), quote=True)}">not a result</a>')
+            continue
+        elif kind == 6:
+            anchors.append(f'<!-- <a class="iusc" m="{html.escape(json.dumps(meta), quote=True)}"> -->')
+            continue
+        anchors.append(f'<div class="imgpt"><a class="iusc" style="height:180px" '
+                       f'm="{html.escape(json.dumps(meta), quote=True)}" href="/images/search?view=detailV2&amp;id={i}">'
+                       f'<img class="mimg" src="https://tse1.mm.bing.net/th?id={i}" alt="a > b"></a></div>')
+    head = f"<!DOCTYPE html><html><head><style>a.iusc{{color:red}} /* <a class=iusc> */</style>{_script(rng, script_kb)}</head>"
+    body = ("<body>" + _chrome(rng, 400) + _script(rng, script_kb // 4) + "".join(anchors)
+            + _chrome(rng, 800) + _script(rng, script_kb // 2) + "</body></html>")
+    return head + body
+
+
+def synthetic_google(rng, n, script_kb):
+    imgs = []
+    for i in range(n):
+        url = f"https://img{i % 5}.example.net/{i}.png?a=1&amp;b=2"
+        kind = i % 6
+        if kind == 1:
+            imgs.append(f'<img data-src="{url}" src="">')
+        elif kind == 2:
+            imgs.append(f"<IMG SRC={url.replace('&amp;', '&')} ALT=x>")
+        elif kind == 3:
+            imgs.append(f'<img src="data:image/gif;base64,R0lGODlhAQABAAAAACw=" data-src="{url}"/>')
+        elif kind == 4:
+            imgs.append(f'<img alt="x>y" src="https://encrypted-tbn0.gstatic.com/images?q=tbn:{i}">')
+        else:
+            imgs.append(f'<div data-ri="{i}"><img class="rg_i" src="{url}" title=\'"quoted"\'></div>')
+    return (f"<!doctype html><html><head>{_script(rng, script_kb)}</head><body>" + _chrome(rng, 300)
+            + "".join(imgs) + _chrome(rng, 600) + _script(rng, script_kb) + "</body></html>")
+
+
+def load_pages(args):
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            engine = os.path.basename(path).split("-")[0].lower()
+            if engine in ("bing", "google"):
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    pages.append((os.path.basename(path), engine, f.read()))
+        if not pages:
+            raise SystemExit(f"no bing-*.html / google-*.html pages in {args.pages}")
+        return pages
+    rng = random.Random(args.seed)
+    return [
+        ("synthetic bing 150", "bing", synthetic_bing(rng, 150, 300)),
+        ("synthetic bing 35", "bing", synthetic_bing(rng, 35, 500)),
+        ("synthetic google 100", "google", synthetic_google(rng, 100, 250)),
+        ("synthetic google 20", "google", synthetic_google(rng, 20, 400)),
+    ]
+
+
+def extract(engine, text, backend, limit=None):
+    fn = search_extract.bing_image_urls if engine == "bing" else search_extract.google_image_urls
+    out = []
+    for url in fn(text, backend=backend):
+        out.append(url)
+        if limit and len(out) >= limit:
+            break
+    return out
+
+
+def median_time(fn, min_time):
+    fn()
+    times = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time or len(times) < 3:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark search-result extraction backends against the bs4 reference.")
+    ap.add_argument("--pages", default="", help="Directory of saved bing-*.html / google-*.html pages")
+    ap.add_argument("--backends", nargs="+", default=list(search_extract.BACKENDS))
+    ap.add_argument("--min-time", type=float, default=0.5, help="Seconds of timing per page/backend/case")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default="", help="Also write the results here")
+    args = ap.parse_args()
+
+    if search_extract.lxml_html is None and "lxml" in args.backends:
+        print("lxml not installed; skipping the lxml backend")
+        args.backends.remove("lxml")
+
+    pages = load_pages(args)
+    mismatches, results = [], []
+    print(f"{'page':<28}{'KiB':>6}{'cands':>7}  " + "".join(f"{b + ' all':>12}{b + ' first':>13}" for b in args.backends))
+    for name, engine, text in pages:
+        reference = extract(engine, text, "bs4")
+        row = f"{name[:27]:<28}{len(text) / 1024:>6.0f}{len(reference):>7}  "
+        for backend in args.backends:
+            got = extract(engine, text, backend)
+            if got != reference:
+                mismatches.append((name, backend, got, reference))
+            t_all = median_time(lambda: extract(engine, text, backend), args.min_time)
+            t_first = median_time(lambda: extract(engine, text, backend, NUM_IMAGES), args.min_time)
+            results.append({"page": name, "backend": backend, "bytes": len(text), "candidates": len(reference),
+                            "identical": got == reference, "all_s": t_all, "first_s": t_first})
+            row += f"{t_all * 1000:>9.2f} ms{t_first * 1000:>10.2f} ms"
+        print(row)
+
+    for name, backend, got, reference in mismatches:
+        print(f"MISMATCH {backend} on {name}: {len(got)} vs {len(reference)} candidates")
+        for i, (g, r) in enumerate(zip(got + [None] * len(reference), reference + [None] * len(got))):
+            if g != r:
+                print(f"  first difference at {i}: {g!r} != {r!r}")
+                break
+    if not mismatches:
+        print(f"all backends match bs4 on {len(pages)} page(s)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "identical": not mismatches}, f, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+# fake_services.py
+# Local stand-ins for everything the scraper talks to, for offline benchmarks:
+#   GET  /images/search?q=...      Bing image results (a.iusc anchors with murl metadata)
+#   GET  /search?tbm=isch&q=...    Google image results (<img> tags)
+#   GET  /cdn/<query-hash>/<n>.jpg synthetic product images from a fixed corpus
+#   HEAD/PUT /<index>, POST /<index>/_doc, PUT|POST /_bulk, GET /
+#                                  minimal Elasticsearch (counts indexed docs)
+#   GET  /_bench/stats             request/doc counters as JSON
+#
+# Latency and error rates are configurable; everything is seeded so runs are reproducible.
+#
+# Usage (from MotionAppFiles/):
+#   python benchmarks/fake_services.py --port 8099 --search-latency-ms 80 --error-rate 0.02
+# bench_e2e.py starts it as a subprocess with --port 0 and reads the chosen port from stdout.
+
+import argparse
+import hashlib
+import html
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ES_HEADERS = {"X-Elastic-Product": "Elasticsearch", "Content-Type": "application/json"}
+
+
+def make_corpus(size, bad_ratio, seed):
+    """
+    JPEG bytes for `size` synthetic product shots: a textured object on a white background.
+    About `bad_ratio` of them fail a scraper gate (too few bytes or too few pixels).
+    """
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(size):
+        kind = "good"
+        if rng.random() < bad_ratio:
+            kind = "small_bytes" if i % 2 else "small_dims"
+        side = {"good": int(rng.choice([800, 1200, 1600])), "small_dims": 300, "small_bytes": 600}[kind]
+        img = Image.new("RGB", (side, side), (255, 255, 255))
+        if kind != "small_bytes":
+            # noisy object in the middle so the JPEG is product-photo sized
+            obj = side // 2
+            noise = rng.integers(0, 255, (obj, obj, 3), dtype=np.uint8)
+            tint = rng.integers(40, 200, 3, dtype=np.uint8)
+            patch = (noise // 4 + tint).astype(np.uint8)
+            img.paste(Image.fromarray(patch), (side // 4, side // 4))
+            ImageDraw.Draw(img).ellipse([side // 5, side // 5, side // 3, side // 3], fill=tuple(int(t) for t in tint))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=90)
+        corpus.append(buf.getvalue())
+    return corpus
+
+
+class FakeServices:
+    def __init__(self, args):
+        self.args = args
+        self.corpus = make_corpus(args.corpus_size, args.bad_ratio, args.seed)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.stats = {"bing": 0, "google": 0, "images": 0, "image_bytes": 0, "errors": 0, "es_docs": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def delay(self, ms):
+        if ms:
+            with self.lock:
+                factor = self.rng.uniform(0.5, 1.5)
+            time.sleep(ms * factor / 1000.0)
+
+    def fail(self):
+        with self.lock:
+            failed = self.rng.random() < self.args.error_rate
+        if failed:
+            self.count("errors")
+        return failed
+
+    def result_urls(self, base, query):
+        """Deterministic candidate list for a query; site: queries return URLs on that site when it is us."""
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
+        m = re.search(r"site:(\S+)", query)
+        host = base
+        if m and m.group(1) not in base:
+            host = f"http://{m.group(1)}"  # another vendor: candidates the scraper will drop as off-site
+        return [f"{host}/cdn/{digest}/{i}.jpg" for i in range(self.args.results)]
+
+
+def make_handler(svc):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out in separate writes; avoid 40 ms delayed-ACK stalls
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, body=b"", headers=None):
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _es(self, code, obj):
+            self._send(code, json.dumps(obj).encode("utf-8"), ES_HEADERS)
+
+        def _base(self):
+            return f"http://{self.headers.get('Host')}"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query).get("q", [""])[0]
+            if url.path == "/images/search":
+                svc.count("bing")
+                svc.delay(svc.args.search_latency_ms)
+                if svc.fail():
+                    return self._send(503)
+                anchors = "".join(
+                    f'<a class="iusc" m="{html.escape(json.dumps({"murl": u}), quote=True)}" href="#">x</a>'
+                    for u in svc.result_urls(self._base(), query)
+                )
+                return self._send(200, f"<html><body>{anchors}</body></html>".encode(), {"Content-Type": "text/html"})
+            if url.path == "/search":
+                svc.count("google")
+                svc.delay(svc.args.search_latency_ms)
+                if svc.fail():
+                    return self._send(503)
+                imgs = "".join(f'<img src="{u}">' for u in svc.result_urls(self._base(), query))
+                return self._send(200, f"<html><body>{imgs}</body></html>".encode(), {"Content-Type": "text/html"})
+            if url.path.startswith("/cdn/"):
+                svc.count("images")
+                svc.delay(svc.args.image_latency_ms)
+                if svc.fail():
+                    return self._send(503)
+                key = int(hashlib.sha1(url.path.encode()).hexdigest(), 16)
+                body = svc.corpus[key % len(svc.corpus)]
+                if svc.args.unique_images:
+                    # bytes after the JPEG end marker are ignored by decoders but give every URL its own sha256
+                    body = body + url.path.encode()
+                svc.count("image_bytes", len(body))
+                return self._send(200, body, {"Content-Type": "image/jpeg"})
+            if url.path == "/_bench/stats":
+                with svc.lock:
+                    body = json.dumps(svc.stats).encode()
+                return self._send(200, body, {"Content-Type": "application/json"})
+            if url.path == "/":
+                return self._es(200, {"name": "fake", "cluster_name": "bench", "version": {"number": "8.9.0"},
+                                      "tagline": "You Know, for Search"})
+            return self._send(404)
+
+        def do_HEAD(self):
+            # indices.exists
+            self._send(200, b"", ES_HEADERS)
+
+        def _bulk(self, body):
+            svc.delay(svc.args.es_latency_ms)
+            items = []
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+            for action in lines[0::2]:  # action, source, action, source, ...
+                (op, meta), = action.items()
+                svc.count("es_docs")
+                items.append({op: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 201,
+                                   "result": "created"}})
+            self._es(200, {"took": 1, "errors": False, "items": items})
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path.split("?")[0].endswith("/_bulk"):
+                return self._bulk(body)
+            self._es(200, {"acknowledged": True, "index": self.path.strip("/")})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path.split("?")[0].endswith("/_bulk"):
+                return self._bulk(body)
+            svc.delay(svc.args.es_latency_ms)
+            if self.path.split("?")[0].endswith("/_doc"):
+                svc.count("es_docs")
+                with svc.lock:
+                    n = svc.stats["es_docs"]
+                return self._es(201, {"_index": self.path.split("/")[1], "_id": f"bench-{n}", "result": "created",
+                                      "_version": 1})
+            return self._es(404, {"error": "not supported by fake_services"})
+
+    return Handler
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Local fake Bing/Google/image CDN/Elasticsearch for offline benchmarks.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=0, help="0 = pick a free port (printed on stdout)")
+    p.add_argument("--results", type=int, default=8, help="Candidate URLs per search page")
+    p.add_argument("--corpus-size", type=int, default=32)
+    p.add_argument("--bad-ratio", type=float, default=0.25, help="Share of corpus images that fail a size gate")
+    p.add_argument("--unique-images", action=argparse.BooleanOptionalAction, default=True,
+                   help="Give every image URL distinct bytes (defeats the feature store, like real traffic)")
+    p.add_argument("--search-latency-ms", type=float, default=50.0)
+    p.add_argument("--image-latency-ms", type=float, default=20.0)
+    p.add_argument("--es-latency-ms", type=float, default=2.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of search/image requests answered with 503")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    svc = FakeServices(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(svc))
+    server.daemon_threads = True
+    print(f"listening on {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
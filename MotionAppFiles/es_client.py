@@ -0,0 +1,60 @@
+# es_client.py
+# One lazily built Elasticsearch client per process, configured from the environment.
+
+import os
+import threading
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_es():
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from elasticsearch import Elasticsearch
+
+                # for local deployment set ELASTICSEARCH_URL=http://localhost:9200/ and the username/password
+                _client = Elasticsearch(
+                    os.getenv("ELASTICSEARCH_URL"),
+                    basic_auth=(
+                        os.getenv("ELASTICSEARCH_USERNAME", "elastic"),
+                        os.getenv("ELASTICSEARCH_PASSWORD")
+                    ),
+                    verify_certs=True
+                )
+    return _client
+
+
+def iter_pit_pages(es, index, query, batch_size, sort, source=None, keep_alive="5m", search_after=None):
+    """
+    Yield pages of hits for `query` using a point-in-time and search_after.
+    `sort` should end with {"_shard_doc": "asc"} as a tiebreaker.
+    """
+    pit = es.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+    try:
+        while True:
+            body = {
+                "size": batch_size,
+                "query": query,
+                "pit": {"id": pit, "keep_alive": keep_alive},
+                "sort": sort,
+            }
+            if source is not None:
+                body["_source"] = source
+            if search_after is not None:
+                body["search_after"] = search_after
+            resp = es.search(body=body)
+            pit = resp.get("pit_id", pit)
+            hits = resp["hits"]["hits"]
+            if not hits:
+                return
+            yield hits
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(id=pit)
+        except Exception:
+            pass
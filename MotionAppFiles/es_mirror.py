@@ -0,0 +1,356 @@
+# es_mirror.py
+# Local Parquet copy of the image_metadata and feedback indices, kept current incrementally,
+# so training, re-scoring and reporting jobs read from disk instead of scrolling the cluster
+# reviewers are working on.
+#
+# Layout:
+#   <ES_MIRROR_DIR>/<index>/
+#     state.json                      index uuid + per-shard _seq_no watermark
+#     part-20250101T120000123456.parquet
+#     part-...                        one file per synced page (compacted into one past COMPACT_AFTER)
+# Every row carries _id, _shard and _seq_no, the typed columns listed in COLUMNS for the index,
+# and _extra: the rest of the document as JSON (null when there is nothing else).
+#
+# Watermark: _seq_no per shard, not `timestamp`. Feedback docs have no timestamp at all, and
+# the review UI (status) and rescore.py (confidence) update image_metadata docs in place without
+# touching theirs; every index or update operation gets a new _seq_no on its shard. A sync asks
+# each shard for `_seq_no > watermark`, up to the shard's global checkpoint read when the sync
+# starts (operations above it may not be visible everywhere yet and wait for the next sync).
+# Updated docs appear again with a higher _seq_no; readers keep only the latest row per _id.
+# Deletes leave no trace in _seq_no queries: `sync --full` rebuilds from scratch, and a
+# recreated index (new uuid) is rebuilt automatically.
+#
+# Environment:
+#   ES_MIRROR_DIR      mirror root (default ~/ImageScraperFiles/es_mirror)
+#   ES_MIRROR_SETTLE   seconds to wait after reading the checkpoints, so operations at or below
+#                      them have been refreshed (default 1.0, the default refresh_interval)
+#
+# Usage:
+#   python es_mirror.py sync [--index image_metadata --index feedback] [--full]
+#   python es_mirror.py info
+# Readers: load(index, columns) -> DataFrame, iter_hits(index) -> pages of {"_id", "_source"}.
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+if os.name == 'nt':  # Windows
+    _DEFAULT_DIR = os.path.join(os.environ.get("USERPROFILE", "."), "ImageScraperFiles")
+else:  # Unix-like (Linux/Mac)
+    _DEFAULT_DIR = os.path.join(os.environ.get("HOME", "."), "ImageScraperFiles")
+
+MIRROR_DIR = os.getenv("ES_MIRROR_DIR", os.path.join(_DEFAULT_DIR, "es_mirror"))
+SETTLE_SECONDS = float(os.getenv("ES_MIRROR_SETTLE", "1.0"))
+BATCH_SIZE = 2000
+COMPACT_AFTER = 32
+COMPRESSION = "zstd"
+STATE_FILE = "state.json"
+EXTRA_COLUMN = "_extra"
+META_COLUMNS = ["_id", "_shard", "_seq_no"]
+
+# Typed columns per index; anything else in a document is kept in _extra.
+# Timestamps stay strings: the scraper writes naive isoformat, the UI UTC with "Z".
+COLUMNS = {
+    "image_metadata": {
+        "sku_number": "string",
+        "item_number": "string",
+        "manufacturer": "category",
+        "part_number": "string",
+        "description": "string",
+        "image_url": "string",
+        "image_sha256": "string",
+        "status": "category",
+        "confidence": "float32",
+        "model_version": "category",
+        "timestamp": "string",
+        "updated_at": "string",
+        "updated_by": "string",
+        "rescored_at": "string",
+    },
+    "feedback": {
+        "original_id": "string",
+        "[<ID>]": "string",
+        "MFR_NAME": "category",
+        "ENTERPRISE": "category",
+        "PRIMARY_IMAGE": "string",
+        "Label": "int8",
+        "rejection_comment": "string",
+    },
+}
+INDICES = list(COLUMNS)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("the ES mirror needs pyarrow (pip install pyarrow)")
+
+
+def _arrow_type(kind):
+    return {
+        "string": pa.string(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "float32": pa.float32(),
+        "int8": pa.int8(),
+    }[kind]
+
+
+def schema(index):
+    _require_pyarrow()
+    return pa.schema(
+        [pa.field("_id", pa.string()), pa.field("_shard", pa.int16()), pa.field("_seq_no", pa.int64())]
+        + [pa.field(name, _arrow_type(kind)) for name, kind in COLUMNS[index].items()]
+        + [pa.field(EXTRA_COLUMN, pa.string())]
+    )
+
+
+def index_dir(index, mirror_dir=None):
+    return os.path.join(mirror_dir or MIRROR_DIR, index)
+
+
+# === Conversion ===
+def _coerce(value, kind):
+    if value is None or value == "":
+        return None
+    try:
+        if kind == "float32":
+            return float(value)
+        if kind == "int8":
+            return int(float(value))
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+
+def hits_to_table(index, hits, shard):
+    """Arrow table for one page of hits from `shard` (hits must carry _seq_no)."""
+    columns = COLUMNS[index]
+    data = {"_id": [], "_shard": [], "_seq_no": [], EXTRA_COLUMN: []}
+    data.update({name: [] for name in columns})
+    for hit in hits:
+        src = hit.get("_source") or {}
+        data["_id"].append(hit["_id"])
+        data["_shard"].append(shard)
+        data["_seq_no"].append(hit["_seq_no"])
+        for name, kind in columns.items():
+            data[name].append(_coerce(src.get(name), kind))
+        extra = {k: v for k, v in src.items() if k not in columns}
+        data[EXTRA_COLUMN].append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return pa.Table.from_pydict(data, schema=schema(index))
+
+
+# === State + files ===
+def read_state(index, mirror_dir=None):
+    path = os.path.join(index_dir(index, mirror_dir), STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_state(index, state, mirror_dir=None):
+    path = os.path.join(index_dir(index, mirror_dir), STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def files(index, mirror_dir=None):
+    d = index_dir(index, mirror_dir)
+    if not os.path.isdir(d):
+        return []
+    return [os.path.join(d, f) for f in sorted(os.listdir(d)) if f.endswith(".parquet")]
+
+
+def available(index, mirror_dir=None):
+    """True once `index` has been synced at least once."""
+    return pa is not None and bool(read_state(index, mirror_dir).get("synced_at"))
+
+
+def _write_part(index, table, mirror_dir=None):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(index_dir(index, mirror_dir), f"part-{stamp}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, path)  # readers only ever see complete files
+    return path
+
+
+# === Sync ===
+def _shard_checkpoints(es, index):
+    """(index uuid, {shard: global checkpoint}) from the primaries' shard stats."""
+    stats = es.indices.stats(index=index, level="shards", metric="docs")
+    indices = stats["indices"]
+    if len(indices) != 1:
+        raise SystemExit(f"{index} resolves to {len(indices)} indices; mirror one concrete index at a time")
+    (entry,) = indices.values()
+    checkpoints = {}
+    for shard, copies in entry["shards"].items():
+        primary = next((c for c in copies if (c.get("routing") or {}).get("primary")), copies[0])
+        checkpoints[int(shard)] = int(primary["seq_no"]["global_checkpoint"])
+    return entry.get("uuid"), checkpoints
+
+
+def sync(es, index, mirror_dir=None, full=False, batch_size=BATCH_SIZE, log=print):
+    """
+    Pull every operation on `index` since the last sync into new Parquet files.
+    Returns the number of rows written.
+    """
+    _require_pyarrow()
+    if index not in COLUMNS:
+        raise SystemExit(f"no mirror schema for {index!r} (known: {', '.join(INDICES)})")
+    d = index_dir(index, mirror_dir)
+    uuid, checkpoints = _shard_checkpoints(es, index)
+    state = {} if full else read_state(index, mirror_dir)
+    if state and state.get("index_uuid") != uuid:
+        log(f"[mirror] {index} was recreated (uuid {state.get('index_uuid')} -> {uuid}); rebuilding")
+        state = {}
+    if not state:
+        shutil.rmtree(d, ignore_errors=True)
+        state = {"index_uuid": uuid, "shards": {}}
+    os.makedirs(d, exist_ok=True)
+
+    watermarks = {int(k): v for k, v in state["shards"].items()}
+    if any(cp > watermarks.get(shard, -1) for shard, cp in checkpoints.items()) and SETTLE_SECONDS > 0:
+        time.sleep(SETTLE_SECONDS)
+
+    written = 0
+    for shard, checkpoint in sorted(checkpoints.items()):
+        wm = watermarks.get(shard, -1)
+        while wm < checkpoint:
+            resp = es.search(
+                index=index,
+                preference=f"_shards:{shard}",
+                body={
+                    "size": batch_size,
+                    "query": {"range": {"_seq_no": {"gt": wm, "lte": checkpoint}}},
+                    "sort": [{"_seq_no": "asc"}],
+                    "seq_no_primary_term": True,
+                },
+            )
+            hits = resp["hits"]["hits"]
+            if not hits:
+                break
+            _write_part(index, hits_to_table(index, hits, shard), mirror_dir)
+            written += len(hits)
+            wm = hits[-1]["_seq_no"]
+            # The file is on disk before the watermark moves: a crash in between only
+            # re-reads this page next time, and readers drop the duplicate rows
+            state["shards"][str(shard)] = wm
+            _write_state(index, state, mirror_dir)
+
+    state["synced_at"] = datetime.now(timezone.utc).isoformat()
+    _write_state(index, state, mirror_dir)
+    if len(files(index, mirror_dir)) > COMPACT_AFTER:
+        compact(index, mirror_dir)
+    log(f"[mirror] {index}: {written} new row(s), watermarks {state['shards']}")
+    return written
+
+
+def compact(index, mirror_dir=None):
+    """Rewrite the mirror of `index` as one file holding only the latest row per _id."""
+    old = files(index, mirror_dir)
+    if len(old) < 2:
+        return None
+    table = pa.Table.from_pandas(load(index, mirror_dir=mirror_dir, extra=True), schema=schema(index),
+                                 preserve_index=False)
+    path = _write_part(index, table, mirror_dir)
+    for p in old:
+        os.remove(p)
+    return path
+
+
+# === Readers ===
+def load(index, columns=None, mirror_dir=None, extra=False):
+    """
+    DataFrame with the latest version of every mirrored document: _id plus `columns` (all typed
+    columns by default; _extra too with extra=True), ordered by shard and _seq_no.
+    """
+    _require_pyarrow()
+    import pandas as pd
+
+    wanted = list(columns) if columns is not None else list(COLUMNS[index])
+    if extra and EXTRA_COLUMN not in wanted:
+        wanted.append(EXTRA_COLUMN)
+    read = META_COLUMNS + [c for c in wanted if c not in META_COLUMNS]
+    paths = files(index, mirror_dir)
+    if not paths:
+        return pd.DataFrame({c: pd.Series(dtype="object") for c in read})
+    table = pa.concat_tables([pq.read_table(p, columns=read, schema=schema(index)) for p in paths])
+    df = table.unify_dictionaries().to_pandas()
+    df = df.sort_values(["_shard", "_seq_no"], kind="stable").drop_duplicates("_id", keep="last")
+    return df.reset_index(drop=True)
+
+
+def iter_hits(index, columns=None, mirror_dir=None, batch_size=BATCH_SIZE, df=None):
+    """
+    Yield pages of ES-style hits ({"_id", "_source"}) from the mirror, or from `df` (a
+    load() result the caller has already filtered). Null fields are left out of _source,
+    as they would be in the original document.
+    """
+    if df is None:
+        df = load(index, columns, mirror_dir, extra=columns is None)
+    fields = [c for c in df.columns if c not in META_COLUMNS]
+    records = df[["_id"] + fields].astype(object).where(df[["_id"] + fields].notna(), None)
+    for start in range(0, len(records), batch_size):
+        page = []
+        for row in records.iloc[start:start + batch_size].itertuples(index=False, name=None):
+            src = {k: v for k, v in zip(fields, row[1:]) if v is not None and k != EXTRA_COLUMN}
+            if EXTRA_COLUMN in fields and row[1 + fields.index(EXTRA_COLUMN)]:
+                src.update(json.loads(row[1 + fields.index(EXTRA_COLUMN)]))
+            page.append({"_id": row[0], "_source": src})
+        yield page
+
+
+def info(index, mirror_dir=None):
+    paths = files(index, mirror_dir)
+    rows = sum(pq.ParquetFile(p).metadata.num_rows for p in paths)
+    size = sum(os.path.getsize(p) for p in paths) / 2**20
+    return {"files": len(paths), "rows": rows, "mib": size, **read_state(index, mirror_dir)}
+
+
+def main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Mirror Elasticsearch indices to local Parquet.")
+    ap.add_argument("--dir", default=MIRROR_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("sync", help="Pull new and updated documents since the last sync")
+    s.add_argument("--index", action="append", choices=INDICES, help="Repeatable (default: all)")
+    s.add_argument("--full", action="store_true", help="Drop the local copy and rebuild (picks up deletes)")
+    s.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    s.add_argument("--compact", action="store_true", help="Compact to one file afterwards")
+    i = sub.add_parser("info", help="Files, rows (before de-duplication) and watermarks")
+    i.add_argument("--index", action="append", choices=INDICES)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "sync":
+        from es_client import get_es
+
+        es = get_es()
+        for index in args.index or INDICES:
+            start = time.perf_counter()
+            sync(es, index, args.dir, full=args.full, batch_size=args.batch_size)
+            if args.compact:
+                compact(index, args.dir)
+            print(f"{index}: synced in {time.perf_counter() - start:.1f} s")
+        return
+
+    for index in args.index or INDICES:
+        s = info(index, args.dir)
+        print(f"{index}: {s['rows']} rows in {s['files']} file(s), {s['mib']:.1f} MiB, "
+              f"synced {s.get('synced_at') or 'never'}, watermarks {s.get('shards') or {}}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+# es_spool.py
+# Disk-backed write-ahead spool for Elasticsearch index writes.
+#
+# index_image_metadata appends each document to a local append-only file and returns; a
+# background thread replays the file to ES with _bulk. When the cluster is slow or down the
+# scraper keeps going at full speed and the documents wait on disk instead of being dropped.
+#
+# Layout (one writer per process, so appends need no cross-process locking):
+#   <SCRAPER_ES_SPOOL_DIR>/
+#     20250101T120000123456-<host>-<pid>-<rand>.open    segment being appended to
+#     20250101T115930000000-<host>-<pid>-<rand>.jsonl   sealed segment, waiting for replay
+#     <segment>.pos                                     bytes of the segment already in ES
+#     dead.jsonl                                        documents ES refused (mapping errors, ...)
+# One line per document: {"index", "id", "doc"}. The _id is chosen when the line is written and
+# replay uses op_type=create, so sending a line twice (a crash between _bulk and the .pos
+# update, two processes replaying one orphan) is answered with 409 and changes nothing. In
+# particular a replay never resets a document a reviewer has already approved back to pending.
+#
+# Replay: _bulk batches of up to SCRAPER_ES_SPOOL_BULK lines, in file order. A 429 / 5xx /
+# connection error stops the pass, halves the batch size and backs off exponentially (up to
+# BACKOFF_MAX); successes grow the batch back. Documents refused one by one with 429 / 5xx are
+# appended to the spool again. Only errors ES will never accept (4xx other than 409 / 429) go
+# to dead.jsonl. A 400 / 413 for the whole request (one malformed document, too large a body)
+# halves the batch until the offending line is alone; that line goes to dead.jsonl and replay
+# moves past it. Any other whole-request failure (401 / 403 from expired credentials, 404, ...)
+# says nothing about the documents, so it stops the pass and backs off like a 5xx. The active segment is sealed at SEGMENT_BYTES or after
+# ROTATE_SECONDS, and a segment is deleted once it has been replayed to the end.
+# Segments left behind by a process that died (nothing appended or replayed for STALE_SECONDS)
+# are adopted by the next spool that looks, or by `python es_spool.py drain`.
+#
+# Environment:
+#   SCRAPER_ES_SPOOL_DIR    spool directory (default ~/ImageScraperFiles/es_spool; "" writes straight to ES)
+#   SCRAPER_ES_SPOOL_BULK   documents per _bulk request (default 500)
+#   SCRAPER_ES_SPOOL_FSYNC  fsync every append (default 1; 0 trades durability on power loss for speed)
+#
+# Usage:
+#   python es_spool.py inspect [--dead 20]
+#   python es_spool.py drain [--timeout 600]
+
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+if os.name == 'nt':  # Windows
+    _DEFAULT_DIR = os.path.join(os.environ.get("USERPROFILE", "."), "ImageScraperFiles")
+else:  # Unix-like (Linux/Mac)
+    _DEFAULT_DIR = os.path.join(os.environ.get("HOME", "."), "ImageScraperFiles")
+
+SPOOL_DIR = os.getenv("SCRAPER_ES_SPOOL_DIR", os.path.join(_DEFAULT_DIR, "es_spool"))
+BULK_DOCS = int(os.getenv("SCRAPER_ES_SPOOL_BULK", "500"))
+FSYNC = os.getenv("SCRAPER_ES_SPOOL_FSYNC", "1") != "0"
+SEGMENT_BYTES = 8 << 20
+ROTATE_SECONDS = 30.0
+STALE_SECONDS = 300.0
+POLL_SECONDS = 1.0
+BACKOFF_MIN = 0.5
+BACKOFF_MAX = 60.0
+MIN_BULK_DOCS = 10
+PAYLOAD_STATUSES = (400, 413)  # whole-request errors caused by what was sent
+DEAD_FILE = "dead.jsonl"
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".jsonl"
+POS_SUFFIX = ".pos"
+
+
+class TransientError(Exception):
+    """ES can't take the batch right now (429, 5xx, unreachable); retry later."""
+
+
+class RejectedError(Exception):
+    """ES refused the whole request for its content (400, 413); sending it unchanged won't help."""
+
+
+def _json_default(o):
+    return o.isoformat() if hasattr(o, "isoformat") else str(o)
+
+
+def _count(outcome, n=1):
+    import scraper_metrics as metrics
+
+    metrics.INDEX_DOCS.inc(n, outcome=outcome)
+
+
+class Spool:
+    def __init__(self, directory=SPOOL_DIR, bulk_docs=BULK_DOCS, fsync=FSYNC):
+        self.dir = directory
+        self.bulk_docs = bulk_docs
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        host = re.sub(r"[^A-Za-z0-9_.-]", "_", socket.gethostname())
+        self.token = f"{host}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()       # the active segment
+        self._replay_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._active = None                 # (base, file object, opened at)
+        self._owned = []                    # bases this spool replays, oldest first
+        self._ensured = set()               # indices known to exist
+        self._batch = bulk_docs
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self.last_error = None
+
+    # === Files ===
+    def _base_path(self, base):
+        return os.path.join(self.dir, base)
+
+    def _segment_path(self, base):
+        sealed = self._base_path(base) + SEALED_SUFFIX
+        return sealed if os.path.exists(sealed) else self._base_path(base) + OPEN_SUFFIX
+
+    def _read_pos(self, base):
+        try:
+            with open(self._base_path(base) + POS_SUFFIX, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_pos(self, base, offset):
+        path = self._base_path(base) + POS_SUFFIX
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(path + ".tmp", path)
+
+    def _remove(self, base):
+        for suffix in (SEALED_SUFFIX, OPEN_SUFFIX, POS_SUFFIX):
+            try:
+                os.remove(self._base_path(base) + suffix)
+            except FileNotFoundError:
+                pass
+
+    def segments(self):
+        """[(base, path, sealed)] for every segment in the directory, oldest first."""
+        out = []
+        for name in sorted(os.listdir(self.dir)):
+            for suffix in (SEALED_SUFFIX, OPEN_SUFFIX):
+                if name.endswith(suffix) and name != DEAD_FILE:
+                    out.append((name[:-len(suffix)], os.path.join(self.dir, name), suffix == SEALED_SUFFIX))
+        return out
+
+    # === Writing ===
+    def append(self, index, doc, doc_id=None):
+        """Durably queue one document for `index`; returns the _id it will have in ES."""
+        doc_id = doc_id or uuid.uuid4().hex
+        line = json.dumps({"index": index, "id": doc_id, "doc": doc}, default=_json_default,
+                          ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._active is None:
+                base = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{self.token}"
+                self._active = (base, open(self._base_path(base) + OPEN_SUFFIX, "ab"), time.monotonic())
+                self._owned.append(base)
+            base, f, _ = self._active
+            f.write(line.encode("utf-8"))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            if f.tell() >= SEGMENT_BYTES:
+                self._seal_locked()
+        self._wake.set()
+        return doc_id
+
+    def _seal_locked(self):
+        base, f, _ = self._active
+        f.close()
+        os.replace(self._base_path(base) + OPEN_SUFFIX, self._base_path(base) + SEALED_SUFFIX)
+        self._active = None
+
+    def maybe_rotate(self, force=False):
+        with self._lock:
+            if self._active is not None and (force or time.monotonic() - self._active[2] >= ROTATE_SECONDS):
+                self._seal_locked()
+
+    def adopt_orphans(self, stale_seconds=STALE_SECONDS):
+        """
+        Take over other spools' segments that nobody has touched for `stale_seconds` (usually:
+        their process died). An .open segment always needs STALE_SECONDS: a live writer seals
+        its own within ROTATE_SECONDS, so an older one has no writer left. Returns how many.
+        """
+        now = time.time()
+        adopted = 0
+        with self._lock:
+            owned = set(self._owned)
+        for base, path, sealed in self.segments():
+            if base in owned:
+                continue
+            try:
+                pos_path = self._base_path(base) + POS_SUFFIX
+                last = max(os.path.getmtime(path), os.path.getmtime(pos_path) if os.path.exists(pos_path) else 0)
+            except FileNotFoundError:
+                continue  # replayed and removed meanwhile
+            if now - last < (stale_seconds if sealed else max(stale_seconds, STALE_SECONDS)):
+                continue
+            if not sealed:
+                try:
+                    os.replace(path, self._base_path(base) + SEALED_SUFFIX)  # its writer is gone
+                except FileNotFoundError:
+                    continue
+            self._write_pos(base, self._read_pos(base))  # fresh mtime: other spools leave it alone
+            with self._lock:
+                self._owned.append(base)
+                self._owned.sort()  # bases start with their creation time
+            adopted += 1
+        return adopted
+
+    # === Replay ===
+    def _ensure_index(self, es, index):
+        if index in self._ensured:
+            return
+        if not es.indices.exists(index=index):
+            es.indices.create(index=index, ignore=400)
+        self._ensured.add(index)
+
+    def _send(self, es, lines):
+        """
+        Bulk-create `lines`. Raises TransientError if the request failed as a whole and may
+        succeed later, RejectedError if it never will as it stands; documents
+        refused one by one with 429 / 5xx are appended again (same _id) and counted in the result.
+        Returns (sent, requeued, throttled).
+        """
+        records, ops = [], []
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                self._dead({"line": line.decode("utf-8", "replace")}, f"unreadable spool line: {e}")
+                continue
+            records.append(rec)
+            ops.append({"create": {"_index": rec["index"], "_id": rec["id"]}})
+            ops.append(rec["doc"])
+        if not records:
+            return 0, 0, False
+        try:
+            for index in {r["index"] for r in records}:
+                self._ensure_index(es, index)
+        except Exception as e:
+            raise TransientError(f"{type(e).__name__}: {e}") from e
+        try:
+            resp = es.bulk(operations=ops)
+        except Exception as e:
+            status = getattr(e, "status_code", None) or getattr(getattr(e, "meta", None), "status", None)
+            if status in PAYLOAD_STATUSES:
+                raise RejectedError(f"{type(e).__name__}: {e}") from e
+            raise TransientError(f"{type(e).__name__}: {e}") from e
+
+        items = resp.get("items") or []
+        if len(items) != len(records):
+            raise TransientError(f"_bulk answered {len(items)} items for {len(records)} documents")
+        ok = retry = 0
+        throttled = False
+        for rec, item in zip(records, items):
+            result = item.get("create") or next(iter(item.values()), {})
+            status = result.get("status", 500)
+            if status < 300 or status == 409:
+                ok += 1
+            elif status == 429 or status >= 500:
+                self.append(rec["index"], rec["doc"], doc_id=rec["id"])
+                retry += 1
+                throttled |= status == 429
+            else:
+                self._dead(rec, result.get("error"))
+        _count("ok", ok)
+        if retry:
+            _count("retry", retry)
+        return ok, retry, throttled
+
+    def _dead(self, record, error):
+        _count("error")
+        with open(os.path.join(self.dir, DEAD_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"record": record, "error": error, "at": datetime.now(timezone.utc).isoformat()},
+                               default=_json_default) + "\n")
+
+    def _replay_segment(self, es, base):
+        """Send what's left of one segment. True once it is sealed and fully replayed (and removed)."""
+        offset = self._read_pos(base)
+        for _ in range(2):  # the writer may seal it (.open -> .jsonl) between the two calls
+            path = self._segment_path(base)
+            try:
+                f = open(path, "rb")
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            return True  # replayed and removed by another spool
+        sealed = path.endswith(SEALED_SUFFIX)
+        with f:
+            f.seek(offset)
+            while True:
+                lines, size = [], 0
+                while len(lines) < self._batch:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        if line and sealed:
+                            # a torn final line: the writer died mid-append, before returning
+                            size += len(line)
+                        break
+                    lines.append(line)
+                    size += len(line)
+                if not lines and not size:
+                    break
+                try:
+                    sent, retry, throttled = self._send(es, lines)
+                except RejectedError as e:
+                    if len(lines) > 1:
+                        # split until the line that spoils the request is on its own
+                        self._batch = max(1, len(lines) // 2)
+                        f.seek(offset)
+                        continue
+                    self._dead(json.loads(lines[0]), str(e))
+                    sent, retry, throttled = 0, 0, False
+                offset += size
+                self._write_pos(base, offset)
+                if retry:
+                    raise TransientError(f"{retry} of {sent + retry} documents {'throttled' if throttled else 'failed'}")
+                self._batch = min(self.bulk_docs, self._batch * 2)
+            end = os.fstat(f.fileno()).st_size
+        if sealed and offset >= end:
+            self._remove(base)
+            return True
+        return False
+
+    def replay(self, es):
+        """One pass over every owned segment, oldest first. Returns True when nothing is left."""
+        with self._replay_lock:
+            with self._lock:
+                owned = list(self._owned)
+            done = []
+            try:
+                for base in owned:
+                    if self._replay_segment(es, base):
+                        done.append(base)
+            finally:
+                with self._lock:
+                    self._owned = [b for b in self._owned if b not in done]
+            self._backoff = 0.0
+            self.last_error = None
+            with self._lock:
+                return not self._owned
+
+    def _replay_with_backoff(self, es):
+        try:
+            return self.replay(es)
+        except TransientError as e:
+            self._batch = max(MIN_BULK_DOCS, self._batch // 2)
+            self.last_error = str(e)
+        except Exception as e:
+            from scraper_logging import log_err
+            log_err(f"[spool] replay failed: {e}")
+            self.last_error = str(e)
+        self._backoff = min(BACKOFF_MAX, max(BACKOFF_MIN, self._backoff * 2))
+        self._retry_at = time.monotonic() + self._backoff
+        return False
+
+    def _run(self, get_es):
+        last_adopt = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            self.maybe_rotate()
+            if time.monotonic() - last_adopt >= STALE_SECONDS / 2:
+                self.adopt_orphans()
+                last_adopt = time.monotonic()
+            if time.monotonic() < self._retry_at:
+                continue
+            try:
+                es = get_es()
+            except Exception as e:
+                self.last_error = str(e)
+                continue
+            self._replay_with_backoff(es)
+
+    def start(self, get_es=None):
+        """Replay in a daemon thread until close()."""
+        if get_es is None:
+            from es_client import get_es
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(get_es,), name="es-spool", daemon=True)
+            self._thread.start()
+        return self
+
+    def drain(self, es, timeout=None, adopt_all=False):
+        """
+        Seal the active segment and replay until the spool is empty or `timeout` runs out.
+        adopt_all also takes every other segment in the directory, live writers' included
+        (safe: sealed segments are never appended to, and re-sent lines get 409). True when empty.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.adopt_orphans(stale_seconds=0 if adopt_all else STALE_SECONDS)
+        while True:
+            self.maybe_rotate(force=True)
+            if self._replay_with_backoff(es):
+                return True
+            wait = max(0.05, self._retry_at - time.monotonic())
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                return False
+            time.sleep(wait)
+
+    def close(self, timeout=10.0):
+        """Stop the replay thread and try for `timeout` s to empty the spool; whatever is left stays on disk."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.maybe_rotate(force=True)
+        if timeout:
+            try:
+                from es_client import get_es
+                self.drain(get_es(), timeout)
+            except Exception as e:
+                self.last_error = str(e)
+
+    def stats(self):
+        segs = self.segments()
+        pending = 0
+        for base, path, _ in segs:
+            try:
+                pending += os.path.getsize(path) - self._read_pos(base)
+            except FileNotFoundError:
+                pass
+        return {"segments": len(segs), "pending_bytes": pending, "dead": len(self.dead_letters()),
+                "last_error": self.last_error}
+
+    def dead_letters(self):
+        path = os.path.join(self.dir, DEAD_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def requeue_dead(self):
+        """Move dead letters back into a sealed segment (after fixing the mapping, say). Returns how many."""
+        path = os.path.join(self.dir, DEAD_FILE)
+        records = [d["record"] for d in self.dead_letters() if "index" in d.get("record", {})]
+        for rec in records:
+            self.append(rec["index"], rec["doc"], doc_id=rec["id"])
+        self.maybe_rotate(force=True)
+        if os.path.exists(path):
+            os.remove(path)
+        return len(records)
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """The process-wide spool with its replay thread running; None when SCRAPER_ES_SPOOL_DIR is ""."""
+    global _spool
+    if _spool is None and SPOOL_DIR:
+        with _spool_lock:
+            if _spool is None:
+                try:
+                    _spool = Spool(SPOOL_DIR).start()
+                except Exception as e:
+                    from scraper_logging import log_err
+                    log_err(f"ES spool disabled ({SPOOL_DIR}): {e}")
+                    _spool = False
+    return _spool or None
+
+
+def main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Inspect or drain the Elasticsearch write spool.")
+    ap.add_argument("--dir", default=SPOOL_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("inspect", help="Segments, pending documents and dead letters")
+    i.add_argument("--dead", type=int, default=0, help="Also print the last N dead letters")
+    d = sub.add_parser("drain", help="Replay every segment in the directory to Elasticsearch")
+    d.add_argument("--timeout", type=float, default=None, help="Give up after this many seconds (default: never)")
+    d.add_argument("--requeue-dead", action="store_true", help="Retry the dead letters too")
+    args = ap.parse_args(argv)
+    if not args.dir:
+        raise SystemExit("SCRAPER_ES_SPOOL_DIR is empty: the spool is disabled")
+
+    spool = Spool(args.dir)
+    if args.cmd == "drain":
+        from es_client import get_es
+
+        if args.requeue_dead:
+            print(f"{spool.requeue_dead()} dead letter(s) requeued")
+        before = spool.stats()
+        start = time.perf_counter()
+        empty = spool.drain(get_es(), timeout=args.timeout, adopt_all=True)
+        after = spool.stats()
+        print(f"{before['pending_bytes'] - after['pending_bytes']} bytes replayed in {time.perf_counter() - start:.1f} s; "
+              f"{after['segments']} segment(s) / {after['pending_bytes']} bytes left, {after['dead']} dead letter(s)"
+              + ("" if empty else f"; last error: {spool.last_error}"))
+        raise SystemExit(0 if empty else 1)
+
+    now = time.time()
+    lines = 0
+    print(f"{'segment':<64}{'bytes':>10}{'sent':>10}{'docs left':>10}{'age s':>8}")
+    for base, path, sealed in spool.segments():
+        try:
+            size, pos = os.path.getsize(path), spool._read_pos(base)
+            with open(path, "rb") as f:
+                f.seek(pos)
+                left = sum(1 for line in f if line.endswith(b"\n"))
+            age = now - os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+        lines += left
+        print(f"{os.path.basename(path)[:63]:<64}{size:>10}{pos:>10}{left:>10}{age:>8.0f}")
+    stats = spool.stats()
+    print(f"{stats['segments']} segment(s), {lines} document(s) / {stats['pending_bytes']} bytes waiting, "
+          f"{stats['dead']} dead letter(s)")
+    for d in spool.dead_letters()[-args.dead:] if args.dead else []:
+        rec = d.get("record") or {}
+        print(f"  {d.get('at')}  {rec.get('index')}/{rec.get('id')}: {json.dumps(d.get('error'))[:200]}")
+
+
+if __name__ == "__main__":
+    main()
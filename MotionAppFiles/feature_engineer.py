@@ -13,6 +13,10 @@ WHITE_RGB_MIN = 200   # optional extra guard: each RGB channel fairly high
 ALPHA_VISIBLE_MIN = 250  # for PNGs: treat alpha >= 250 as visible pixel
 BORDER_FRAC = 0.05    # examine a 5% border band for WhiteBorderRatio
 
+# Bump whenever analyze_image output changes so stale cached features are not reused.
+# Must match MLModel/feature_engineer.py while both copies compute the same values.
+FEATURE_VERSION = "1"
+
 def compute_filename_features(filename, manufacturer):
     """Compute string similarity features from filename."""
     fname = os.path.splitext(os.path.basename(filename))[0].lower()
@@ -0,0 +1,143 @@
+# feature_store.py
+# Persistent cache of image features keyed by the sha256 of the image bytes
+# and the feature-extractor version. Shared by the scraper, process_feedback.py
+# and MLModel/feature_engineer.py so each image is analyzed at most once.
+
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Sequence, Tuple
+
+# Order matches the tuple returned by feature_engineer.analyze_image
+FEATURE_NAMES = ("Resolution", "Entropy", "Sharpness", "Brightness", "WhiteRatio", "WhiteBorderRatio")
+
+if os.name == 'nt':  # Windows
+    _DEFAULT_DIR = os.path.join(os.environ.get("USERPROFILE", "."), "ImageScraperFiles")
+else:  # Unix-like (Linux/Mac)
+    _DEFAULT_DIR = os.path.join(os.environ.get("HOME", "."), "ImageScraperFiles")
+
+DEFAULT_STORE_PATH = os.getenv("FEATURE_STORE_PATH", os.path.join(_DEFAULT_DIR, "feature_store.sqlite"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    sha256            TEXT NOT NULL,
+    version           TEXT NOT NULL,
+    resolution        REAL,
+    entropy           REAL,
+    sharpness         REAL,
+    brightness        REAL,
+    white_ratio       REAL,
+    white_border_ratio REAL,
+    created_at        REAL NOT NULL,
+    PRIMARY KEY (sha256, version)
+)
+"""
+
+Features = Tuple[Optional[float], ...]
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class FeatureStore:
+    """
+    SQLite-backed feature cache. One row per (sha256, version).
+    Safe to share between threads; SQLite handles cross-process locking.
+    """
+
+    def __init__(self, version: str, path: str = DEFAULT_STORE_PATH):
+        self.version = str(version)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sha256: str) -> Optional[Features]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio "
+                "FROM features WHERE sha256 = ? AND version = ?",
+                (sha256, self.version),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def get_many(self, sha256s: Sequence[str]) -> dict:
+        """Bulk lookup; returns {sha256: features} for the hashes present in the store."""
+        out = {}
+        keys = list(dict.fromkeys(sha256s))
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT sha256, resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio "
+                    f"FROM features WHERE version = ? AND sha256 IN ({marks})",
+                    (self.version, *chunk),
+                ).fetchall()
+                for row in rows:
+                    out[row[0]] = tuple(row[1:])
+        return out
+
+    def put(self, sha256: str, features: Features) -> None:
+        if len(features) != len(FEATURE_NAMES):
+            raise ValueError(f"expected {len(FEATURE_NAMES)} features, got {len(features)}")
+        values = tuple(None if v is None else float(v) for v in features)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, self.version, *values, time.time()),
+            )
+            self._conn.commit()
+
+    def get_or_compute(
+        self,
+        image_path: str,
+        compute: Callable[[str], Features],
+        sha256: Optional[str] = None,
+    ) -> Features:
+        """
+        Return cached features for the image at `image_path`, computing and storing them on a miss.
+        Pass `sha256` when the caller already hashed the bytes (e.g. while downloading).
+        Results containing None are returned but not cached, so failures get retried.
+        """
+        if sha256 is None:
+            sha256 = sha256_file(image_path)
+        cached = self.get(sha256)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        features = compute(image_path)
+        if features is not None and None not in features:
+            self.put(sha256, features)
+        return features
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = [
+    "FEATURE_NAMES",
+    "DEFAULT_STORE_PATH",
+    "FeatureStore",
+    "sha256_file",
+    "sha256_bytes",
+]
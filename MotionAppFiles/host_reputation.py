@@ -0,0 +1,303 @@
+# host_reputation.py
+# Per-host reputation built from reviewer feedback and the scraper's own download history.
+#
+# Two tables in a local SQLite file:
+#   observations  one row per candidate the scraper tried: host, accepted (passed every gate),
+#                 download latency, bytes. Appended by download_images, one transaction per SKU.
+#   hosts         the rebuilt reputation: approval rate from the `feedback` index (Label on
+#                 PRIMARY_IMAGE), yield (accepted / tried) and median latency from the
+#                 observations of the last SCRAPER_HOST_WINDOW_DAYS, and a combined score.
+# `python host_reputation.py rebuild` recomputes `hosts` (run it from cron, e.g. nightly);
+# the scraper only reads it, re-reading the file when it changes.
+#
+# score = smoothed approval rate x smoothed yield. Both rates are pulled towards a neutral prior
+# (PRIOR_RATE, weight PRIOR_WEIGHT), so a host with two rejected images isn't condemned yet.
+# A host is "poor" once it has at least MIN_EVIDENCE labels + tries and a score below POOR_SCORE.
+#
+# How the scraper uses it:
+#   order_hosts       context hosts of the same tier (OEM / Enterprise / Distributor) are tried
+#                     best score first, then fastest; the order of the tiers themselves is kept
+#   apply             candidates from poor hosts move behind everyone else, and at most
+#                     POOR_HOST_CAP of them are kept per poor host
+#
+# Environment:
+#   SCRAPER_HOST_REPUTATION_PATH  SQLite file (default ~/ImageScraperFiles/host_reputation.sqlite; "" disables)
+#   SCRAPER_HOST_MIN_EVIDENCE     default 10
+#   SCRAPER_HOST_POOR_SCORE       default 0.1
+#   SCRAPER_HOST_POOR_CAP         candidates kept per poor host (default 1; 0 drops them all)
+#   SCRAPER_HOST_WINDOW_DAYS      observations older than this are ignored and pruned (default 90)
+#
+# Usage:
+#   python host_reputation.py rebuild [--data ../MLModel/Output/dataset]
+#   python host_reputation.py show [--worst 30]
+
+from __future__ import annotations
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+if os.name == 'nt':  # Windows
+    _DEFAULT_DIR = os.path.join(os.environ.get("USERPROFILE", "."), "ImageScraperFiles")
+else:  # Unix-like (Linux/Mac)
+    _DEFAULT_DIR = os.path.join(os.environ.get("HOME", "."), "ImageScraperFiles")
+
+DEFAULT_PATH = os.getenv("SCRAPER_HOST_REPUTATION_PATH", os.path.join(_DEFAULT_DIR, "host_reputation.sqlite"))
+MIN_EVIDENCE = int(os.getenv("SCRAPER_HOST_MIN_EVIDENCE", "10"))
+POOR_SCORE = float(os.getenv("SCRAPER_HOST_POOR_SCORE", "0.1"))
+POOR_HOST_CAP = int(os.getenv("SCRAPER_HOST_POOR_CAP", "1"))
+WINDOW_DAYS = float(os.getenv("SCRAPER_HOST_WINDOW_DAYS", "90"))
+PRIOR_RATE = 0.5
+PRIOR_WEIGHT = 5.0
+NEUTRAL_SCORE = PRIOR_RATE * PRIOR_RATE
+RELOAD_INTERVAL = 30.0  # seconds between checks for a rebuilt table
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    host        TEXT NOT NULL,
+    accepted    INTEGER NOT NULL,
+    seconds     REAL,
+    bytes       INTEGER,
+    ts          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_ts ON observations (ts);
+CREATE TABLE IF NOT EXISTS hosts (
+    host              TEXT PRIMARY KEY,
+    approved          INTEGER NOT NULL,
+    rejected          INTEGER NOT NULL,
+    tried             INTEGER NOT NULL,
+    accepted          INTEGER NOT NULL,
+    median_latency_ms REAL,
+    score             REAL NOT NULL,
+    updated_at        REAL NOT NULL
+);
+"""
+
+# host -> (score, evidence, median latency ms or None)
+Reputation = Tuple[float, int, Optional[float]]
+
+
+def host_of(url: str) -> str:
+    """Lower-case host without port, credentials or a leading "www."."""
+    host = urlsplit(url if "://" in url else "//" + url).netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def _smoothed(hits: int, total: int) -> float:
+    return (hits + PRIOR_WEIGHT * PRIOR_RATE) / (total + PRIOR_WEIGHT)
+
+
+def host_score(approved: int, rejected: int, tried: int, accepted: int) -> float:
+    return _smoothed(approved, approved + rejected) * _smoothed(accepted, tried)
+
+
+class HostReputation:
+    """
+    Reputation table plus the observation log. Safe to share between threads; SQLite handles
+    cross-process locking, so several workers on one machine can share the file.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._table: Dict[str, Reputation] = {}
+        self._loaded_at = None
+        self._stamp = None
+        self._pending: List[tuple] = []
+
+    # --- reading ---
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < RELOAD_INTERVAL:
+            return
+        self._loaded_at = now
+        with self._lock:
+            stamp = self._conn.execute("SELECT COUNT(*), MAX(updated_at) FROM hosts").fetchone()
+            if stamp == self._stamp:
+                return
+            rows = self._conn.execute(
+                "SELECT host, score, approved + rejected + tried, median_latency_ms FROM hosts"
+            ).fetchall()
+            self._stamp = stamp
+        self._table = {h: (score, evidence, latency) for h, score, evidence, latency in rows}
+
+    def get(self, host: str) -> Reputation:
+        self._maybe_reload()
+        return self._table.get(host, (NEUTRAL_SCORE, 0, None))
+
+    def score(self, host: str) -> float:
+        return self.get(host)[0]
+
+    def is_poor(self, host: str) -> bool:
+        score, evidence, _ = self.get(host)
+        return evidence >= MIN_EVIDENCE and score < POOR_SCORE
+
+    def order_hosts(self, ctx_hosts: Sequence[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Context (host, source_type) pairs with each tier's hosts sorted best first (score, then
+        median latency). Every tier keeps the slots it had in the sheet, so tier order is unchanged.
+        """
+        def key(pair):
+            score, _, latency = self.get(host_of(pair[0]))
+            return (-score, latency if latency is not None else float("inf"))
+
+        by_tier: Dict[str, List[Tuple[str, str]]] = {}
+        for pair in ctx_hosts:
+            by_tier.setdefault(pair[1], []).append(pair)
+        sorted_tiers = {t: iter(sorted(pairs, key=key)) for t, pairs in by_tier.items()}
+        return [next(sorted_tiers[t]) for _, t in ctx_hosts]
+
+    def apply(self, urls: Sequence[str], cap: int = POOR_HOST_CAP) -> Tuple[List[str], List[str]]:
+        """
+        Returns (kept, dropped). Candidates from poor hosts keep their relative order but move
+        behind all others; beyond `cap` per poor host they are dropped.
+        """
+        good, poor, dropped = [], [], []
+        per_host: Dict[str, int] = {}
+        for url in urls:
+            host = host_of(url)
+            if not self.is_poor(host):
+                good.append(url)
+            elif per_host.get(host, 0) < cap:
+                per_host[host] = per_host.get(host, 0) + 1
+                poor.append(url)
+            else:
+                dropped.append(url)
+        return good + poor, dropped
+
+    # --- observations ---
+    def observe(self, url: str, accepted: bool, seconds: Optional[float], size: Optional[int]):
+        """Buffer one tried candidate; written by flush()."""
+        with self._lock:
+            self._pending.append((host_of(url), int(bool(accepted)), seconds, size, time.time()))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO observations (host, accepted, seconds, bytes, ts) VALUES (?, ?, ?, ?, ?)", pending
+                    )
+
+    # --- rebuild ---
+    def rebuild(self, feedback: Iterable[Tuple[str, object]], window_days: float = WINDOW_DAYS) -> int:
+        """
+        Recompute `hosts` from (image_url, label) feedback pairs and the observations of the last
+        `window_days` (older ones are deleted). Returns the number of hosts written.
+        """
+        labels: Dict[str, List[int]] = {}
+        for url, label in feedback:
+            if not url or label in (None, ""):
+                continue
+            try:
+                positive = int(float(label)) > 0
+            except (TypeError, ValueError):
+                continue
+            counts = labels.setdefault(host_of(url), [0, 0])
+            counts[0 if positive else 1] += 1
+
+        cutoff = time.time() - window_days * 86400
+        tries: Dict[str, List[int]] = {}
+        latencies: Dict[str, List[float]] = {}
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM observations WHERE ts < ?", (cutoff,))
+            for host, accepted, seconds in self._conn.execute("SELECT host, accepted, seconds FROM observations"):
+                counts = tries.setdefault(host, [0, 0])
+                counts[0] += 1
+                counts[1] += accepted
+                if seconds is not None:
+                    latencies.setdefault(host, []).append(seconds)
+
+            now = time.time()
+            rows = []
+            for host in set(labels) | set(tries):
+                approved, rejected = labels.get(host, (0, 0))
+                tried, accepted = tries.get(host, (0, 0))
+                latency = statistics.median(latencies[host]) * 1000 if host in latencies else None
+                rows.append((host, approved, rejected, tried, accepted, latency,
+                             host_score(approved, rejected, tried, accepted), now))
+            with self._conn:
+                self._conn.execute("DELETE FROM hosts")
+                self._conn.executemany("INSERT INTO hosts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._loaded_at = None
+        return len(rows)
+
+    def rows(self, order: str = "score ASC", limit: int = 30) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT host, approved, rejected, tried, accepted, median_latency_ms, score FROM hosts "
+                f"ORDER BY {order} LIMIT ?", (limit,)
+            ).fetchall()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+_reputation = None
+_reputation_lock = threading.Lock()
+
+
+def get_reputation() -> Optional[HostReputation]:
+    """The process-wide table, opened on first use; None when disabled or unreadable."""
+    global _reputation
+    if _reputation is None and DEFAULT_PATH:
+        with _reputation_lock:
+            if _reputation is None:
+                try:
+                    _reputation = HostReputation(DEFAULT_PATH)
+                except Exception as e:
+                    from scraper_logging import log_err
+                    log_err(f"Host reputation disabled ({DEFAULT_PATH}): {e}")
+                    _reputation = False
+    return _reputation or None
+
+
+def main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Rebuild or inspect the host reputation table.")
+    ap.add_argument("--path", default=DEFAULT_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("rebuild", help="Recompute host scores from feedback + recent observations")
+    r.add_argument("--data", "--csv", dest="data", default="",
+                   help="Rows with PRIMARY_IMAGE and Label instead of the feedback index: the training "
+                        "dataset dir (../MLModel/Output/dataset), a Parquet file or a CSV")
+    r.add_argument("--index", default="feedback")
+    r.add_argument("--live", action="store_true", help="Query the feedback index even if a local mirror exists")
+    r.add_argument("--window-days", type=float, default=WINDOW_DAYS)
+    s = sub.add_parser("show", help="List hosts, worst first")
+    s.add_argument("--worst", type=int, default=30)
+    s.add_argument("--best", action="store_true", help="Best first instead")
+    args = ap.parse_args(argv)
+
+    rep = HostReputation(args.path)
+    if args.cmd == "rebuild":
+        from url_ranker import feedback_rows, feedback_rows_from_file
+
+        rows = feedback_rows_from_file(args.data) if args.data else feedback_rows(args.index, args.live)
+        n = rep.rebuild(((url, label) for url, _, _, label in rows), window_days=args.window_days)
+        print(f"{n} host(s) written to {args.path}")
+        return
+
+    print(f"{'host':<40}{'appr':>6}{'rej':>6}{'tried':>7}{'acc':>6}{'p50 ms':>9}{'score':>8}")
+    for host, approved, rejected, tried, accepted, latency, score in rep.rows(
+            "score DESC" if args.best else "score ASC", args.worst):
+        poor = "  poor" if approved + rejected + tried >= MIN_EVIDENCE and score < POOR_SCORE else ""
+        lat = f"{latency:.0f}" if latency is not None else "-"
+        print(f"{host[:39]:<40}{approved:>6}{rejected:>6}{tried:>7}{accepted:>6}{lat:>9}{score:>8.3f}{poor}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# image_download.py
+# Bounded-memory image downloads for the scraper.
+#
+# - Bodies are streamed in chunks and hashed as they arrive; anything over
+#   MAX_IMAGE_BYTES is abandoned mid-stream (Content-Length is checked up front).
+# - Payloads are kept in a SpooledTemporaryFile: small images stay in memory,
+#   larger ones spill to a temp file, so one big TIFF can't blow up RSS.
+# - Images are opened header-first and rejected above MAX_IMAGE_PIXELS before
+#   any pixel data is decoded; PIL's decompression-bomb guard is set to the same cap.
+#
+# Environment:
+#   SCRAPER_MAX_IMAGE_BYTES    default 25 MiB
+#   SCRAPER_MAX_IMAGE_PIXELS   default 25 megapixels (5000x5000)
+#   SCRAPER_SPOOL_MAX_MEMORY   bytes kept in memory before spilling to disk (default 1 MiB)
+
+import hashlib
+import os
+import shutil
+import tempfile
+import warnings
+
+MAX_IMAGE_BYTES = int(os.getenv("SCRAPER_MAX_IMAGE_BYTES", str(25 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("SCRAPER_MAX_IMAGE_PIXELS", str(25_000_000)))
+SPOOL_MAX_MEMORY = int(os.getenv("SCRAPER_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+# Content types that are never images, whatever the URL says
+REJECT_CONTENT_TYPES = ("video/", "audio/", "text/html")
+
+
+class ImageRejected(Exception):
+    """Download or decode refused by policy; `reason` is a short metrics label."""
+
+    def __init__(self, reason, detail=""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def download_to_spool(sess, url, timeout=20, max_bytes=MAX_IMAGE_BYTES):
+    """
+    Stream `url` into a SpooledTemporaryFile.
+    Returns (spool positioned at 0, size in bytes, sha256 hex). The caller closes the spool.
+    Raises ImageRejected for policy violations and requests errors for HTTP failures.
+    """
+    with sess.get(url, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        ctype = (resp.headers.get("Content-Type") or "").lower()
+        if ctype.startswith(REJECT_CONTENT_TYPES):
+            raise ImageRejected("not_image", ctype)
+        declared = resp.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageRejected("too_large", f"Content-Length {declared} > {max_bytes}")
+
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageRejected("too_large", f"more than {max_bytes} bytes")
+                sha.update(chunk)
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+    spool.seek(0)
+    return spool, size, sha.hexdigest()
+
+
+def open_image_checked(fp, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Open an image from a file object, reading only the header.
+    Raises ImageRejected above max_pixels (or for decompression bombs). The caller closes the image.
+    """
+    from PIL import Image
+
+    # PIL warns above MAX_IMAGE_PIXELS and refuses above twice that; keep both in line with our cap
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            im = Image.open(fp)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageRejected("decompression_bomb", str(e))
+    w, h = im.size
+    if w * h > max_pixels:
+        im.close()
+        raise ImageRejected("too_many_pixels", f"{w}x{h}")
+    return im
+
+
+def save_spool(spool, path):
+    """Copy a spooled download to `path` without reading it all into memory."""
+    spool.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(spool, f, CHUNK_SIZE)
+    spool.seek(0)
+
+
+__all__ = [
+    "MAX_IMAGE_BYTES", "MAX_IMAGE_PIXELS", "ImageRejected",
+    "download_to_spool", "open_image_checked", "save_spool",
+]
@@ -0,0 +1,185 @@
+# image_hashing.py
+# Content (sha256) and perceptual (pHash) hashes for many images at once.
+#
+# pHash is the imagehash.phash algorithm, split in two so the expensive half can run in
+# parallel and the arithmetic half runs once per batch:
+#   prepare(im)        grayscale + LANCZOS resize to 32x32 (PIL, releases the GIL)
+#   phash_batch(arrs)  one scipy DCT over the stacked (N, 32, 32) array, median of each 8x8
+#                      low-frequency block, packed to the same 16-hex-digit string as
+#                      str(imagehash.phash(im))
+# Every step is the one imagehash performs, in the same dtype, so the results are bit-identical
+# (benchmarks/bench_hashing.py checks this against imagehash itself).
+# sha256 runs in a thread pool; hashlib releases the GIL on large buffers.
+#
+# Backfill (sidecars written without a pHash, or an archive with no hashes at all):
+#   python image_hashing.py backfill <dir> [<dir> ...] --manifest hashes.jsonl [--sidecars]
+# Writes one {"path", "sha256", "phash"} line per image. With --sidecars, a sidecar next to
+# an image ("foo.jpg.json" beside "foo.jpg") gets its missing pHash filled in, but only when
+# its recorded sha256 is this file's (renditions are not the bytes the sidecar describes).
+
+from __future__ import annotations
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    import scipy.fftpack as fftpack  # the DCT imagehash uses; required for identical hashes
+except Exception:
+    fftpack = None
+
+HASH_SIZE = 8
+HIGHFREQ_FACTOR = 4
+IMG_SIZE = HASH_SIZE * HIGHFREQ_FACTOR
+WORKERS = int(os.getenv("SCRAPER_HASH_WORKERS", str(min(8, os.cpu_count() or 1))))
+BATCH_SIZE = 256
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".avif")
+
+
+# === pHash ===
+def prepare(im: Image.Image) -> np.ndarray:
+    """The 32x32 grayscale pixels imagehash.phash computes its DCT over."""
+    return np.asarray(im.convert("L").resize((IMG_SIZE, IMG_SIZE), Image.LANCZOS))
+
+
+def phash_batch(arrays: Sequence[np.ndarray]) -> List[Optional[str]]:
+    """pHash hex strings for prepared 32x32 arrays; all None without scipy."""
+    if fftpack is None or not len(arrays):
+        return [None] * len(arrays)
+    pixels = np.stack(arrays)
+    dct = fftpack.dct(fftpack.dct(pixels, axis=1), axis=2)
+    low = dct[:, :HASH_SIZE, :HASH_SIZE].reshape(len(arrays), -1)
+    bits = low > np.median(low, axis=1, keepdims=True)
+    return [row.tobytes().hex() for row in np.packbits(bits, axis=1)]
+
+
+def phash(im: Image.Image) -> Optional[str]:
+    """Single-image pHash; same string as str(imagehash.phash(im))."""
+    return phash_batch([prepare(im)])[0]
+
+
+# === Content hashes ===
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_many(blobs: Iterable[bytes], workers: int = WORKERS) -> List[str]:
+    """sha256 of each buffer, hashed on `workers` threads."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(sha256_bytes, blobs))
+
+
+# === Files ===
+def _load(path: str) -> Tuple[str, Optional[str], Optional[np.ndarray], Optional[str]]:
+    """(path, sha256, prepared pixels, error); runs on a worker thread."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = sha256_bytes(data)
+    except OSError as e:
+        return path, None, None, str(e)
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return path, digest, prepare(im), None
+    except Exception as e:
+        return path, digest, None, str(e)
+
+
+def hash_files(paths: Sequence[str], workers: int = WORKERS, batch_size: int = BATCH_SIZE):
+    """
+    Yield (path, sha256, phash, error) for every path, in order. Files are read, hashed and
+    reduced to 32x32 on `workers` threads; the DCTs run once per batch of `batch_size`.
+    sha256 is None if the file can't be read, phash None if it isn't a decodable image.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(paths), batch_size):
+            loaded = list(pool.map(_load, paths[start:start + batch_size]))
+            ok = [i for i, (_, _, arr, _) in enumerate(loaded) if arr is not None]
+            hashes = dict(zip(ok, phash_batch([loaded[i][2] for i in ok])))
+            for i, (path, digest, _, error) in enumerate(loaded):
+                yield path, digest, hashes.get(i), error
+
+
+def find_images(roots: Iterable[str]) -> List[str]:
+    out = []
+    for root in roots:
+        if os.path.isfile(root):
+            out.append(root)
+            continue
+        for dirpath, _, names in os.walk(root):
+            out.extend(os.path.join(dirpath, n) for n in names if n.lower().endswith(IMAGE_SUFFIXES))
+    return sorted(out)
+
+
+def _fill_sidecar(path: str, digest: str, phash_hex: Optional[str]) -> bool:
+    """Set image.phash in `<path>.json` if it is missing and the sidecar describes these bytes."""
+    sidecar_path = f"{path}.json"
+    if phash_hex is None or not os.path.exists(sidecar_path):
+        return False
+    with open(sidecar_path, "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    image = sidecar.get("image") or {}
+    if image.get("phash") or image.get("sha256") != digest:
+        return False
+    image["phash"] = phash_hex
+    sidecar["image"] = image
+    tmp = f"{sidecar_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, sidecar_path)
+    return True
+
+
+__all__ = ["prepare", "phash_batch", "phash", "sha256_bytes", "sha256_many", "hash_files", "find_images"]
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Compute sha256 + pHash for an image archive.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("backfill", help="Hash every image under the given paths")
+    b.add_argument("roots", nargs="+")
+    b.add_argument("--manifest", default="", help="Write one JSON line per image here")
+    b.add_argument("--sidecars", action="store_true", help="Fill missing pHashes in matching sidecars")
+    b.add_argument("--workers", type=int, default=WORKERS)
+    b.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = ap.parse_args(argv)
+
+    if fftpack is None:
+        print("scipy is not installed: sha256 only, no pHash (pip install scipy)")
+    paths = find_images(args.roots)
+    start = time.perf_counter()
+    done = failed = filled = 0
+    manifest = open(args.manifest, "w", encoding="utf-8") if args.manifest else None
+    try:
+        for path, digest, phash_hex, error in hash_files(paths, args.workers, args.batch_size):
+            done += 1
+            if error:
+                failed += 1
+                print(f"{path}: {error}")
+            if manifest is not None and digest is not None:
+                manifest.write(json.dumps({"path": path, "sha256": digest, "phash": phash_hex}) + "\n")
+            if args.sidecars and digest is not None:
+                try:
+                    filled += _fill_sidecar(path, digest, phash_hex)
+                except Exception as e:
+                    print(f"{path}.json: {e}")
+            if done % 1000 == 0:
+                print(f"{done}/{len(paths)} ({done / (time.perf_counter() - start):.0f} images/s)")
+    finally:
+        if manifest is not None:
+            manifest.close()
+    elapsed = time.perf_counter() - start
+    print(f"{done} image(s) in {elapsed:.1f} s ({done / elapsed if elapsed else 0:.0f}/s), "
+          f"{failed} unreadable, {filled} sidecar(s) updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,117 +1,27 @@
 import os
 import sys
-import requests
-import urllib.parse
-import urllib.request
-import json
-from urllib.parse import quote, urlparse
-from bs4 import BeautifulSoup
-import requests
-from excel_parse import get_entries, get_context_urls
-from autoimage import resize_images
-from urllib.parse import urlparse
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-import threading
-from tkinter.filedialog import askopenfilename
 import json
 import re
-import requests, certifi
-from io import BytesIO
-from colorama import init as _cinit, Fore, Style # type: ignore
-import logging
-
-# Configure logging to write to a file and optionally print to the terminal
-logging.basicConfig(
-    level=logging.DEBUG,  # Set the logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    format="%(asctime)s [%(levelname)s] %(message)s",  # Log format
-    handlers=[
-        logging.FileHandler("scraper_logs.txt"),  # Log to a file
-        logging.StreamHandler()  # Optional: Log to the terminal
-    ]
-)
-from json_sidecar import build_sidecar_schema, write_sidecar_json, copy_sidecars_from_staging
-from elasticsearch import Elasticsearch
+import threading
+import time
 from datetime import datetime
-from feature_engineer import analyze_image, compute_filename_features
-import numpy as np
-import joblib
-
-#for local deployment only change the username and password
-# es = Elasticsearch(
-#     "http://localhost:9200/",
-#     basic_auth=("username", "password"),
-#     verify_certs=True  # Disable certificate verification for local testing
-# )
-
-
-es = Elasticsearch(
-    os.getenv("ELASTICSEARCH_URL"),
-    basic_auth=(
-        os.getenv("ELASTICSEARCH_USERNAME", "elastic"),
-        os.getenv("ELASTICSEARCH_PASSWORD")
-    ),
-    verify_certs=True
-)
-
-MODEL_PATH = "image_classifier_confidence.pkl"
-model = joblib.load(MODEL_PATH)
-
-# ========== colored logging (drop-in) ==========
-VERBOSE = True  # set False to reduce noise
-
-try:
-    from colorama import init as _cinit, Fore, Style # type: ignore
-    _cinit(autoreset=True)
-except Exception:
-    class _Dummy:
-        def __getattr__(self, *_): return ""
-    Fore = Style = _Dummy()
-
-def _log(prefix, color, msg, dim=False):
-    pre = f"{color}[{prefix}]{Style.RESET_ALL} "
-    log_message = f"[{prefix}] {msg}"
-
-    # Print to the terminal with color
-    if dim:
-        print(f"{Fore.WHITE}{Style.DIM}{pre}{msg}{Style.RESET_ALL}")
-    else:
-        print(pre + msg)
-
-    # Log to the file (without color)
-    if prefix == "STEP":
-        logging.info(log_message)
-    elif prefix == "SEARCH":
-        logging.info(log_message)
-    elif prefix == "CANDIDATE":
-        logging.debug(log_message)
-    elif prefix == "OK":
-        logging.info(log_message)
-    elif prefix == "FILTER" or prefix == "SKIP":
-        logging.warning(log_message)
-    elif prefix == "ERR":
-        logging.error(log_message)
-    elif prefix == "DBG":
-        logging.debug(log_message)
-
-def log_step(msg):      _log("STEP",   Fore.CYAN,    msg)
-def log_search(msg):    _log("SEARCH", Fore.BLUE,    msg)
-def log_cand(msg):      _log("CANDIDATE", Fore.MAGENTA, msg)
-def log_ok(msg):        _log("OK",     Fore.GREEN,   msg)
-def log_filter(msg):    _log("FILTER", Fore.YELLOW,  msg)
-def log_skip(msg):      _log("SKIP",   Fore.YELLOW,  msg)
-def log_err(msg):       _log("ERR",    Fore.RED,     msg)
-def log_dbg(msg):
-    if VERBOSE: _log("DBG", Fore.WHITE, msg, dim=True)
-
-def log_stage(label, detail=""):
-    # Yellow banner like: [Searching OEM] site:foo.com PN='123'
-    msg = f"[{label}]"
-    if detail:
-        msg += f" {detail}"
-    log_filter(msg)
-# =============================================================
+from urllib.parse import urlparse
+
+from scraper_logging import (configure_logging, log_step, log_search, log_cand, log_ok, log_filter,
+                             log_skip, log_err, log_dbg, log_stage)
+from model_registry import ModelRegistry
+import scraper_metrics as metrics
+
+# Heavy dependencies (tkinter, PIL, bs4, OpenCV/skimage via feature_engineer, pandas via excel_parse,
+# numpy, elasticsearch) are imported where they are first used, so `import image_scraper` stays cheap
+# for headless workers and for tools that only need safe_name / fetch_image_urls.
+# benchmarks/bench_import.py keeps this honest.
+
+#for local deployment set ELASTICSEARCH_URL / ELASTICSEARCH_USERNAME / ELASTICSEARCH_PASSWORD
+# (the client is built on first use, see es_client.py)
+
+# Confidence model is loaded on first use and hot-swapped when a newer version is promoted
+model_registry = ModelRegistry()
 
 if os.name == 'nt':  # Windows
     CONFIG_DIR = os.path.join(os.environ["USERPROFILE"], "ImageScraperFiles")
@@ -120,7 +30,26 @@ else:  # Unix-like (Linux/Mac)
 
 CONFIG_FILE = os.path.join(CONFIG_DIR,"config.json")
 
-os.makedirs(CONFIG_DIR, exist_ok=True)
+_feature_store = None
+_feature_store_lock = threading.Lock()
+
+
+def get_feature_store():
+    """Features keyed by image sha256, shared with the MLModel feature/feedback scripts; opened on first use."""
+    global _feature_store
+    if _feature_store is None:
+        with _feature_store_lock:
+            if _feature_store is None:
+                from feature_engineer import FEATURE_VERSION
+                from feature_store import FeatureStore
+                _feature_store = FeatureStore(FEATURE_VERSION)
+    return _feature_store
+
+# Set by the GUI; headless runs leave them as None
+tk = filedialog = messagebox = None
+on_progress = None  # called with (current, total) before each entry
+on_finished = None  # called once start_scraping is done
+profile_enabled = os.getenv("SCRAPER_PROFILE", "") not in ("", "0")  # --profile: sample the scraping thread
 
 should_stop = False # Flag to check if scraping should stop
 running = False # Flag to check if scraping is in progress
@@ -140,13 +69,17 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 # Function to produce search URLs
-def fetch_image_urls(manufacturer, part_number, con_url, description):
+def fetch_image_urls(manufacturer, part_number, con_url, description, ctx_hosts=()):
     #prefer Bing full-size URLs (murl) and skip known thumbnail hosts
     #scrape was returning too many thumbnails, block known thumb hosts
+    #result is pre-ranked from the URL alone (url_ranker.py), best candidate first
+
+    from host_reputation import get_reputation
+    from search_providers import candidates
+    from url_ranker import rank_candidates
 
     global man_website, forced_site
     num_images = 20
-    headers = {"User-Agent": "Mozilla/5.0"}
 
     if man_website:
         # 1) strict site search (OEM)
@@ -185,14 +118,7 @@ def fetch_image_urls(manufacturer, part_number, con_url, description):
     NEG = "-logo -logos -icon -icons -vector -clipart -illustration -banner -headquarters -building -sign -brand -ai -AI -Ai"
     q = f"{search_query} {NEG}"
 
-    # Bing Images with "large photos" filter helps quality a lot
-    #Bing Images with large-photo filter; Google unchanged
-    google_url = f"https://www.google.com/search?tbm=isch&q={urllib.parse.quote(q)}"
-    bing_url = f"https://www.bing.com/images/search?q={urllib.parse.quote(q)}&qft=%2Bfilterui%3Aimagesize-large%2Bfilterui%3Aphoto-photo"
-
     log_search(f"mode={'manufacturer' if man_website else 'generic'} | q={q}")
-    log_search("bing images:  " + bing_url)
-    log_search("google imgs:  " + google_url)
 
     image_urls = []
     seen = set()
@@ -217,47 +143,30 @@ def fetch_image_urls(manufacturer, part_number, con_url, description):
             if len(image_urls) <= 5:
                 log_cand(u)
 
-    # 1) Try to pull Bing full-size targets from anchor metadata (murl)
-    try:
-        log_dbg("parsing Bing anchors for full-size URLs (murl)")
-        r = requests.get(bing_url, headers=headers, timeout=15)
-        soup = BeautifulSoup(r.text, "html.parser")
-        for a in soup.select("a.iusc, a.iuscp"):
-            meta_raw = a.get("m") or a.get("mad")
-            if not meta_raw:
-                continue
-            try:
-                meta = json.loads(meta_raw)
-            except Exception:
-                continue
-            murl = meta.get("murl") or meta.get("murl2")
-            add(murl)
-            if len(image_urls) >= num_images:
-                break
-    except Exception as e:
-        log_err(f"Bing parse failed: {e}")
-
-    # 2) Fallback: scrape <img> on Google, but skip thumb hosts
-    if len(image_urls) < num_images:
-        try:
-            log_dbg("fallback: parsing Google <img> tags")
-            r = requests.get(google_url, headers=headers, timeout=15)
-            soup = BeautifulSoup(r.text, "html.parser")
-            for img in soup.find_all("img"):
-                src = img.get("src") or img.get("data-src")
-                add(src)
-                if len(image_urls) >= num_images:
-                    break
-        except Exception as e:
-            log_err(f"Google parse failed: {e}")
+    # Bing (full-size murl targets) and Google (<img> tags) are queried concurrently, each with its
+    # own deadline; candidates come back normalised and de-duplicated, Bing's first (search_providers.py)
+    for u in candidates(q):
+        add(u)
+        if len(image_urls) >= num_images:
+            break
+
+    # likely winners first, obvious losers (logos, thumbnails, banners) dropped before any download
+    with metrics.stage("url_rank"):
+        image_urls = rank_candidates(image_urls, manufacturer, part_number, ctx_hosts)
+        # hosts that are almost always rejected go last, with only a few candidates each (host_reputation.py)
+        reputation = get_reputation()
+        if reputation is not None:
+            image_urls, capped = reputation.apply(image_urls)
+            for u in capped:
+                metrics.CANDIDATES.inc(outcome="host_capped")
+                log_skip(f"poor-reputation host, over cap: {u}")
 
     # NEW: include host filter info in summary
     if allowed_hosts:
         log_ok(f"Total image URLs selected: {len(image_urls)} (host filter: {', '.join(sorted(allowed_hosts))})")
     else:
         log_ok(f"Total image URLs selected: {len(image_urls)}")
-
-    log_ok(f"Total image URLs selected: {len(image_urls)}")
+    metrics.SEARCH_RESULTS.observe(len(image_urls))
     return image_urls
 
 
@@ -274,97 +183,179 @@ def safe_name(s: str, max_len=120) -> str:
 
 
 # Function to download images and name them "ManufacturerName"_"PartNumber"
-def download_images(image_urls, manufacturer, part_number, item_number, output_dir, motion_id, description):
-    save_dir = f"{output_dir}/images/staging"
+def download_images(image_urls, manufacturer, part_number, item_number, output_dir, motion_id, description,
+                    staging_dir=None):
+    import numpy as np
+    import requests
+    from feature_engineer import analyze_image, compute_filename_features
+    from image_download import ImageRejected, download_to_spool, open_image_checked, save_spool
+    from json_sidecar import build_sidecar_schema, write_sidecar_json
+    from host_reputation import get_reputation
+    from url_ranker import SKU_BYTE_BUDGET, SKU_DOWNLOAD_BUDGET
+
+    feature_store = get_feature_store()
+    analyze = metrics.timed("features")(analyze_image)  # cache hits aren't timed, only real extraction
+    reputation = get_reputation()  # every candidate tried is recorded for the next rebuild
+    save_dir = staging_dir or f"{output_dir}/images/staging"
     os.makedirs(save_dir, exist_ok=True)
     sess = requests.Session()
     sess.headers.update({"User-Agent": "Mozilla/5.0"})
 
+    # Per-SKU budget: image_urls is ranked best first, so the candidates left over are the least likely ones
+    bytes_spent = 0
     for idx, img_url in enumerate(image_urls):
+        if (SKU_DOWNLOAD_BUDGET and idx >= SKU_DOWNLOAD_BUDGET) or (SKU_BYTE_BUDGET and bytes_spent >= SKU_BYTE_BUDGET):
+            metrics.CANDIDATES.inc(len(image_urls) - idx, outcome="over_budget")
+            log_skip(f"Download budget spent ({idx} downloads, {bytes_spent} bytes); "
+                     f"skipping {len(image_urls) - idx} lower-ranked candidate(s)")
+            break
         log_step(f"Downloading [{idx+1}/{len(image_urls)}]: {img_url}")
+        accepted, latency, size = False, None, None
         try:
-            resp = sess.get(img_url, timeout=20, stream=True)
-            resp.raise_for_status()
-            content = resp.content
-
-            # byte-size gate (~20KB)
-            if len(content) < 20000:
-                log_skip(f"Too small (bytes={len(content)}): {img_url}")
-                continue
-
-            # pixel-size gate (>= 400x400)
             try:
-                im = Image.open(BytesIO(content))
-                w, h = im.size
-                if w < 400 or h < 400:
-                    log_skip(f"Too small dimensions ({w}x{h}): {img_url}")
-                    continue
-            except Exception:
-                log_skip(f"Invalid image data: {img_url}")
+                with metrics.stage("download"):
+                    # streamed, capped at MAX_IMAGE_BYTES and hashed on the fly; large bodies spill to disk
+                    t0 = time.monotonic()
+                    spool, size, content_sha256 = download_to_spool(sess, img_url)
+                    latency = time.monotonic() - t0
+            except ImageRejected as rej:
+                metrics.CANDIDATES.inc(outcome=rej.reason)
+                log_skip(f"Rejected ({rej}): {img_url}")
                 continue
+            except Exception:
+                metrics.CANDIDATES.inc(outcome="download_error")
+                raise
+            metrics.BYTES_DOWNLOADED.inc(size)
+            bytes_spent += size
 
             stem = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{manufacturer}_{part_number}_{idx}").strip("._-")[:120] or "img"
             img_path = os.path.join(save_dir, f"{stem}.jpg")
 
-            # save image bytes
-            with open(img_path, "wb") as f:
-                f.write(content)
-            log_ok(f"Saved: {img_path}")
-            log_dbg(f"from: {img_url}")
+            with spool:
+                # byte-size gate (~20KB)
+                if size < 20000:
+                    metrics.CANDIDATES.inc(outcome="too_small_bytes")
+                    log_skip(f"Too small (bytes={size}): {img_url}")
+                    continue
+
+                # pixel-size gate (>= 400x400); header only, nothing decoded yet
+                try:
+                    with metrics.stage("decode"):
+                        im = open_image_checked(spool)
+                        w, h = im.size
+                except ImageRejected as rej:
+                    metrics.CANDIDATES.inc(outcome=rej.reason)
+                    log_skip(f"Rejected ({rej}): {img_url}")
+                    continue
+                except Exception:
+                    metrics.CANDIDATES.inc(outcome="invalid_image")
+                    log_skip(f"Invalid image data: {img_url}")
+                    continue
+
+                with im:
+                    if w < 400 or h < 400:
+                        metrics.CANDIDATES.inc(outcome="too_small_dims")
+                        log_skip(f"Too small dimensions ({w}x{h}): {img_url}")
+                        continue
+
+                    # save image bytes
+                    save_spool(spool, img_path)
+                    log_ok(f"Saved: {img_path}")
+                    log_dbg(f"from: {img_url}")
+
+                    # Sidecar content needs the open image (format, pHash); build it now so the
+                    # image and the downloaded bytes are released before feature extraction
+                    try:
+                        with metrics.stage("sidecar"):
+                            sidecar = build_sidecar_schema(
+                                image_path=img_path,
+                                sha256=content_sha256,
+                                filesize=size,
+                                im=im,
+                                manufacturer=manufacturer,
+                                part_number=part_number,
+                                description=description,                    # pass real description later if desired
+                                image_url=img_url,
+                                page_url=None,
+                                referer=None,
+                            )
+                    except Exception as se:
+                        log_err(f"Sidecar build failed for {img_path}: {se}")
+                        sidecar = None
 
             # Compute confidence score using ML Model
             try:
-                resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = analyze_image(img_path)
+                resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio = feature_store.get_or_compute(
+                    img_path, analyze, sha256=content_sha256
+                )
                 manufacturer_similarity = compute_filename_features(img_url, manufacturer)
 
                 # Skip if metrics missing
                 if None in (resolution, entropy, sharpness, brightness, white_ratio, white_border_ratio, manufacturer_similarity):
+                    metrics.CANDIDATES.inc(outcome="invalid_metrics")
                     log_skip(f"Invalid metrics for {img_path}")
                     continue
 
-                # Prepare feature vector
-                # If resolution feature is added back to model, will need to include it here too
-                X_new = np.array([[manufacturer_similarity, entropy, sharpness, brightness, white_ratio, white_border_ratio]])
+                # Prepare feature vector in the order recorded in the model manifest
+                # If resolution feature is added back to model, it will be picked up from the manifest
+                model = model_registry.get()
+                X_new = np.array([model.vector({
+                    "MFRSimilarity": manufacturer_similarity,
+                    "Entropy": entropy,
+                    "Sharpness": sharpness,
+                    "Brightness": brightness,
+                    "WhiteRatio": white_ratio,
+                    "WhiteBorderRatio": white_border_ratio,
+                    "Resolution": resolution,
+                })])
 
                 # Predict confidence
-                confidence = float(model.predict_proba(X_new)[0, 1])
-                log_dbg(f"Confidence={confidence:.4f} for {img_path}")
+                metrics.INFERENCE_BATCH.observe(len(X_new))
+                with metrics.stage("inference"):
+                    confidence = float(model.predict(X_new)[0])
+                model_version = model.version
+                log_dbg(f"Confidence={confidence:.4f} (model {model_version}) for {img_path}")
 
             except Exception as e:
                 log_err(f"Feature extraction or model inference failed for {img_path}: {e}")
                 confidence = None
+                model_version = None
+
+            metrics.CANDIDATES.inc(outcome="accepted")
+            accepted = True
 
             # === NEW: write JSON sidecar next to staged image ===
-            try:
-                sidecar = build_sidecar_schema(
-                    image_path=img_path,
-                    image_bytes=content,
-                    im=im,                               # already opened above
-                    manufacturer=manufacturer,
-                    part_number=part_number,
-                    description=description,                    # pass real description later if desired
-                    image_url=img_url,
-                    page_url=None,
-                    referer=None,
-                )
-                sc_path = write_sidecar_json(img_path, sidecar)  # pretty=False for compact files
-                log_dbg(f"sidecar -> {sc_path}")
-            except Exception as se:
-                log_err(f"Sidecar write failed for {img_path}: {se}")
+            if sidecar is not None:
+                try:
+                    sc_path = write_sidecar_json(img_path, sidecar)  # pretty=False for compact files
+                    log_dbg(f"sidecar -> {sc_path}")
+                except Exception as se:
+                    log_err(f"Sidecar write failed for {img_path}: {se}")
             # === END NEW ===
 
             # === NEW: index metadata in Elasticsearch ===
             try:
-                index_image_metadata(img_url, manufacturer, part_number, item_number, description, motion_id, confidence)
+                index_image_metadata(img_url, manufacturer, part_number, item_number, description, motion_id, confidence,
+                                     model_version=model_version, image_sha256=content_sha256)
             except Exception as ie:
                 log_err(f"Elasticsearch indexing failed for {img_url}: {ie}")
             # === END NEW ===
 
         except Exception as e:
             log_err(f"Failed to download {img_url}: {e}")
-            
+        finally:
+            if reputation is not None:
+                reputation.observe(img_url, accepted, latency, size)
+
+    if reputation is not None:
+        try:
+            reputation.flush()
+        except Exception as e:
+            log_err(f"Could not record host observations: {e}")
 
-def index_image_metadata(image_url, manufacturer, part_number, item_number, description, motion_id, confidence):
+
+def index_image_metadata(image_url, manufacturer, part_number, item_number, description, motion_id, confidence,
+                         model_version=None, image_sha256=None):
     doc = {
         "sku_number": f"{motion_id}",
         "image_url": image_url,
@@ -374,27 +365,68 @@ def index_image_metadata(image_url, manufacturer, part_number, item_number, desc
         "description": description,
         "status": "pending",
         "confidence": confidence,
+        "model_version": model_version,
+        "image_sha256": image_sha256,  # key into the feature store, used by rescore.py
         "timestamp": datetime.now()
     }
 
     index_name = "image_metadata"  # must be lowercase and no spaces
 
+    # Through the on-disk spool (es_spool.py) when it is enabled: the document is safe once
+    # appended, and reaches ES in the next _bulk even if the cluster is down right now
+    from es_spool import get_spool
+    spool = get_spool()
+    if spool is not None:
+        try:
+            doc_id = spool.append(index_name, doc)
+            metrics.INDEX_DOCS.inc(outcome="spooled")
+            log_ok(f"Document spooled for indexing (ID={doc_id})")
+            return
+        except OSError as e:
+            log_err(f"ES spool write failed, indexing directly: {e}")
+
     try:
+        from es_client import get_es
+        es = get_es()
+
         # Create index if it doesn't exist (safe in Elastic Cloud)
-        if not es.indices.exists(index=index_name):
-            es.indices.create(index=index_name, ignore=400)
-            log_ok(f"Created index: {index_name}")
+        with metrics.stage("index"):
+            if not es.indices.exists(index=index_name):
+                es.indices.create(index=index_name, ignore=400)
+                log_ok(f"Created index: {index_name}")
 
-        response = es.index(index=index_name, document=doc)
+            response = es.index(index=index_name, document=doc)
+        metrics.INDEX_DOCS.inc(outcome="ok")
         log_ok(f"Document indexed successfully (ID={response.get('_id')})")
 
     except ConnectionError as ce:
+        metrics.INDEX_DOCS.inc(outcome="error")
         log_err(f"Elasticsearch connection failed: {ce}")
     except Exception as e:
+        metrics.INDEX_DOCS.inc(outcome="error")
         log_err(f"Elasticsearch indexing failed for {image_url}: {e}")
 
-def clear_directory(output_dir):
-    dir_path = f"{output_dir}/images/staging"
+# Give spooled index writes up to `timeout` seconds to reach ES before a run ends.
+# Whatever is left stays on disk for the next run (or `python es_spool.py drain`).
+def flush_index_spool(timeout=30.0):
+    from es_client import get_es
+    from es_spool import get_spool
+
+    spool = get_spool()
+    if spool is None:
+        return
+    try:
+        empty = spool.drain(get_es(), timeout=timeout)
+    except Exception as e:
+        empty = False
+        spool.last_error = str(e)
+    if not empty:
+        stats = spool.stats()
+        log_err(f"{stats['pending_bytes']} bytes of index writes still spooled in {spool.dir} "
+                f"(last error: {stats['last_error']}); replayed by the next run or `python es_spool.py drain`")
+
+def clear_directory(output_dir, staging_dir=None):
+    dir_path = staging_dir or f"{output_dir}/images/staging"
     for filename in os.listdir(dir_path):
         file_path = os.path.join(dir_path, filename)
         try:
@@ -412,7 +444,7 @@ def custom_file_dialog(option):
 
     file_types = [("Excel files", "*.xlsx"), ("All files", "*.*")]
 
-    file_path = askopenfilename(
+    file_path = filedialog.askopenfilename(
         initialdir="/host_files",  # Your Docker-mounted directory
         title="Select an Excel file",
         filetypes=file_types
@@ -459,8 +491,6 @@ def _classify_host_for_banner(host: str) -> str:
         return "Enterprise"
     return "non-OEM distributors"
 
-import json  # Ensure JSON is imported
-
 # Function to save metadata to a JSON file
 def save_metadata(metadata, output_dir):
     metadata_file = os.path.join(output_dir, "sku_metadata.json")
@@ -471,15 +501,179 @@ def save_metadata(metadata, output_dir):
     except Exception as e:
         log_err(f"Failed to save metadata: {e}")
 
+# Per-stage timings and counters for this run: logged and saved as run_metrics.json
+def save_run_metrics(summary, output_dir, filename="run_metrics.json"):
+    for line in metrics.format_run_summary(summary):
+        log_ok(line)
+    metrics_file = os.path.join(output_dir, filename)
+    try:
+        metrics.write_run_summary(metrics_file, summary)
+        log_ok(f"Run metrics saved to {metrics_file}")
+    except Exception as e:
+        log_err(f"Failed to save run metrics: {e}")
+
+# (host, source_type) pairs from the context sheet for one manufacturer, in sheet order;
+# source_type is one of "OEM", "Enterprise", "Distributor", "Unknown"
+def resolve_context_hosts(manufacturer, context_urls):
+    ctx_hosts = []
+
+    for row in context_urls:
+        if len(row) == 2:
+            url_mfr, url = row
+            enterprise_name = None
+        else:
+            url_mfr, url, enterprise_name = row
+
+        if manufacturer == url_mfr and url:
+            host = urlparse(url).netloc or url
+            if not host:
+                continue
+
+            if enterprise_name is not None:
+                if str(enterprise_name).strip().upper() == str(manufacturer).strip().upper():
+                    source_type = "OEM"
+                elif str(enterprise_name).strip().upper() == "DISTRIBUTOR":
+                    source_type = "Distributor"
+                else:
+                    source_type = "Enterprise"
+            else:
+                source_type = "Unknown"
+
+            if (host, source_type) not in ctx_hosts:
+                ctx_hosts.append((host, source_type))
+
+    return ctx_hosts
+
+# Search chain for one SKU (OEM site, the other context hosts, then a general search), then download,
+# score and file its images under images/specific or images/generic.
+# Returns the SKU's sku_metadata.json entry, or None if nothing was found.
+# Shared by start_scraping (spreadsheet runs) and run_worker (queued jobs); workers sharing an
+# output directory each pass their own staging_dir.
+def scrape_sku(manufacturer, part_number, item_number, description, motion_id, ctx_hosts, output_dir,
+               staging_dir=None):
+    from autoimage import resize_images
+    from json_sidecar import copy_sidecars_from_staging
+
+    from host_reputation import get_reputation
+
+    global man_website, forced_site  # both read by fetch_image_urls
+    staging_dir = staging_dir or f"{output_dir}/images/staging"
+    reputation = get_reputation()
+    if reputation is not None and ctx_hosts:
+        ctx_hosts = reputation.order_hosts(ctx_hosts)  # best-reputed host first within each tier
+    if ctx_hosts:
+        oem_hosts = [h for (h, t) in ctx_hosts if t == "OEM"]
+        con_url = (oem_hosts[0] if oem_hosts else ctx_hosts[0][0])
+        man_website = True
+    else:
+        con_url = ""
+        man_website = False
+
+    image_urls = []
+
+    if man_website and con_url:
+        log_stage("Searching OEM", f"site:{con_url} PN='{part_number}'")
+        image_urls = fetch_image_urls(manufacturer, part_number, con_url, description, ctx_hosts)
+        if image_urls:
+            log_ok("[OEM] Found candidates")
+        else:
+            log_skip("[OEM] Not found")
+
+    if (not image_urls) and len(ctx_hosts) >= 1:
+        tried_oem_host = con_url if (man_website and con_url) else None
+        for host, source_type in ctx_hosts:
+            if tried_oem_host and host == tried_oem_host:
+                continue
+
+            if source_type == "OEM":
+                log_stage("Searching OEM", f"site:{host} PN='{part_number}'")
+            elif source_type == "Enterprise":
+                log_stage("Searching Enterprise", f"site:{host} PN='{part_number}'")
+            elif source_type == "Distributor":
+                log_stage("Searching non-OEM distributors", f"site:{host} PN='{part_number}'")
+            else:
+                log_stage("Searching General", f"site:{host} PN='{part_number}'")
+
+            man_website = (source_type == "OEM")
+            forced_site = None if man_website else host
+
+            image_urls = fetch_image_urls(manufacturer, part_number, host if man_website else "", description, ctx_hosts)
+            if image_urls:
+                if source_type == "OEM":
+                    log_ok("[OEM] Found candidates")
+                elif source_type == "Enterprise":
+                    log_ok("[Enterprise] Found candidates")
+                elif source_type == "Distributor":
+                    log_ok("[Distributor] Found candidates")
+                else:
+                    log_ok("[General] Found candidates")
+                break
+            else:
+                if source_type == "OEM":
+                    log_skip("[OEM] Not found")
+                elif source_type == "Enterprise":
+                    log_skip("[Enterprise] Not found")
+                elif source_type == "Distributor":
+                    log_skip("[Distributor] Not found")
+                else:
+                    log_skip("[General] Not found")
+
+        forced_site = None
+
+    if not image_urls:
+        log_stage("General image search", f"MFR='{manufacturer}' PN='{part_number}'")
+        man_website = False
+        forced_site = None
+        image_urls = fetch_image_urls(manufacturer, part_number, "", description, ctx_hosts)
+        if image_urls:
+            log_ok("[General] Found candidates")
+        else:
+            log_skip("[General] Not found")
+
+    if image_urls:
+        log_step("Downloading images...")
+        download_images(image_urls, manufacturer, part_number, item_number, output_dir, motion_id, description,
+                        staging_dir=staging_dir)
+
+        if man_website:
+            dest_dir = f"{output_dir}/images/specific/{manufacturer}/{motion_id}"
+        else:
+            dest_dir = f"{output_dir}/images/generic/{manufacturer}/{motion_id}"
+
+        resize_images(staging_dir, dest_dir)
+        # NEW: bring sidecars along to the final folder
+        copy_sidecars_from_staging(staging_dir, dest_dir)
+
+        clear_directory(output_dir, staging_dir=staging_dir)
+
+        metrics.SKUS.inc(outcome="images_found")
+        # Metadata for this SKU
+        return {
+            "sku": motion_id,
+            "manufacturer": manufacturer,
+            "part_number": part_number,
+            "image_urls": image_urls
+        }
+    else:
+        metrics.SKUS.inc(outcome="no_images")
+        log_skip(f"No images found for {manufacturer} {part_number}.")
+        return None
 # Update the start_scraping function to collect and save metadata
 def start_scraping(excel_file, entry_range_x, entry_range_y, context_file, output_dir):
-    global current_entry_index, total_entry_count, man_website, running
+    from excel_parse import get_entries, get_context_urls
+
+    global current_entry_index, total_entry_count, running
     entries = get_entries(excel_file)  # Fetch entries as tuples
     context_urls = get_context_urls(context_file)
     total_entry_count = len(entries) + 1
     last_manufacturer = ""
-    repeat = 0
+    ctx_hosts = []
     metadata = []  # List to store metadata for each SKU
+    run_start = metrics.snapshot()
+    profiler = None
+    if profile_enabled:
+        from scraper_profiler import SamplingProfiler
+        profiler = SamplingProfiler(stage_of=metrics.current_stage).start()
 
     if entries and context_urls:
         for i, (manufacturer, part_number, item_number, description, motion_id) in enumerate(entries):
@@ -489,142 +683,118 @@ def start_scraping(excel_file, entry_range_x, entry_range_y, context_file, outpu
             if (entry_range_x != 0 and i < entry_range_x - 1) or (entry_range_y != 0 and entry_range_y <= i):
                 continue
             if manufacturer != last_manufacturer:
-                ctx_hosts = []  # list of (host, source_type) where source_type in {"OEM","Enterprise","Distributor","Unknown"}
-
-                for row in context_urls:
-                    if len(row) == 2:
-                        url_mfr, url = row
-                        enterprise_name = None
-                    else:
-                        url_mfr, url, enterprise_name = row
-
-                    if manufacturer == url_mfr and url:
-                        host = urlparse(url).netloc or url
-                        if not host:
-                            continue
-
-                        if enterprise_name is not None:
-                            if str(enterprise_name).strip().upper() == str(manufacturer).strip().upper():
-                                source_type = "OEM"
-                            elif str(enterprise_name).strip().upper() == "DISTRIBUTOR":
-                                source_type = "Distributor"
-                            else:
-                                source_type = "Enterprise"
-                        else:
-                            source_type = "Unknown"
-
-                        if (host, source_type) not in ctx_hosts:
-                            ctx_hosts.append((host, source_type))
-
-                if ctx_hosts:
-                    oem_hosts = [h for (h, t) in ctx_hosts if t == "OEM"]
-                    con_url = (oem_hosts[0] if oem_hosts else ctx_hosts[0][0])
-                    man_website = True
-                else:
-                    con_url = ""
-                    man_website = False
-
+                ctx_hosts = resolve_context_hosts(manufacturer, context_urls)
                 last_manufacturer = manufacturer
 
             current_entry_index = i + 1
-            tk.Label(frame, text=f"Entry ({current_entry_index}/{total_entry_count})").grid(row=6, column=1, padx=10, pady=10)
+            if on_progress:
+                on_progress(current_entry_index, total_entry_count)
             log_step(f"({i + 1}/{len(entries)}) Searching images for: {manufacturer} | PN='{part_number}' | id={motion_id}")
 
-            image_urls = []
-
-            if man_website and con_url:
-                log_stage("Searching OEM", f"site:{con_url} PN='{part_number}'")
-                image_urls = fetch_image_urls(manufacturer, part_number, con_url, description)
-                if image_urls:
-                    log_ok("[OEM] Found candidates")
-                else:
-                    log_skip("[OEM] Not found")
-
-            if (not image_urls) and ('ctx_hosts' in locals()) and len(ctx_hosts) >= 1:
-                tried_oem_host = con_url if (man_website and con_url) else None
-                for host, source_type in ctx_hosts:
-                    if tried_oem_host and host == tried_oem_host:
-                        continue
-
-                    if source_type == "OEM":
-                        log_stage("Searching OEM", f"site:{host} PN='{part_number}'")
-                    elif source_type == "Enterprise":
-                        log_stage("Searching Enterprise", f"site:{host} PN='{part_number}'")
-                    elif source_type == "Distributor":
-                        log_stage("Searching non-OEM distributors", f"site:{host} PN='{part_number}'")
-                    else:
-                        log_stage("Searching General", f"site:{host} PN='{part_number}'")
-
-                    man_website = (source_type == "OEM")
-                    forced_site = None if man_website else host
-
-                    image_urls = fetch_image_urls(manufacturer, part_number, host if man_website else "", description)
-                    if image_urls:
-                        if source_type == "OEM":
-                            log_ok("[OEM] Found candidates")
-                        elif source_type == "Enterprise":
-                            log_ok("[Enterprise] Found candidates")
-                        elif source_type == "Distributor":
-                            log_ok("[Distributor] Found candidates")
-                        else:
-                            log_ok("[General] Found candidates")
-                        break
-                    else:
-                        if source_type == "OEM":
-                            log_skip("[OEM] Not found")
-                        elif source_type == "Enterprise":
-                            log_skip("[Enterprise] Not found")
-                        elif source_type == "Distributor":
-                            log_skip("[Distributor] Not found")
-                        else:
-                            log_skip("[General] Not found")
-
-                forced_site = None
-
-            if not image_urls:
-                log_stage("General image search", f"MFR='{manufacturer}' PN='{part_number}'")
-                man_website = False
-                forced_site = None
-                image_urls = fetch_image_urls(manufacturer, part_number, "", description)
-                if image_urls:
-                    log_ok("[General] Found candidates")
-                else:
-                    log_skip("[General] Not found")
-
-            if image_urls:
-                log_step("Downloading images...")
-                download_images(image_urls, manufacturer, part_number, item_number, output_dir, motion_id, description)
-
-                staging_dir = f"{output_dir}/images/staging"
-                if man_website:
-                    dest_dir = f"{output_dir}/images/specific/{manufacturer}/{motion_id}"
-                else:
-                    dest_dir = f"{output_dir}/images/generic/{manufacturer}/{motion_id}"
-
-                resize_images(staging_dir, dest_dir)
-                # NEW: bring sidecars along to the final folder
-                copy_sidecars_from_staging(staging_dir, dest_dir)
-
-                clear_directory(output_dir)
-
-                # Add metadata for this SKU
-                metadata.append({
-                    "sku": motion_id,
-                    "manufacturer": manufacturer,
-                    "part_number": part_number,
-                    "image_urls": image_urls
-                })
-            else:
-                log_skip(f"No images found for {manufacturer} {part_number}.")
+            entry = scrape_sku(manufacturer, part_number, item_number, description, motion_id, ctx_hosts, output_dir)
+            if entry:
+                metadata.append(entry)
 
     # Save metadata to JSON file
     save_metadata(metadata, output_dir)
+    flush_index_spool()
+    save_run_metrics(metrics.run_summary(since=run_start), output_dir)
+    if profiler is not None:
+        profiler.stop()
+        try:
+            folded_path, top_path = profiler.write(output_dir)
+            log_ok(f"Profile ({profiler.samples} samples) saved to {folded_path} and {top_path}")
+        except Exception as e:
+            log_err(f"Failed to save profile: {e}")
 
     running = False
-    run_button.config(state=tk.NORMAL)
+    if on_finished:
+        on_finished()
     log_ok("Scraping finished.")
     return
 
+# === Work queue (see work_queue.py) ===
+def _plain(value):
+    # numpy scalars from pandas -> JSON-friendly Python values
+    return value.item() if hasattr(value, "item") else value
+
+# Turn spreadsheet rows into queue jobs, one per SKU keyed by Motion id, with the manufacturer's
+# context hosts resolved up front so workers never need the context sheet.
+# Returns (rows considered, jobs added); rows already queued are skipped.
+def enqueue_entries(queue, excel_file, context_file, entry_range_x=0, entry_range_y=0):
+    from excel_parse import get_entries, get_context_urls
+
+    entries = get_entries(excel_file)
+    context_urls = get_context_urls(context_file)
+    hosts_by_mfr = {}
+    jobs = []
+    for i, (manufacturer, part_number, item_number, description, motion_id) in enumerate(entries):
+        if (entry_range_x != 0 and i < entry_range_x - 1) or (entry_range_y != 0 and entry_range_y <= i):
+            continue
+        if manufacturer not in hosts_by_mfr:
+            hosts_by_mfr[manufacturer] = resolve_context_hosts(manufacturer, context_urls)
+        jobs.append((str(_plain(motion_id)), {
+            "manufacturer": _plain(manufacturer),
+            "part_number": _plain(part_number),
+            "item_number": _plain(item_number),
+            "description": _plain(description),
+            "motion_id": _plain(motion_id),
+            "ctx_hosts": hosts_by_mfr[manufacturer],
+        }))
+    return len(jobs), queue.enqueue(jobs)
+
+# Lease jobs and scrape them until the queue is drained, max_jobs are done or should_stop is set.
+# Jobs still leased by other workers (or waiting out a retry backoff) keep this worker polling,
+# so a job whose worker died is picked up once its lease expires.
+# Each worker appends its SKUs to sku_metadata.<worker>.jsonl and writes run_metrics.<worker>.json.
+def run_worker(queue, output_dir, worker_id=None, max_jobs=0, poll_interval=5.0):
+    from work_queue import Heartbeat, default_worker_id
+
+    worker_id = worker_id or default_worker_id()
+    tag = safe_name(worker_id)
+    staging_dir = os.path.join(output_dir, "images", f"staging-{tag}")
+    metadata_file = os.path.join(output_dir, f"sku_metadata.{tag}.jsonl")
+    run_start = metrics.snapshot()
+    done = 0
+    log_step(f"Worker {worker_id} started: {queue.stats()}")
+
+    while not should_stop and not (max_jobs and done >= max_jobs):
+        job = queue.lease(worker_id)
+        if job is None:
+            stats = queue.stats()
+            if stats["pending"] == 0 and stats["leased"] == 0:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        p = job.payload
+        log_step(f"[job {job.id}, attempt {job.attempts}] Searching images for: {p['manufacturer']} | "
+                 f"PN='{p['part_number']}' | id={p['motion_id']}")
+        try:
+            with Heartbeat(queue, job) as hb:
+                entry = scrape_sku(p["manufacturer"], p["part_number"], p["item_number"], p["description"],
+                                   p["motion_id"], [tuple(h) for h in p["ctx_hosts"]], output_dir,
+                                   staging_dir=staging_dir)
+        except KeyboardInterrupt:
+            queue.release(job)
+            raise
+        except Exception as e:
+            state = queue.fail(job, repr(e))
+            log_err(f"[job {job.id}] failed ({state or 'lease lost'}): {e}")
+            continue
+
+        if entry:
+            with open(metadata_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        if hb.lost or not queue.complete(job, result=entry):
+            log_err(f"[job {job.id}] lease was lost while working; another worker may repeat it")
+        done += 1
+
+    flush_index_spool()
+    save_run_metrics(metrics.run_summary(since=run_start), output_dir, filename=f"run_metrics.{tag}.json")
+    log_ok(f"Worker {worker_id} finished after {done} job(s): {queue.stats()}")
+    return done
+
 def on_closing():
     global should_stop
     if messagebox.askokcancel("Quit", "Do you want to quit?"):
@@ -655,6 +825,7 @@ def save_config(name, value):
         with open(CONFIG_FILE, "r") as f:
             config = json.load(f)
     config[name] = value
+    os.makedirs(CONFIG_DIR, exist_ok=True)
     with open(CONFIG_FILE, "w") as f:
         json.dump(config, f)
 
@@ -665,8 +836,14 @@ def load_config(name):
             return config.get(name, "")
     return ""
 
-# Main Function 
-if __name__ == "__main__":
+# GUI
+def launch_gui():
+    global tk, filedialog, messagebox, on_progress, on_finished
+    global root, frame, file_var, output_var, context_var, entry_var_x, entry_var_y, run_button
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    from PIL import Image, ImageTk
+
     root = tk.Tk()
     root.config(padx=30, pady=30) 
     root.title("")
@@ -704,7 +881,7 @@ if __name__ == "__main__":
     tk.Label(frame, text="Select Excel File for input:").grid(row=2, column=0, sticky="w", padx=5, pady=5)
     tk.Entry(frame, textvariable=file_var, width=50, bd=1, relief="solid", highlightthickness=2).grid(row=2, column=1, padx=5, pady=5, sticky="ew")
     tk.Button(frame, text="Browse", command=lambda: [
-        file_var.set(askopenfilename(initialdir="/host_files", filetypes=[("Excel files", "*.xlsx")], title="Select an Excel file")),
+        file_var.set(filedialog.askopenfilename(initialdir="/host_files", filetypes=[("Excel files", "*.xlsx")], title="Select an Excel file")),
         save_config("file_var", file_var.get())
         ]
     ).grid(row=2, column=2, padx=5, pady=5)
@@ -713,7 +890,7 @@ if __name__ == "__main__":
     tk.Label(frame, text="Select Excel File for context URLs:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
     tk.Entry(frame, textvariable=context_var, width=50, bd=1, relief="solid", highlightthickness=2).grid(row=3, column=1, padx=5, pady=5, sticky="ew")
     tk.Button(frame, text="Browse", command=lambda: [
-        context_var.set(askopenfilename(initialdir="/host_files", filetypes=[("Excel files", "*.xlsx")], title="Select an Excel file")),
+        context_var.set(filedialog.askopenfilename(initialdir="/host_files", filetypes=[("Excel files", "*.xlsx")], title="Select an Excel file")),
         save_config("context_var", context_var.get())
         ]
         ).grid(row=3, column=2, padx=5, pady=5)
@@ -734,6 +911,101 @@ if __name__ == "__main__":
         ]
         ).grid(row=4, column=2, padx=5, pady=5)
 
+    on_progress = lambda current, total: tk.Label(frame, text=f"Entry ({current}/{total})").grid(row=6, column=1, padx=10, pady=10)
+    on_finished = lambda: run_button.config(state=tk.NORMAL)
+
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
     root.mainloop()
+
+
+def run_headless(args):
+    """Scrape without the GUI, for servers, containers and worker pools."""
+    if not (args.input and args.context and args.output):
+        raise SystemExit("--headless needs --input, --context and --output")
+    os.makedirs(args.output, exist_ok=True)
+    log_step("Scraping started (headless).")
+    start_scraping(args.input, args.range[0], args.range[1], args.context, args.output)
+
+
+def run_enqueue(args):
+    """Load a spreadsheet into the work queue."""
+    from work_queue import open_queue
+
+    if not (args.input and args.context):
+        raise SystemExit("--enqueue needs --input and --context")
+    queue = open_queue(args.queue, name=args.queue_name)
+    try:
+        total, added = enqueue_entries(queue, args.input, args.context, args.range[0], args.range[1])
+        log_ok(f"Queued {added} new job(s) from {total} row(s) ({total - added} already queued): {queue.stats()}")
+    finally:
+        queue.close()
+
+
+def run_queue_worker(args):
+    """Drain the work queue; SIGTERM/Ctrl+C finish (or hand back) the current job before exiting."""
+    import signal
+    from work_queue import open_queue
+
+    if not args.output:
+        raise SystemExit("--worker needs --output")
+
+    def stop(signum, frame):
+        global should_stop
+        should_stop = True
+        log_step("Stop requested; finishing the current job.")
+
+    signal.signal(signal.SIGTERM, stop)
+    os.makedirs(args.output, exist_ok=True)
+    queue = open_queue(args.queue, name=args.queue_name)
+    try:
+        run_worker(queue, args.output, worker_id=args.worker_id or None, max_jobs=args.max_jobs)
+    finally:
+        queue.close()
+
+
+def parse_args(argv=None):
+    import argparse
+
+    p = argparse.ArgumentParser(description="Find, score and save product images for the SKUs in an Excel sheet.")
+    p.add_argument("--headless", action="store_true", help="Run without the GUI")
+    p.add_argument("--input", default="", help="Excel file with the SKUs to scrape")
+    p.add_argument("--context", default="", help="Excel file with context URLs")
+    p.add_argument("--output", default="", help="Output directory")
+    p.add_argument("--range", nargs=2, type=int, default=(0, 0), metavar=("X", "Y"),
+                   help="Entries X..Y only (default 0 0 = all)")
+    p.add_argument("--log-level", default=None, help="Overrides SCRAPER_LOG_LEVEL")
+    p.add_argument("--profile", action="store_true",
+                   help="Sample the scraping thread; writes profile.folded and profile_top.txt next to sku_metadata.json")
+    p.add_argument("--metrics-port", type=int, default=int(os.getenv("SCRAPER_METRICS_PORT", "0")),
+                   help="Serve Prometheus metrics on 127.0.0.1:<port>/metrics (default off)")
+    q = p.add_argument_group("work queue (see work_queue.py)")
+    q.add_argument("--enqueue", action="store_true", help="Queue the --input rows as jobs instead of scraping them")
+    q.add_argument("--worker", action="store_true", help="Headless worker: scrape queued jobs until the queue is drained")
+    q.add_argument("--queue", default=os.getenv("SCRAPER_QUEUE_URL", "scraper_queue.sqlite"),
+                   help="SQLite path or redis:// URL (default SCRAPER_QUEUE_URL or scraper_queue.sqlite)")
+    q.add_argument("--queue-name", default="default", help="Queue name within the backend")
+    q.add_argument("--worker-id", default="", help="Defaults to <hostname>-<pid>")
+    q.add_argument("--max-jobs", type=int, default=0, help="Exit after this many jobs (default 0 = until drained)")
+    return p.parse_args(argv)
+
+
+# Main Function 
+if __name__ == "__main__":
+    args = parse_args()
+    # Queue-based logging to the terminal and scraper_logs.txt; level/format selectable via
+    # SCRAPER_LOG_LEVEL / SCRAPER_LOG_FORMAT (see scraper_logging.py)
+    configure_logging(level=args.log_level)
+    if args.profile:
+        profile_enabled = True
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+        log_ok(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.enqueue:
+        run_enqueue(args)
+    elif args.worker:
+        run_queue_worker(args)
+    elif args.headless:
+        run_headless(args)
+    else:
+        launch_gui()
@@ -3,7 +3,6 @@
 # Safe to import from any script in your pipeline.
 
 from __future__ import annotations
-import hashlib
 import json
 import time
 import shutil
@@ -12,24 +11,18 @@ from typing import Optional, Dict, Any
 
 from PIL import Image
 
-try:
-    import imagehash #type: ignore # optional; used for perceptual hash
-except Exception:
-    imagehash = None
+from image_hashing import phash, sha256_bytes
 
 
 # ---------- small utilities ----------
 
 def _sha256_bytes(data: bytes) -> str:
-    h = hashlib.sha256()
-    h.update(data)
-    return h.hexdigest()
+    return sha256_bytes(data)
 
 def _phash_pil(im: Image.Image) -> Optional[str]:
-    if imagehash is None:
-        return None
+    # same value as str(imagehash.phash(im)), without building an ImageHash (see image_hashing.py)
     try:
-        return str(imagehash.phash(im))
+        return phash(im)
     except Exception:
         return None
 
@@ -40,8 +33,10 @@ def _now_iso_z() -> str:
 def build_sidecar_schema(
     *,
     image_path: str,
-    image_bytes: bytes,
+    image_bytes: Optional[bytes] = None,
     im: Image.Image,
+    sha256: Optional[str] = None,
+    filesize: Optional[int] = None,
     manufacturer: str,
     part_number: str,
     description: Optional[str] = None,
@@ -52,8 +47,12 @@ def build_sidecar_schema(
 ) -> Dict[str, Any]:
     """
     Construct the authoritative JSON sidecar for an image.
+    Pass either `image_bytes`, or `sha256` + `filesize` already computed while streaming.
     Returns a dict ready to dump to `<image>.json`.
     """
+    if image_bytes is not None:
+        sha256 = sha256 or _sha256_bytes(image_bytes)
+        filesize = len(image_bytes) if filesize is None else filesize
     p = Path(image_path)
     width, height = im.size
     phash = _phash_pil(im)
@@ -63,8 +62,8 @@ def build_sidecar_schema(
             "format": (im.format or "jpeg").lower(),
             "width": int(width),
             "height": int(height),
-            "filesize": int(len(image_bytes)),
-            "sha256": _sha256_bytes(image_bytes),
+            "filesize": int(filesize) if filesize is not None else None,
+            "sha256": sha256,
             "phash": phash,
         },
         "product": {
@@ -122,21 +121,22 @@ def copy_sidecars_from_staging(staging_dir: str, dest_dir: str) -> None:
     d496.mkdir(parents=True, exist_ok=True)
     d064.mkdir(parents=True, exist_ok=True)
 
-    # Build sets of image basenames that actually exist in each subfolder
-    imgs_496 = {p.name for p in d496.glob("*") if p.is_file()}
-    imgs_064 = {p.name for p in d064.glob("*") if p.is_file()}
+    # Renditions keep the staged file's stem but not necessarily its extension
+    # (foo.png -> foo.jpg + foo.webp, plus a lossless foo.png for line art), so match on the stem
+    stems_496 = {p.stem for p in d496.glob("*") if p.is_file() and p.suffix != ".json"}
+    stems_064 = {p.stem for p in d064.glob("*") if p.is_file() and p.suffix != ".json"}
 
     # For each staged sidecar, derive its image filename (e.g., "foo.jpg" from "foo.jpg.json")
     for sc in sdir.glob("*.json"):
         base = sc.name[:-5]  # strip the trailing ".json" -> "foo.jpg"
-        # Copy into 496 if matching image exists
-        if base in imgs_496:
+        stem = Path(base).stem
+        # Copy into 496 if a matching rendition exists
+        if stem in stems_496:
             shutil.copy2(sc, d496 / (base + ".json"))
-        # Copy into 64 if matching image exists
-        if base in imgs_064:
+        # Copy into 64 if a matching rendition exists
+        if stem in stems_064:
             shutil.copy2(sc, d064 / (base + ".json"))
 
-
 __all__ = [
     "build_sidecar_schema",
     "write_sidecar_json",
@@ -0,0 +1,220 @@
+# model_registry.py
+# Versioned confidence-model artifacts: XGBoost native UBJSON + manifest.json.
+#
+# Layout:
+#   models/
+#     LATEST                      <- name of the version the scraper should use
+#     20250101-120000-ab12cd34/
+#       model.ubj                 <- booster in XGBoost's native format
+#       manifest.json             <- feature order, training data hash, metrics, params
+#
+# The scraper loads lazily through ModelRegistry.get(), which re-reads LATEST
+# every few seconds so a newly promoted model is picked up mid-run.
+
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(HERE, "models"))
+LEGACY_PICKLE = os.path.join(HERE, "image_classifier_confidence.pkl")
+LATEST_FILE = "LATEST"
+MODEL_FILE = "model.ubj"
+MANIFEST_FILE = "manifest.json"
+
+# "xgboost" scores with Booster.inplace_predict; "flat" uses tree_inference.FlatForest
+# (pure NumPy, no DMatrix/wrapper overhead) and falls back to XGBoost if the model can't be flattened
+INFERENCE_BACKEND = os.getenv("MODEL_INFERENCE_BACKEND", "xgboost")
+# Above this many rows the flat backend defers to XGBoost's multi-threaded predictor (see benchmarks/bench_inference.py)
+FLAT_MAX_BATCH = int(os.getenv("MODEL_FLAT_MAX_BATCH", "512"))
+
+# Feature order assumed for a legacy pickle that carries no feature names
+LEGACY_FEATURES = ["MFRSimilarity", "Entropy", "Sharpness", "Brightness", "WhiteRatio", "WhiteBorderRatio"]
+
+
+def _new_version(training_data_sha256: Optional[str]) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return f"{stamp}-{(training_data_sha256 or 'nodata')[:8]}"
+
+
+def save_model(
+    booster,
+    *,
+    features: Sequence[str],
+    training_data_sha256: Optional[str],
+    metrics: Dict[str, Any],
+    params: Optional[Dict[str, Any]] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    root: str = MODELS_DIR,
+    promote: bool = True,
+) -> str:
+    """
+    Write `booster` + manifest as a new version under `root`. Returns the version name.
+    With promote=True the LATEST pointer is switched atomically once both files are on disk.
+    """
+    import xgboost as xgb
+
+    version = _new_version(training_data_sha256)
+    vdir = os.path.join(root, version)
+    os.makedirs(vdir, exist_ok=True)
+    booster.save_model(os.path.join(vdir, MODEL_FILE))
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "format": "ubj",
+        "features": list(features),
+        "training_data_sha256": training_data_sha256,
+        "metrics": metrics,
+        "params": params or {},
+        "num_boosted_rounds": int(booster.num_boosted_rounds()),
+        "xgboost_version": xgb.__version__,
+    }
+    if extra:
+        manifest.update(extra)
+    with open(os.path.join(vdir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    if promote:
+        promote_version(version, root=root)
+    return version
+
+
+def promote_version(version: str, root: str = MODELS_DIR) -> None:
+    """Point LATEST at `version` (atomic rename, so readers never see a partial file)."""
+    if not os.path.exists(os.path.join(root, version, MANIFEST_FILE)):
+        raise FileNotFoundError(f"no model version {version!r} under {root}")
+    tmp = os.path.join(root, f".{LATEST_FILE}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(root, LATEST_FILE))
+
+
+def latest_version(root: str = MODELS_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(root, LATEST_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(version: str, root: str = MODELS_DIR) -> Dict[str, Any]:
+    with open(os.path.join(root, version, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_booster(version: str, root: str = MODELS_DIR):
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(os.path.join(root, version, MODEL_FILE))
+    return booster
+
+
+class LoadedModel:
+    """A loaded model version. predict() returns P(approved) for each row of X."""
+
+    def __init__(self, version: str, manifest: Dict[str, Any], booster=None, sk_model=None,
+                 backend: str = INFERENCE_BACKEND):
+        self.version = version
+        self.manifest = manifest
+        self.features = list(manifest.get("features") or LEGACY_FEATURES)
+        self.booster = booster
+        self._sk_model = sk_model
+        self._flat = None
+        self.backend = "xgboost"
+        if backend == "flat":
+            from tree_inference import FlatForest
+
+            try:
+                self._flat = FlatForest.from_booster(booster if booster is not None else sk_model.get_booster())
+                self.backend = "flat"
+            except NotImplementedError as e:
+                logging.warning(f"[model_registry] {version}: flat backend unavailable ({e}); using xgboost")
+
+    def predict(self, X):
+        import numpy as np
+
+        X = np.asarray(X, dtype=np.float32)
+        if self._flat is not None and len(X) <= FLAT_MAX_BATCH:
+            return self._flat.predict(X)
+        if self._sk_model is not None:
+            return self._sk_model.predict_proba(X)[:, 1]
+        # inplace_predict skips DMatrix construction; binary:logistic already returns probabilities
+        return self.booster.inplace_predict(X)
+
+    def vector(self, features: Dict[str, float]):
+        """Order a {feature name: value} dict the way this model was trained."""
+        missing = [name for name in self.features if name not in features]
+        if missing:
+            raise ValueError(f"model {self.version} expects features that were not computed: {missing}")
+        return [features[name] for name in self.features]
+
+
+class ModelRegistry:
+    """
+    Lazily loads the LATEST model version and hot-swaps when LATEST changes.
+    Falls back to the legacy joblib pickle when no native model has been published yet.
+    """
+
+    def __init__(self, root: str = MODELS_DIR, check_interval: float = 30.0, legacy_pickle: str = LEGACY_PICKLE,
+                 backend: str = INFERENCE_BACKEND):
+        self.root = root
+        self.backend = backend
+        self.check_interval = check_interval
+        self.legacy_pickle = legacy_pickle
+        self._lock = threading.Lock()
+        self._model: Optional[LoadedModel] = None
+        self._last_check = 0.0
+
+    def _load(self, version: Optional[str]) -> LoadedModel:
+        if version is None:
+            import joblib
+
+            sk_model = joblib.load(self.legacy_pickle)
+            features = sk_model.get_booster().feature_names or LEGACY_FEATURES
+            return LoadedModel("legacy-pickle", {"features": features}, sk_model=sk_model, backend=self.backend)
+        return LoadedModel(version, read_manifest(version, self.root), booster=load_booster(version, self.root),
+                           backend=self.backend)
+
+    def get(self) -> LoadedModel:
+        now = time.monotonic()
+        model = self._model
+        if model is not None and now - self._last_check < self.check_interval:
+            return model
+        with self._lock:
+            if self._model is not None and now - self._last_check < self.check_interval:
+                return self._model
+            self._last_check = now
+            version = latest_version(self.root)
+            if self._model is None:
+                self._model = self._load(version)
+            elif version is not None and version != self._model.version:
+                try:
+                    # Swap in one assignment; callers holding the old model finish with it unharmed
+                    self._model = self._load(version)
+                    logging.info(f"[model_registry] switched to model {version}")
+                except Exception as e:
+                    logging.error(f"[model_registry] keeping {self._model.version}, failed to load {version}: {e}")
+            return self._model
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._model.version if self._model is not None else None
+
+
+__all__ = [
+    "MODELS_DIR",
+    "save_model",
+    "promote_version",
+    "latest_version",
+    "read_manifest",
+    "load_booster",
+    "LoadedModel",
+    "ModelRegistry",
+]
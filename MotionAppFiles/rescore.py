@@ -0,0 +1,259 @@
+# rescore.py
+# Recompute `confidence` for existing image_metadata documents with the LATEST model,
+# without re-scraping.
+#
+#   python rescore.py --output-dir /host_files/out --image-cache ../MLModel/Output/Images
+#
+# - Streams documents with a point-in-time + search_after (no scroll contexts left behind).
+# - Image features come from the feature store: by the doc's image_sha256, by the sha256
+#   recorded in a sidecar for the same image_url, from a cached original image
+#   (`<image-cache>/<_id>.jpg`, as saved by MLModel/process_feedback.py), or, with
+#   --fetch-missing, by downloading the image once more.
+# - Scores whole pages in one vectorized predict call and writes back with _bulk
+#   partial updates, throttled to --max-docs-per-sec.
+# - Resumable: updated docs carry model_version, and docs already on the current version
+#   are excluded from the query; a checkpoint file lets a restart skip ahead by timestamp
+#   (docs without a timestamp sort last and are always kept).
+# - --from-mirror brings the local mirror (es_mirror.py) up to date and selects the documents
+#   from it instead of paging the cluster; only the updates go to Elasticsearch.
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from es_client import get_es, iter_pit_pages
+from feature_engineer import analyze_image, compute_filename_features, FEATURE_VERSION
+from feature_store import FeatureStore, sha256_file
+from model_registry import ModelRegistry
+
+INDEX_NAME = "image_metadata"
+PIT_KEEP_ALIVE = "5m"
+CHECKPOINT_FILE = "rescore_checkpoint.json"
+IMAGE_FEATURES = ("Resolution", "Entropy", "Sharpness", "Brightness", "WhiteRatio", "WhiteBorderRatio")
+
+
+def load_sidecar_index(output_dir):
+    """image_url -> image sha256, from every sidecar under the scraper's output dir."""
+    index = {}
+    if not output_dir:
+        return index
+    for path in glob.glob(os.path.join(output_dir, "images", "**", "*.json"), recursive=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                sc = json.load(f)
+            url = (sc.get("source") or {}).get("image_url")
+            sha = (sc.get("image") or {}).get("sha256")
+            if url and sha:
+                index[url] = sha
+        except Exception as e:
+            logging.debug(f"[rescore] unreadable sidecar {path}: {e}")
+    return index
+
+
+def load_checkpoint(path, model_version):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        cp = json.load(f)
+    # A checkpoint from another model version says nothing about what is left to do
+    return cp if cp.get("model_version") == model_version else {}
+
+
+def save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def mirror_pages(index, model_version, last_timestamp, batch_size, force=False):
+    """The pages the query in rescore() selects, read from the local mirror."""
+    import es_mirror
+
+    df = es_mirror.load(index, columns=["image_url", "manufacturer", "image_sha256", "timestamp", "model_version"])
+    if not force:
+        df = df[df["model_version"].astype(object) != model_version]
+    if last_timestamp:
+        df = df[df["timestamp"].isna() | (df["timestamp"] >= last_timestamp)]
+    df = df.sort_values("timestamp", kind="stable", na_position="last")
+    yield from es_mirror.iter_hits(index, batch_size=batch_size, df=df.drop(columns=["model_version"]))
+
+
+def fetch_features(image_url, store, sess, cache_dir):
+    """Download an image that isn't cached anywhere and run it through the feature store."""
+    import requests  # only needed with --fetch-missing
+
+    resp = (sess or requests).get(image_url, timeout=20)
+    resp.raise_for_status()
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"rescore_{abs(hash(image_url))}.img")
+    with open(path, "wb") as f:
+        f.write(resp.content)
+    try:
+        return store.get_or_compute(path, analyze_image)
+    finally:
+        os.unlink(path)
+
+
+class Throttle:
+    """Sleep as needed so no more than `rate` documents per second are written."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.count = 0
+
+    def wait(self, n):
+        self.count += n
+        if not self.rate:
+            return
+        ahead = self.count / self.rate - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def rescore(args):
+    from elasticsearch import helpers
+
+    es = get_es()
+    model = ModelRegistry(check_interval=float("inf")).get()  # one version for the whole job
+    store = FeatureStore(FEATURE_VERSION)
+    sidecars = load_sidecar_index(args.output_dir)
+    logging.info(f"[rescore] model={model.version} features={model.features} sidecars={len(sidecars)}")
+
+    checkpoint_path = args.checkpoint or os.path.join(args.output_dir or ".", CHECKPOINT_FILE)
+    cp = {} if args.restart else load_checkpoint(checkpoint_path, model.version)
+    stats = cp.get("stats") or {"seen": 0, "scored": 0, "updated": 0, "no_features": 0, "errors": 0}
+
+    filters = []
+    if not args.force:
+        filters.append({"bool": {"must_not": {"term": {"model_version.keyword": model.version}}}})
+    if cp.get("last_timestamp"):
+        # docs without a timestamp sort last, after every checkpoint: keep them
+        filters.append({"bool": {"should": [
+            {"range": {"timestamp": {"gte": cp["last_timestamp"]}}},
+            {"bool": {"must_not": {"exists": {"field": "timestamp"}}}},
+        ], "minimum_should_match": 1}})
+    query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+    sess = None
+    if args.fetch_missing:
+        import requests
+
+        sess = requests.Session()
+        sess.headers.update({"User-Agent": "Mozilla/5.0"})
+
+    throttle = Throttle(args.max_docs_per_sec)
+    sort = [{"timestamp": {"order": "asc", "unmapped_type": "date"}}, {"_shard_doc": "asc"}]
+    source = ["image_url", "manufacturer", "image_sha256", "timestamp"]
+    if args.from_mirror:
+        import es_mirror
+
+        es_mirror.sync(es, args.index, log=logging.info)
+        pages = mirror_pages(args.index, model.version, cp.get("last_timestamp"), args.batch_size, args.force)
+    else:
+        pages = iter_pit_pages(es, args.index, query, args.batch_size, sort, source=source, keep_alive=PIT_KEEP_ALIVE)
+    for hits in pages:
+        stats["seen"] += len(hits)
+
+        # Resolve image sha256 for the whole page, then fetch cached features in one query
+        shas = {}
+        for h in hits:
+            src = h["_source"]
+            sha = src.get("image_sha256") or sidecars.get(src.get("image_url"))
+            if not sha and args.image_cache:
+                cached = os.path.join(args.image_cache, f"{h['_id']}.jpg")
+                if os.path.exists(cached):
+                    sha = sha256_file(cached)
+                    store.get_or_compute(cached, analyze_image, sha256=sha)
+            if sha:
+                shas[h["_id"]] = sha
+        cached_features = store.get_many(list(shas.values()))
+
+        ids, rows = [], []
+        for h in hits:
+            src = h["_source"]
+            feats = cached_features.get(shas.get(h["_id"]))
+            if feats is None and args.fetch_missing and src.get("image_url"):
+                try:
+                    feats = fetch_features(src["image_url"], store, sess, args.tmp_dir)
+                except Exception as e:
+                    logging.debug(f"[rescore] fetch failed for {src.get('image_url')}: {e}")
+            if feats is None or None in feats:
+                stats["no_features"] += 1
+                continue
+            values = dict(zip(IMAGE_FEATURES, feats))
+            values["MFRSimilarity"] = compute_filename_features(src.get("image_url") or "", src.get("manufacturer"))
+            try:
+                rows.append(model.vector(values))
+                ids.append(h["_id"])
+            except ValueError as e:
+                raise SystemExit(f"[rescore] {e}")
+
+        if rows:
+            scores = model.predict(np.asarray(rows, dtype=np.float32))
+            stats["scored"] += len(ids)
+            now = datetime.now(timezone.utc).isoformat()
+            actions = (
+                {
+                    "_op_type": "update",
+                    "_index": args.index,
+                    "_id": doc_id,
+                    "doc": {"confidence": float(score), "model_version": model.version, "rescored_at": now},
+                }
+                for doc_id, score in zip(ids, scores)
+            )
+            if args.dry_run:
+                for a in actions:
+                    logging.debug(f"[rescore] dry-run {a['_id']} -> {a['doc']['confidence']:.4f}")
+            else:
+                for ok, item in helpers.streaming_bulk(es, actions, chunk_size=args.bulk_size, raise_on_error=False,
+                                                       max_retries=3):
+                    if ok:
+                        stats["updated"] += 1
+                    else:
+                        stats["errors"] += 1
+                        logging.error(f"[rescore] update failed: {item}")
+            throttle.wait(len(ids))
+
+        cp = {
+            "model_version": model.version,
+            "last_timestamp": hits[-1]["_source"].get("timestamp") or cp.get("last_timestamp"),
+            "stats": stats,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if not args.dry_run:
+            save_checkpoint(checkpoint_path, cp)
+        logging.info(f"[rescore] {stats}")
+
+    logging.info(f"[rescore] done: {stats} (feature store hits={store.hits}, misses={store.misses})")
+    return stats
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Re-score image_metadata documents with the LATEST model.")
+    p.add_argument("--index", default=INDEX_NAME)
+    p.add_argument("--output-dir", default="", help="Scraper output dir; its sidecars map image_url -> sha256")
+    p.add_argument("--image-cache", default="", help="Dir of original images named <doc _id>.jpg")
+    p.add_argument("--fetch-missing", action="store_true", help="Download images that aren't cached anywhere")
+    p.add_argument("--tmp-dir", default=os.path.join(os.getenv("TMPDIR", "/tmp"), "rescore"))
+    p.add_argument("--batch-size", type=int, default=2000, help="Docs per page / predict call")
+    p.add_argument("--bulk-size", type=int, default=500, help="Updates per _bulk request")
+    p.add_argument("--max-docs-per-sec", type=float, default=500.0, help="Write throttle (0 = unthrottled)")
+    p.add_argument("--checkpoint", default="", help=f"Checkpoint path (default: <output-dir>/{CHECKPOINT_FILE})")
+    p.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    p.add_argument("--force", action="store_true", help="Also re-score docs already on the current model version")
+    p.add_argument("--from-mirror", action="store_true", help="Select docs from the local mirror (es_mirror.py)")
+    p.add_argument("--dry-run", action="store_true", help="Score but don't write to Elasticsearch")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    rescore(parse_args())
@@ -0,0 +1,181 @@
+# rollups.py
+# Per-manufacturer review rollups, so the workbench's facets don't aggregate all of image_metadata.
+#
+# One small document per (manufacturer, status) in the image_metadata_rollups index, _id
+# "<manufacturer>|<status>":
+#   manufacturer, status      keyword ("" when the source docs have none)
+#   count                     documents in the group
+#   confidence_buckets        counts per BUCKET_WIDTH-wide confidence bucket, lowest first
+#                             (confidence 1.0 lands in the last one)
+#   no_confidence             documents without a confidence
+#   latest_timestamp          newest `timestamp` (scraped) in the group
+#   latest_updated_at         newest `updated_at` (reviewed) in the group
+#   rolled_up_at              when this document last changed
+# A facet with a min_confidence that is a multiple of BUCKET_WIDTH is the sum of the buckets from
+# that one up; /api/facets answers manufacturer / status facets this way and falls back to the
+# terms aggregation for anything else (manufacturer, SKU or date filters, unaligned confidence).
+#
+# Updates come from the local mirror (es_mirror.py), not from counters bumped by each writer:
+# documents change in the scraper (index), the review UI (status) and rescore.py (confidence),
+# and increments from three writers in two languages drift. `update` syncs the mirror (only
+# the documents changed since the last sync are read from ES), recomputes the groups locally
+# and writes only the rollup documents whose values changed, deleting groups that emptied.
+# Running it again with nothing new writes nothing.
+#
+# Environment:
+#   ROLLUP_INDEX   rollup index name (default image_metadata_rollups)
+#
+# Usage:
+#   python rollups.py update [--no-sync] [--dry-run]
+#   python rollups.py follow --interval 60      # update forever (cron / a sidecar container)
+#   python rollups.py show [--manufacturer Timken]
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import es_mirror
+
+SOURCE_INDEX = "image_metadata"
+ROLLUP_INDEX = os.getenv("ROLLUP_INDEX", "image_metadata_rollups")
+BUCKET_WIDTH = 0.05
+BUCKETS = round(1 / BUCKET_WIDTH)
+EDGES = (np.arange(BUCKETS) * BUCKET_WIDTH).astype(np.float32)
+FIELDS = ["count", "confidence_buckets", "no_confidence", "latest_timestamp", "latest_updated_at"]
+
+MAPPINGS = {
+    "properties": {
+        "manufacturer": {"type": "keyword"},
+        "status": {"type": "keyword"},
+        "count": {"type": "long"},
+        "confidence_buckets": {"type": "long"},
+        "no_confidence": {"type": "long"},
+        "latest_timestamp": {"type": "keyword"},  # scraper and UI timestamps differ in format
+        "latest_updated_at": {"type": "keyword"},
+        "rolled_up_at": {"type": "date"},
+    }
+}
+
+
+def rollup_id(manufacturer, status):
+    return f"{manufacturer}|{status}"
+
+
+def _latest(values):
+    values = [v for v in values if isinstance(v, str) and v]
+    return max(values) if values else None
+
+
+def compute(df):
+    """{rollup _id: rollup doc (without rolled_up_at)} for a load() of image_metadata."""
+    keys = df[["manufacturer", "status"]].astype(object).fillna("").astype(str)
+    conf = df["confidence"].to_numpy(dtype=np.float32, na_value=np.nan)
+    # Edges compared as float32, as ES compares `confidence >= 0.9` on a float field
+    bucket = np.searchsorted(EDGES, np.nan_to_num(conf), side="right") - 1
+    bucket = np.where(np.isnan(conf), -1, np.clip(bucket, 0, BUCKETS - 1))
+    frame = keys.assign(bucket=bucket, timestamp=df["timestamp"].astype(object),
+                        updated_at=df["updated_at"].astype(object))
+
+    out = {}
+    for (manufacturer, status), group in frame.groupby(["manufacturer", "status"], sort=True):
+        b = group["bucket"].to_numpy()
+        hist = np.bincount(b[b >= 0], minlength=BUCKETS)
+        out[rollup_id(manufacturer, status)] = {
+            "manufacturer": manufacturer,
+            "status": status,
+            "count": int(len(group)),
+            "confidence_buckets": [int(x) for x in hist],
+            "no_confidence": int((b < 0).sum()),
+            "latest_timestamp": _latest(group["timestamp"]),
+            "latest_updated_at": _latest(group["updated_at"]),
+        }
+    return out
+
+
+def published(es, index=ROLLUP_INDEX):
+    """{_id: source} of the rollup documents currently in ES."""
+    from es_client import iter_pit_pages
+
+    out = {}
+    for hits in iter_pit_pages(es, index, {"match_all": {}}, 5000, [{"_shard_doc": "asc"}]):
+        out.update((h["_id"], h["_source"]) for h in hits)
+    return out
+
+
+def diff(current, previous):
+    """(docs to write, ids to delete): only groups whose values changed."""
+    changed = {k: v for k, v in current.items()
+               if k not in previous or any(previous[k].get(f) != v[f] for f in FIELDS)}
+    return changed, sorted(set(previous) - set(current))
+
+
+def ensure_index(es, index=ROLLUP_INDEX):
+    if not es.indices.exists(index=index):
+        es.indices.create(index=index, mappings=MAPPINGS)
+
+
+def update(es, sync=True, dry_run=False, index=ROLLUP_INDEX, log=print):
+    """Bring the rollup index in line with image_metadata. Returns (written, deleted)."""
+    from elasticsearch import helpers
+
+    if sync:
+        es_mirror.sync(es, SOURCE_INDEX, log=log)
+    start = time.perf_counter()
+    df = es_mirror.load(SOURCE_INDEX, columns=["manufacturer", "status", "confidence", "timestamp", "updated_at"])
+    current = compute(df)
+    ensure_index(es, index)
+    changed, gone = diff(current, published(es, index))
+    log(f"[rollups] {len(df)} docs -> {len(current)} groups in {time.perf_counter() - start:.1f} s; "
+        f"{len(changed)} changed, {len(gone)} emptied")
+    if dry_run or not (changed or gone):
+        return len(changed), len(gone)
+
+    now = datetime.now(timezone.utc).isoformat()
+    actions = [{"_op_type": "index", "_index": index, "_id": k, "_source": {**v, "rolled_up_at": now}}
+               for k, v in changed.items()]
+    actions += [{"_op_type": "delete", "_index": index, "_id": k} for k in gone]
+    ok, errors = helpers.bulk(es, actions, raise_on_error=False, refresh="wait_for")
+    for e in errors:
+        log(f"[rollups] write failed: {e}")
+    return len(changed), len(gone)
+
+
+def main(argv=None):
+    import argparse
+
+    from es_client import get_es
+
+    ap = argparse.ArgumentParser(description="Maintain per-manufacturer review rollups.")
+    ap.add_argument("--index", default=ROLLUP_INDEX)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    u = sub.add_parser("update", help="Sync the mirror and write changed rollups")
+    u.add_argument("--no-sync", action="store_true", help="Use the mirror as it is")
+    u.add_argument("--dry-run", action="store_true", help="Report what would change")
+    f = sub.add_parser("follow", help="Run update every --interval seconds")
+    f.add_argument("--interval", type=float, default=60.0)
+    s = sub.add_parser("show", help="Print the published rollups")
+    s.add_argument("--manufacturer", default=None)
+    args = ap.parse_args(argv)
+
+    es = get_es()
+    if args.cmd == "update":
+        update(es, sync=not args.no_sync, dry_run=args.dry_run, index=args.index)
+    elif args.cmd == "follow":
+        while True:
+            started = time.monotonic()
+            try:
+                update(es, index=args.index)
+            except Exception as e:  # keep following through cluster hiccups
+                print(f"[rollups] update failed: {e}")
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    else:
+        for _id, src in sorted(published(es, args.index).items()):
+            if args.manufacturer is None or src.get("manufacturer") == args.manufacturer:
+                print(json.dumps({"_id": _id, **src}))
+
+
+if __name__ == "__main__":
+    main()
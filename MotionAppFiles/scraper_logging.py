@@ -0,0 +1,215 @@
+# scraper_logging.py
+# Non-blocking logging for the scraper.
+#
+# Callers only put records on a queue (QueueHandler); a QueueListener thread
+# does the coloured terminal output and the file writes, so the scraping
+# thread never waits on stdout or disk. Per-candidate DEBUG chatter is
+# rate-limited before it is even enqueued.
+#
+# Environment:
+#   SCRAPER_LOG_LEVEL        DEBUG | INFO | WARNING | ... (default DEBUG)
+#   SCRAPER_LOG_FORMAT       text | json  (json = one JSON object per line in the log file)
+#   SCRAPER_LOG_FILE         default scraper_logs.txt
+#   SCRAPER_DEBUG_PER_SEC    max DEBUG records per second per prefix (default 20, 0 = unlimited)
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    from colorama import init as _cinit, Fore, Style # type: ignore
+    _cinit(autoreset=True)
+except Exception:
+    class _Dummy:
+        def __getattr__(self, *_): return ""
+    Fore = Style = _Dummy()
+
+VERBOSE = True  # set False to reduce noise
+
+LOGGER_NAME = "scraper"
+logger = logging.getLogger(LOGGER_NAME)
+
+# level each prefix is written at (file + terminal)
+PREFIX_LEVELS = {
+    "STEP": logging.INFO,
+    "SEARCH": logging.INFO,
+    "CANDIDATE": logging.DEBUG,
+    "OK": logging.INFO,
+    "FILTER": logging.WARNING,
+    "SKIP": logging.WARNING,
+    "ERR": logging.ERROR,
+    "DBG": logging.DEBUG,
+}
+
+_listener = None
+_queue_handler = None
+_config_lock = threading.Lock()
+
+
+class DebugRateLimiter(logging.Filter):
+    """Token bucket per prefix for DEBUG records; counts what it drops and reports it on the next pass."""
+
+    def __init__(self, per_second):
+        super().__init__()
+        self.per_second = per_second
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.per_second:
+            return True
+        key = getattr(record, "prefix", record.name)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self._buckets.get(key, (self.per_second, now, 0))
+            tokens = min(self.per_second, tokens + (now - last) * self.per_second)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        record.suppressed = dropped
+        return True
+
+
+def _suffix(record):
+    n = getattr(record, "suppressed", 0)
+    return f" (+{n} similar suppressed)" if n else ""
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Coloured `[PREFIX] message` for the terminal."""
+
+    def format(self, record):
+        prefix = getattr(record, "prefix", record.levelname)
+        color = getattr(record, "color", "")
+        msg = record.getMessage() + _suffix(record)
+        if getattr(record, "dim", False):
+            return f"{Fore.WHITE}{Style.DIM}{color}[{prefix}]{Style.RESET_ALL} {msg}{Style.RESET_ALL}"
+        return f"{color}[{prefix}]{Style.RESET_ALL} {msg}"
+
+
+class TextFormatter(logging.Formatter):
+    """Same layout as the old basicConfig file log: `time [LEVEL] [PREFIX] message`."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] %(message)s")
+
+    def formatMessage(self, record):
+        prefix = getattr(record, "prefix", None)
+        record.message = (f"[{prefix}] " if prefix else "") + record.message + _suffix(record)
+        return super().formatMessage(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers and grep-free analysis."""
+
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "prefix": getattr(record, "prefix", None),
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            out["suppressed"] = record.suppressed
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False)
+
+
+def configure_logging(level=None, fmt=None, log_file=None, debug_per_sec=None):
+    """
+    Install the queue-based pipeline on the root logger (idempotent).
+    Everything logged through `logging` - scraper helpers and library modules alike -
+    goes through the queue.
+    """
+    global _listener, _queue_handler
+    with _config_lock:
+        if _listener is not None:
+            if level is not None:
+                set_log_level(level)
+            return
+        level = level or os.getenv("SCRAPER_LOG_LEVEL", "DEBUG")
+        fmt = fmt or os.getenv("SCRAPER_LOG_FORMAT", "text")
+        log_file = log_file or os.getenv("SCRAPER_LOG_FILE", "scraper_logs.txt")
+        if debug_per_sec is None:
+            debug_per_sec = float(os.getenv("SCRAPER_DEBUG_PER_SEC", "20"))
+
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(JsonLinesFormatter() if fmt == "json" else TextFormatter())
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+
+        q = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(q)
+        _queue_handler.addFilter(DebugRateLimiter(debug_per_sec))
+        _listener = logging.handlers.QueueListener(q, console_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        set_log_level(level)
+
+
+def set_log_level(level):
+    """Change the level at runtime, e.g. set_log_level("INFO") to silence per-candidate DEBUG output."""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.getLogger().setLevel(level)
+
+
+def shutdown_logging():
+    """Flush the queue and stop the listener thread (also runs at exit)."""
+    global _listener, _queue_handler
+    with _config_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = _queue_handler = None
+
+
+def _log(prefix, color, msg, dim=False):
+    if _listener is None:
+        configure_logging()  # nothing is set up at import time; the first log line does it
+    level = PREFIX_LEVELS.get(prefix, logging.INFO)
+    # Skip building the record entirely when the level is filtered out
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={"prefix": prefix, "color": color, "dim": dim})
+
+def log_step(msg):      _log("STEP",   Fore.CYAN,    msg)
+def log_search(msg):    _log("SEARCH", Fore.BLUE,    msg)
+def log_cand(msg):      _log("CANDIDATE", Fore.MAGENTA, msg)
+def log_ok(msg):        _log("OK",     Fore.GREEN,   msg)
+def log_filter(msg):    _log("FILTER", Fore.YELLOW,  msg)
+def log_skip(msg):      _log("SKIP",   Fore.YELLOW,  msg)
+def log_err(msg):       _log("ERR",    Fore.RED,     msg)
+def log_dbg(msg):
+    if VERBOSE: _log("DBG", Fore.WHITE, msg, dim=True)
+
+def log_stage(label, detail=""):
+    # Yellow banner like: [Searching OEM] site:foo.com PN='123'
+    msg = f"[{label}]"
+    if detail:
+        msg += f" {detail}"
+    log_filter(msg)
+
+
+__all__ = [
+    "configure_logging",
+    "set_log_level",
+    "shutdown_logging",
+    "log_step", "log_search", "log_cand", "log_ok", "log_filter", "log_skip", "log_err", "log_dbg", "log_stage",
+]
@@ -0,0 +1,330 @@
+# scraper_metrics.py
+# In-process counters and histograms for the scraper, with no extra dependencies.
+#
+# - Every stage of a SKU (search, download, decode, features, inference, sidecar,
+#   index, resize) is timed into scraper_stage_seconds{stage=...}.
+# - Counters record bytes downloaded, why candidates were rejected, index outcomes, ...
+# - start_http_server(port) serves everything in the Prometheus text format on
+#   http://127.0.0.1:<port>/metrics (image_scraper.py --metrics-port / SCRAPER_METRICS_PORT).
+# - run_summary() / write_run_summary() give the per-run view that is logged at the end
+#   of a run and saved as run_metrics.json next to sku_metadata.json.
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# seconds; searches and downloads can take a while, feature extraction is ms-scale
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_metrics = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[n]) for n in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _fmt_labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return {k: [v] for k, v in self._values.items()}
+
+    def render(self, state):
+        for key, (v,) in sorted(state.items()):
+            yield f"{self.name}{_fmt_labels(zip(self.labelnames, key))} {_fmt_value(v)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # key -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    v[i] += 1
+                    break
+            else:
+                v[len(self.buckets)] += 1
+            v[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def state(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._values.items()}
+
+    def render(self, state):
+        for key, v in sorted(state.items()):
+            base = list(zip(self.labelnames, key))
+            cumulative = 0
+            for b, n in zip(self.buckets + (float("inf"),), v[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket{_fmt_labels(base + [('le', _fmt_value(b) if b != float('inf') else '+Inf')])} {cumulative}"
+            yield f"{self.name}_sum{_fmt_labels(base)} {_fmt_value(v[-1])}"
+            yield f"{self.name}_count{_fmt_labels(base)} {cumulative}"
+
+    def quantile(self, q, counts):
+        """Estimate a quantile from bucket counts (linear within a bucket, like histogram_quantile)."""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for b, n in zip(self.buckets + (float("inf"),), counts):
+            if n and cumulative + n >= rank:
+                if b == float("inf"):
+                    return self.buckets[-1] if self.buckets else None
+                return lower + (b - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = b if b != float("inf") else lower
+        return lower
+
+
+def _register(cls, name, *args, **kwargs):
+    with _registry_lock:
+        m = _metrics.get(name)
+        if m is None:
+            m = _metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(m, cls):
+            raise ValueError(f"metric {name} already registered as {m.kind}")
+        return m
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter, name, help, labelnames)
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+    return _register(Histogram, name, help, buckets, labelnames)
+
+
+# === Scraper metrics ===
+STAGE_SECONDS = histogram("scraper_stage_seconds", "Time spent per pipeline stage", labelnames=("stage",))
+SEARCH_REQUESTS = counter("scraper_search_requests_total", "Image search requests", ("engine", "outcome"))
+SEARCH_RESULTS = histogram("scraper_search_results", "Candidate URLs returned by one fetch_image_urls call", SIZE_BUCKETS)
+CANDIDATES = counter("scraper_candidates_total", "Candidate images by outcome (accepted or the gate that rejected them)",
+                     ("outcome",))
+BYTES_DOWNLOADED = counter("scraper_bytes_downloaded_total", "Image bytes downloaded")
+INFERENCE_BATCH = histogram("scraper_inference_batch_size", "Rows per confidence-model predict call", SIZE_BUCKETS)
+INDEX_DOCS = counter("scraper_index_docs_total", "image_metadata index requests", ("outcome",))
+IMAGES_RESIZED = counter("scraper_images_resized_total", "Images written as 496/64 renditions")
+RENDITION_BYTES = counter("scraper_rendition_bytes_total", "Bytes written as renditions", ("format", "size"))
+SKUS = counter("scraper_skus_total", "SKUs processed", ("outcome",))
+
+
+_active_stages = {}  # thread ident -> stack of open stage names (read by scraper_profiler)
+
+
+@contextmanager
+def stage(name):
+    """`with stage("download"): ...` times the block into scraper_stage_seconds."""
+    stack = _active_stages.setdefault(threading.get_ident(), [])
+    stack.append(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage=name)
+        stack.pop()
+
+
+def current_stage(thread_ident):
+    """Innermost stage open on that thread, or None."""
+    stack = _active_stages.get(thread_ident)
+    return stack[-1] if stack else None
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# === Export ===
+def snapshot():
+    """Copy of every metric's current values; pass to run_summary(since=...) for a per-run view."""
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    return {m.name: m.state() for m in metrics}
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render(m.state()))
+    return "\n".join(lines) + "\n"
+
+
+def _diff(now, before):
+    out = {}
+    for key, values in now.items():
+        prev = before.get(key)
+        d = values if prev is None else [a - b for a, b in zip(values, prev)]
+        if any(d):
+            out[key] = d
+    return out
+
+
+def _round(v):
+    return None if v is None else round(v, 6)
+
+
+def run_summary(since=None):
+    """
+    {"stages": {stage: {count, total_s, mean_s, p50_s, p95_s}}, "counters": {...}, "histograms": {...}}
+    covering everything recorded after the `since` snapshot (or the whole process).
+    """
+    since = since or {}
+    summary = {"stages": {}, "counters": {}, "histograms": {}}
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    for m in metrics:
+        state = _diff(m.state(), since.get(m.name, {}))
+        if isinstance(m, Counter):
+            if state:
+                summary["counters"][m.name] = {",".join(k) or "total": v[0] for k, v in sorted(state.items())}
+            continue
+        for key, v in sorted(state.items()):
+            counts, total = v[:-1], v[-1]
+            n = sum(counts)
+            entry = {
+                "count": n,
+                "total": round(total, 6),
+                "mean": round(total / n, 6) if n else None,
+                "p50": _round(m.quantile(0.5, counts)),
+                "p95": _round(m.quantile(0.95, counts)),
+            }
+            if m is STAGE_SECONDS:
+                summary["stages"][key[0]] = {f"{k}_s" if k != "count" else k: val for k, val in entry.items()}
+            else:
+                summary["histograms"].setdefault(m.name, {})[",".join(key) or "all"] = entry
+    return summary
+
+
+def format_run_summary(summary):
+    """Human-readable lines for the end-of-run log."""
+    lines = []
+    stages = sorted(summary["stages"].items(), key=lambda kv: -kv[1]["total_s"])
+    if stages:
+        lines.append(f"{'stage':<14}{'count':>8}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        ms = (lambda v: f"{v * 1000:10.1f}" if v is not None else f"{'-':>10}")
+        for name, s in stages:
+            lines.append(f"{name:<14}{s['count']:>8}{s['total_s']:>10.2f}{ms(s['mean_s'])}{ms(s['p50_s'])}{ms(s['p95_s'])}")
+    for name, values in summary["counters"].items():
+        lines.append(f"{name}: " + ", ".join(f"{k}={_fmt_value(v)}" for k, v in values.items()))
+    return lines
+
+
+def write_run_summary(path, summary):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+
+# === HTTP endpoint ===
+_server = None
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread. Returns the server (idempotent per process)."""
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # keep scrapes out of the scraper log
+            pass
+
+    _server = ThreadingHTTPServer((host, int(port)), Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+__all__ = [
+    "counter", "histogram", "stage", "timed", "current_stage",
+    "STAGE_SECONDS", "SEARCH_REQUESTS", "SEARCH_RESULTS", "CANDIDATES", "BYTES_DOWNLOADED",
+    "INFERENCE_BATCH", "INDEX_DOCS", "IMAGES_RESIZED", "RENDITION_BYTES", "SKUS",
+    "snapshot", "render_prometheus", "run_summary", "format_run_summary", "write_run_summary",
+    "start_http_server",
+]
@@ -0,0 +1,119 @@
+# scraper_profiler.py
+# Low-overhead sampling profiler for a scraping run (image_scraper.py --profile).
+#
+# A daemon thread wakes every few milliseconds, grabs the scraping thread's current
+# Python stack via sys._current_frames() and counts it under the pipeline stage that
+# thread is in (scraper_metrics.stage). Nothing is hooked into the profiled code, so the
+# cost is one stack walk per sample and the scraper runs at normal speed.
+#
+# Samples are wall-clock: time spent waiting on the network shows up (under the socket
+# read frames), which is usually what matters for this pipeline.
+#
+# Output, next to sku_metadata.json:
+#   profile.folded    "stage;outer;...;inner <samples>" lines for flamegraph.pl / speedscope / inferno
+#   profile_top.txt   top-N functions per stage by self and inclusive samples
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_INTERVAL = float(os.getenv("SCRAPER_PROFILE_INTERVAL_MS", "5")) / 1000.0
+MAX_DEPTH = 128
+
+_labels = {}  # code object -> "func (file.py:line)"
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds until stopped or the thread exits."""
+
+    def __init__(self, thread_ident=None, interval=DEFAULT_INTERVAL, stage_of=None):
+        self.thread_ident = thread_ident or threading.get_ident()
+        self.interval = interval
+        self.stage_of = stage_of  # callable(thread_ident) -> stage name or None
+        self.stacks = Counter()  # (stage, (outer, ..., inner)) -> samples
+        self.samples = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        t0 = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            if frame is None:
+                break  # profiled thread has exited
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stage = (self.stage_of(self.thread_ident) if self.stage_of else None) or "other"
+            self.stacks[(stage, tuple(stack))] += 1
+            self.samples += 1
+        self.elapsed = time.perf_counter() - t0
+
+    # === Reports ===
+    def folded(self):
+        """Collapsed stacks, one line per distinct (stage, stack), stage as the root frame."""
+        return [f"{stage};{';'.join(stack)} {n}" for (stage, stack), n in sorted(self.stacks.items())]
+
+    def top(self, n=20):
+        """{stage: {"samples": int, "functions": [(label, self, inclusive), ...]}} sorted by self samples."""
+        per_stage = {}
+        for (stage, stack), count in self.stacks.items():
+            s = per_stage.setdefault(stage, {"samples": 0, "self": Counter(), "total": Counter()})
+            s["samples"] += count
+            if stack:
+                s["self"][stack[-1]] += count
+            for label in set(stack):  # recursion counts once per sample
+                s["total"][label] += count
+        out = {}
+        for stage, s in sorted(per_stage.items(), key=lambda kv: -kv[1]["samples"]):
+            ranked = sorted(s["total"], key=lambda f: (-s["self"][f], -s["total"][f]))[:n]
+            out[stage] = {"samples": s["samples"], "functions": [(f, s["self"][f], s["total"][f]) for f in ranked]}
+        return out
+
+    def format_top(self, n=20):
+        per_sample = self.elapsed / self.samples if self.samples else self.interval
+        lines = [f"{self.samples} samples over {self.elapsed:.1f} s (~{per_sample * 1000:.1f} ms/sample, wall clock)"]
+        for stage, s in self.top(n).items():
+            share = 100.0 * s["samples"] / self.samples if self.samples else 0.0
+            lines.append("")
+            lines.append(f"== {stage}: {s['samples']} samples ({share:.1f}%, ~{s['samples'] * per_sample:.2f} s)")
+            lines.append(f"{'self':>8}{'self %':>8}{'incl':>8}  function")
+            for label, self_n, total_n in s["functions"]:
+                lines.append(f"{self_n:>8}{100.0 * self_n / s['samples']:>7.1f}%{total_n:>8}  {label}")
+        return lines
+
+    def write(self, output_dir, top_n=20):
+        """Write profile.folded and profile_top.txt into output_dir; returns their paths."""
+        folded_path = os.path.join(output_dir, "profile.folded")
+        top_path = os.path.join(output_dir, "profile_top.txt")
+        with open(folded_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.folded()) + "\n")
+        with open(top_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.format_top(top_n)) + "\n")
+        return folded_path, top_path
+
+
+__all__ = ["SamplingProfiler", "DEFAULT_INTERVAL"]
@@ -0,0 +1,155 @@
+# search_extract.py
+# Candidate extraction from image-search result pages, without building a soup.
+#
+# fetch_image_urls only needs two things from a results page:
+#   Bing    the "m" (or "mad") JSON attribute of <a class="iusc|iuscp"> anchors -> murl / murl2
+#   Google  the src (or data-src) of every <img>
+# Both functions below are generators in document order, so the caller can stop after
+# num_images candidates and the rest of the page is never looked at.
+#
+# Backends (SCRAPER_SEARCH_EXTRACTOR, default "scan"):
+#   scan    one regex pass over the start tags, parsing attributes only for the wanted tag;
+#           comments and <script>/<style> bodies are skipped the way html.parser skips them
+#   stream  html.parser's tokenizer fed in slices, no tree (same tokenizer BeautifulSoup uses)
+#   lxml    libxml2 HTML parser (optional dependency)
+#   bs4     BeautifulSoup(html, "html.parser"), the original implementation; the reference
+# benchmarks/bench_search_extract.py checks that every backend returns the same candidates
+# as bs4 on saved pages (SCRAPER_SAVE_SEARCH_PAGES=<dir> makes the scraper save them).
+
+import html as _html
+import json
+import os
+import re
+from html.parser import HTMLParser
+
+try:
+    import lxml.html as lxml_html
+except Exception:
+    lxml_html = None
+
+DEFAULT_BACKEND = os.getenv("SCRAPER_SEARCH_EXTRACTOR", "scan")
+BING_ANCHOR_CLASSES = ("iusc", "iuscp")
+STREAM_SLICE = 32 * 1024
+
+_WS = re.compile(r"[ \t\n\r\f]+")
+
+
+# === Backends: yield the attribute dict of every <tag> element, in document order ===
+# Attribute names are lower-cased, values entity-decoded, valueless attributes are "",
+# and a repeated attribute keeps its last value (html.parser / BeautifulSoup behaviour).
+
+# Start-tag attributes; quoted values may contain ">". Written as unrolled loops ([^x]* runs
+# instead of per-character alternation) so long script bodies and attributes are skipped in bulk.
+_ATTRS = r"""[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*"""
+_SKIP = (
+    r"<!--[^-]*(?:-(?!->)[^-]*)*(?:-->)?"  # comment
+    + "".join(
+        rf"|<{raw}(?=[\s/>]){_ATTRS}>[^<]*(?:<(?!/\s*{raw}\s*>)[^<]*)*(?:</\s*{raw}\s*>)?"  # raw-text body
+        for raw in ("script", "style")
+    )
+)
+_OTHER_TAG = rf"<[a-z][^\s/>\x00]*{_ATTRS}>"  # consumed whole, so markup inside its attributes is never seen
+_ATTR = re.compile(r"""([^\s/>"'=][^\s/>=]*)(?:\s*=+\s*("[^"]*"|'[^']*'|(?!["'])[^>\s]*))?""")
+_token_res = {}
+
+
+def _token_re(tag):
+    if tag not in _token_res:
+        _token_res[tag] = re.compile(
+            rf"{_SKIP}|<{re.escape(tag)}(?=[\s/>])(?P<attrs>{_ATTRS})>|{_OTHER_TAG}", re.I | re.S
+        )
+    return _token_res[tag]
+
+
+def _scan(text, tag):
+    for m in _token_re(tag).finditer(text):
+        raw_attrs = m.group("attrs")
+        if raw_attrs is None:
+            continue
+        attrs = {}
+        for key, value in _ATTR.findall(raw_attrs):
+            if value[:1] in ("'", '"'):
+                value = value[1:-1]
+            attrs[key.lower()] = _html.unescape(value) if "&" in value else value
+        yield attrs
+
+
+class _Collector(HTMLParser):
+    def __init__(self, tag):
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.found = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == self.tag:
+            self.found.append({k: "" if v is None else v for k, v in attrs})
+
+
+def _stream(text, tag):
+    parser = _Collector(tag)
+    for i in range(0, len(text), STREAM_SLICE):
+        parser.feed(text[i:i + STREAM_SLICE])
+        yield from parser.found
+        parser.found.clear()
+    parser.close()
+    yield from parser.found
+
+
+def _lxml(text, tag):
+    if lxml_html is None:
+        raise RuntimeError("the lxml extractor needs lxml (pip install lxml)")
+    if not text.strip():
+        return
+    root = lxml_html.document_fromstring(text)
+    for el in root.iter(tag):
+        yield dict(el.attrib)
+
+
+def _bs4(text, tag):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    for el in soup.find_all(tag):
+        yield {k: " ".join(v) if isinstance(v, list) else v for k, v in el.attrs.items()}
+
+
+BACKENDS = {"scan": _scan, "stream": _stream, "lxml": _lxml, "bs4": _bs4}
+
+
+def _elements(text, tag, backend):
+    name = backend or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"unknown search extractor {name!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](text, tag)
+
+
+# === Extractors ===
+def bing_image_urls(text, backend=None):
+    """Full-size image URLs (murl, else murl2) from the metadata of Bing's a.iusc / a.iuscp anchors."""
+    for attrs in _elements(text, "a", backend):
+        classes = _WS.split(attrs.get("class") or "")
+        if not any(c in BING_ANCHOR_CLASSES for c in classes):
+            continue
+        meta_raw = attrs.get("m") or attrs.get("mad")
+        if not meta_raw:
+            continue
+        try:
+            meta = json.loads(meta_raw)
+        except Exception:
+            continue
+        if not isinstance(meta, dict):
+            continue
+        murl = meta.get("murl") or meta.get("murl2")
+        if murl:
+            yield murl
+
+
+def google_image_urls(text, backend=None):
+    """src (else data-src) of every <img> on a Google image results page."""
+    for attrs in _elements(text, "img", backend):
+        src = attrs.get("src") or attrs.get("data-src")
+        if src:
+            yield src
+
+
+__all__ = ["BACKENDS", "DEFAULT_BACKEND", "bing_image_urls", "google_image_urls"]
@@ -0,0 +1,271 @@
+# search_providers.py
+# Image search engines behind one interface, queried concurrently.
+#
+# A provider knows how to build its results-page URL for a query and how to pull candidate
+# image URLs out of that page (search_extract.py). candidates() sends the query to every
+# enabled provider at once, gives each one its own deadline, and then yields the merged
+# candidates in provider priority order (SCRAPER_SEARCH_ENGINES order; Bing before Google
+# by default). A slow or failing engine therefore costs at most its deadline, not a
+# sequential round-trip in front of the next engine.
+#
+# Candidates are normalised before merging (see normalize_url) and de-duplicated across
+# engines. Thumbnail-host and allowed-host filtering stays with the caller (fetch_image_urls).
+#
+# Adding an engine: subclass SearchProvider, decorate it with @register_provider and list its
+# name in SCRAPER_SEARCH_ENGINES.
+#
+# Environment:
+#   SCRAPER_SEARCH_ENGINES     comma-separated, in priority order (default "bing,google")
+#   SCRAPER_SEARCH_MODE        parallel (default) or sequential: only query the next engine
+#                              while the caller still needs candidates (less load on Google)
+#   SCRAPER_SEARCH_DEADLINE_S  per-engine deadline in seconds (default 15)
+#   SCRAPER_BING_URL / SCRAPER_GOOGLE_URL   endpoints (benchmarks point these at fake_services.py)
+#   SCRAPER_SAVE_SEARCH_PAGES  save every results page here (input for bench_search_extract.py)
+
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+import urllib.parse
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+import scraper_metrics as metrics
+from scraper_logging import log_dbg, log_err, log_search
+from search_extract import bing_image_urls, google_image_urls
+
+BING_IMAGES_URL = os.getenv("SCRAPER_BING_URL", "https://www.bing.com/images/search")
+GOOGLE_IMAGES_URL = os.getenv("SCRAPER_GOOGLE_URL", "https://www.google.com/search")
+SEARCH_ENGINES = [e.strip().lower() for e in os.getenv("SCRAPER_SEARCH_ENGINES", "bing,google").split(",") if e.strip()]
+SEARCH_MODE = os.getenv("SCRAPER_SEARCH_MODE", "parallel")
+SEARCH_DEADLINE = float(os.getenv("SCRAPER_SEARCH_DEADLINE_S", "15"))
+SAVE_SEARCH_PAGES_DIR = os.getenv("SCRAPER_SAVE_SEARCH_PAGES", "")
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# Query parameters that only identify the click/campaign, never the image
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "srsltid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+
+# === URL normalisation ===
+def normalize_url(url):
+    """
+    Canonical form of a candidate URL: lower-case scheme and host, no default port, no
+    fragment, tracking parameters removed. Everything else in the query is kept byte-for-byte
+    (re-encoding would break signed CDN URLs).
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    userinfo, at, hostport = parts.netloc.rpartition("@")
+    hostport = hostport.lower()
+    port = DEFAULT_PORTS.get(scheme)
+    if port and hostport.endswith(port):
+        hostport = hostport[: -len(port)]
+    query = "&".join(
+        p for p in parts.query.split("&")
+        if p and not _is_tracking(unquote_plus(p.split("=", 1)[0]).lower())
+    )
+    return urlunsplit((scheme, userinfo + at + hostport, parts.path or "/", query, ""))
+
+
+def _is_tracking(key):
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def dedupe_key(normalized):
+    """http and https copies of the same image count as one candidate."""
+    return normalized.split(":", 1)[-1]
+
+
+# === Providers ===
+class SearchProvider:
+    """One image search engine: its results-page URL and how candidates are read from the page."""
+
+    name = ""
+
+    def __init__(self, endpoint, deadline=SEARCH_DEADLINE):
+        self.endpoint = endpoint
+        self.deadline = deadline
+
+    def search_url(self, query):
+        raise NotImplementedError
+
+    def extract(self, text):
+        """Candidate URLs in page order (a generator, so merging can stop early)."""
+        raise NotImplementedError
+
+
+PROVIDERS = {}
+
+
+def register_provider(cls):
+    PROVIDERS[cls.name] = cls
+    return cls
+
+
+@register_provider
+class BingImages(SearchProvider):
+    name = "bing"
+
+    def __init__(self, endpoint=BING_IMAGES_URL, deadline=SEARCH_DEADLINE):
+        super().__init__(endpoint, deadline)
+
+    def search_url(self, query):
+        # "large photos" filter helps quality a lot
+        return f"{self.endpoint}?q={urllib.parse.quote(query)}&qft=%2Bfilterui%3Aimagesize-large%2Bfilterui%3Aphoto-photo"
+
+    def extract(self, text):
+        return bing_image_urls(text)
+
+
+@register_provider
+class GoogleImages(SearchProvider):
+    name = "google"
+
+    def __init__(self, endpoint=GOOGLE_IMAGES_URL, deadline=SEARCH_DEADLINE):
+        super().__init__(endpoint, deadline)
+
+    def search_url(self, query):
+        return f"{self.endpoint}?tbm=isch&q={urllib.parse.quote(query)}"
+
+    def extract(self, text):
+        return google_image_urls(text)
+
+
+def default_providers():
+    """Enabled providers in priority order (SCRAPER_SEARCH_ENGINES)."""
+    out = []
+    for name in SEARCH_ENGINES:
+        if name in PROVIDERS:
+            out.append(PROVIDERS[name]())
+        else:
+            log_err(f"Unknown search engine {name!r} in SCRAPER_SEARCH_ENGINES (known: {', '.join(PROVIDERS)})")
+    return out
+
+
+# === Fetching ===
+_local = threading.local()  # one requests.Session per thread, so connections to each engine are reused
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _session():
+    if getattr(_local, "session", None) is None:
+        import requests
+        _local.session = requests.Session()
+        _local.session.headers.update(HEADERS)
+    return _local.session
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(4, 2 * len(PROVIDERS)), thread_name_prefix="search"
+                )
+    return _executor
+
+
+def save_search_page(engine, url, text):
+    if not SAVE_SEARCH_PAGES_DIR:
+        return
+    try:
+        os.makedirs(SAVE_SEARCH_PAGES_DIR, exist_ok=True)
+        name = f"{engine}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.html"
+        with open(os.path.join(SAVE_SEARCH_PAGES_DIR, name), "w", encoding="utf-8") as f:
+            f.write(text)
+    except Exception as e:
+        log_err(f"Could not save search page: {e}")
+
+
+def fetch_page(provider, query, abandoned=None):
+    """
+    Results page text, or None on failure (counted in scraper_search_requests_total).
+    `abandoned` is set by fetch_pages when the deadline passed; the late result is then dropped
+    uncounted, since the timeout was already recorded.
+    """
+    url = provider.search_url(query)
+    log_search(f"{provider.name} images: {url}")
+    try:
+        with metrics.stage(f"search_{provider.name}"):
+            r = _session().get(url, timeout=provider.deadline)
+            r.raise_for_status()
+            text = r.text
+    except Exception as e:
+        if abandoned is None or not abandoned.is_set():
+            metrics.SEARCH_REQUESTS.inc(engine=provider.name, outcome="error")
+            log_err(f"{provider.name} search failed: {e}")
+        return None
+    if abandoned is not None and abandoned.is_set():
+        return None
+    save_search_page(provider.name, url, text)
+    metrics.SEARCH_REQUESTS.inc(engine=provider.name, outcome="ok")
+    return text
+
+
+def fetch_pages(query, providers):
+    """
+    Query all providers concurrently. Returns [(provider, text or None)] in priority order.
+    A provider that misses its deadline counts as a timeout; its request is left to finish
+    in the background (bounded by the same timeout) and the result is dropped.
+    """
+    start = time.monotonic()
+    jobs = []
+    for p in providers:
+        abandoned = threading.Event()
+        jobs.append((p, abandoned, _get_executor().submit(fetch_page, p, query, abandoned)))
+    pages = []
+    for provider, abandoned, future in jobs:
+        try:
+            pages.append((provider, future.result(timeout=max(0.0, start + provider.deadline - time.monotonic()))))
+        except concurrent.futures.TimeoutError:
+            abandoned.set()
+            metrics.SEARCH_REQUESTS.inc(engine=provider.name, outcome="timeout")
+            log_err(f"{provider.name} search missed its {provider.deadline:.0f}s deadline")
+            pages.append((provider, None))
+    return pages
+
+
+def candidates(query, providers=None, mode=None):
+    """
+    Normalised, de-duplicated candidate URLs for `query`, in provider priority order.
+    parallel:   every provider is queried up front (latency = the slowest engine within its deadline)
+    sequential: the next provider is only queried once the caller has consumed everything
+                before it, so stopping early skips the remaining engines
+    """
+    providers = default_providers() if providers is None else providers
+    mode = mode or SEARCH_MODE
+    if mode == "parallel":
+        with metrics.stage("search"):
+            pages = fetch_pages(query, providers)
+    else:
+        pages = ((p, fetch_page(p, query)) for p in providers)
+
+    seen = set()
+    for provider, text in pages:
+        if not text:
+            continue
+        n = 0
+        for url in provider.extract(text):
+            if not url or not url.startswith("http"):
+                continue
+            normalized = normalize_url(url)
+            key = dedupe_key(normalized)
+            if key in seen:
+                continue
+            seen.add(key)
+            n += 1
+            yield normalized
+        log_dbg(f"{provider.name}: {n} new candidate(s)")
+
+
+__all__ = [
+    "SearchProvider", "BingImages", "GoogleImages", "PROVIDERS", "register_provider", "default_providers",
+    "normalize_url", "candidates", "fetch_pages", "fetch_page",
+]
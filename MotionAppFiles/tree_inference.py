@@ -0,0 +1,144 @@
+# tree_inference.py
+# NumPy evaluator for the confidence model's boosted trees.
+#
+# XGBClassifier.predict_proba goes through the sklearn wrapper and DMatrix
+# construction on every call, which dwarfs the cost of walking ~100 small
+# trees over 6 features. FlatForest flattens every tree of a booster into
+# shared node arrays and walks all trees for all rows at once, one depth
+# level per step, so a batch of any size costs `max_depth` vectorized gathers.
+# That wins for the small batches of the scraper hot path; for very large
+# batches XGBoost's multi-threaded predictor is faster again, so
+# model_registry.LoadedModel hands those back to the booster (FLAT_MAX_BATCH).
+#
+# Only binary:logistic gbtree models with numerical splits are supported;
+# anything else raises NotImplementedError so callers fall back to XGBoost.
+
+from __future__ import annotations
+import json
+import math
+from typing import Any, Dict
+
+import numpy as np
+
+SUPPORTED_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+
+
+def _parse_base_score(raw: Any) -> float:
+    # XGBoost < 3 stores "5E-1", newer versions store a vector "[5E-1]"
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    return float(str(raw).strip("[]").split(",")[0])
+
+
+class FlatForest:
+    """All trees of a booster as flat node arrays (leaf nodes point at themselves)."""
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, max_depth, base_margin):
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        # children[2 * node + go_right] -> next node; one gather per level instead of two plus a select
+        self.children = np.stack([left, right], axis=1).ravel()
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_booster(cls, booster) -> "FlatForest":
+        return cls.from_json(json.loads(bytes(booster.save_raw("json"))))
+
+    @classmethod
+    def from_json(cls, model: Dict[str, Any]) -> "FlatForest":
+        learner = model["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise NotImplementedError(f"objective {objective!r} not supported")
+        gbm = learner["gradient_booster"]
+        if gbm.get("name") != "gbtree":
+            raise NotImplementedError(f"booster {gbm.get('name')!r} not supported")
+        trees = gbm["model"]["trees"]
+
+        # Early stopping leaves extra trees in the saved model; honour best_iteration like predict_proba does
+        best = learner.get("attributes", {}).get("best_iteration")
+        if best is not None:
+            trees = trees[: int(best) + 1]
+
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in trees:
+            if any(int(t) != 0 for t in tree.get("split_type", [])):
+                raise NotImplementedError("categorical splits not supported")
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+            n = len(lc)
+            leaf = lc == -1
+            idx = np.arange(n, dtype=np.int64)
+
+            feature.append(np.where(leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64)))
+            threshold.append(np.where(leaf, np.float32(np.inf), cond))
+            # leaves loop back to themselves so extra steps are no-ops
+            left.append(np.where(leaf, idx, lc) + offset)
+            right.append(np.where(leaf, idx, rc) + offset)
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            value.append(np.where(leaf, cond, np.float32(0)))
+            roots.append(offset)
+
+            depth = np.zeros(n, dtype=np.int64)
+            for i in range(n):  # children always have larger ids than their parent
+                if not leaf[i]:
+                    depth[lc[i]] = depth[rc[i]] = depth[i] + 1
+            max_depth = max(max_depth, int(depth.max()) if n else 0)
+            offset += n
+
+        base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+        base_margin = math.log(base_score / (1.0 - base_score))
+
+        cat = (lambda parts, dt: np.concatenate(parts).astype(dt) if parts else np.zeros(0, dtype=dt))
+        return cls(
+            feature=cat(feature, np.int32),
+            threshold=cat(threshold, np.float32),
+            left=cat(left, np.int32),
+            right=cat(right, np.int32),
+            default_left=cat(default_left, bool),
+            value=cat(value, np.float32),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            base_margin=base_margin,
+        )
+
+    def predict_margin(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n, n_features = X.shape
+        n_trees = self.num_trees
+        if n_trees == 0:
+            return np.full(n, self.base_margin)
+        flat_x = X.ravel()
+        # one cursor per (row, tree), row-major, plus the offset of that row in flat_x
+        node = np.tile(self.roots, n)
+        row_offset = np.repeat(np.arange(n, dtype=np.int32) * n_features, n_trees)
+        has_missing = bool(np.isnan(flat_x).any())
+        for _ in range(self.max_depth):
+            x = flat_x.take(row_offset + self.feature.take(node))
+            # XGBoost goes left when x < split_condition; NaN compares False so fix those up below
+            go_right = ~(x < self.threshold.take(node))
+            if has_missing:
+                missing = np.isnan(x)
+                go_right[missing] = ~self.default_left.take(node[missing])
+            node = self.children.take(2 * node + go_right)
+        return self.value.take(node).reshape(n, n_trees).sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict(self, X) -> np.ndarray:
+        """P(positive class) for each row, matching XGBClassifier.predict_proba(X)[:, 1]."""
+        return 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+
+
+__all__ = ["FlatForest"]
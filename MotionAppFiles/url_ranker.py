@@ -0,0 +1,462 @@
+# url_ranker.py
+# Ranks candidate image URLs before anything is downloaded.
+#
+# compute_filename_features (feature_engineer.py) scores the URL basename against the
+# manufacturer, but only once the image has been downloaded and analysed. This module scores
+# the URL on its own, so fetch_image_urls can put the likely winners first and drop the
+# obvious losers (logos, thumbnails, banners, icons) without fetching a byte:
+#   mfr_sim        fuzzy manufacturer match on the basename, as compute_filename_features / 100
+#   pn_in_name     the part number (alphanumerics only) appears in the basename
+#   pn_in_url      ... or elsewhere in the path / query
+#   host_*         the candidate's host is an OEM / Enterprise / Distributor host from the context sheet
+#   neg_keyword    logo, thumb, banner, icon, ... as a path token
+#   pos_keyword    product, zoom, large, hires, ... as a path token
+#   small_hint     a size in the URL (_150x150, ?w=200) below the 400 px gate
+#   large_hint     a size in the URL of 800 px or more
+#   ext_vector     .svg / .gif / .ico / .bmp
+# The score is a logistic model over these features. Weights are read from url_ranker.json,
+# written by `python url_ranker.py train` from the feedback index (read from its local mirror,
+# es_mirror.py, once one has been synced) or the training dataset; without that file the built-in
+# DEFAULT_WEIGHTS are used. Feedback docs carry no part number: training takes it from the
+# image_metadata doc each one points to (original_id). A feature that never fires in the
+# training rows (no part numbers, no --context sheet) keeps its DEFAULT_WEIGHTS value instead
+# of being fitted to 0.
+#
+# Ranking is stable: candidates with equal scores keep the search engine's order.
+# The per-SKU download budget (SKU_DOWNLOAD_BUDGET / SKU_BYTE_BUDGET) is enforced by
+# download_images, which walks the ranked list until it runs out.
+#
+# Environment:
+#   SCRAPER_URL_RANKER        weights file (default url_ranker.json next to this module)
+#   SCRAPER_URL_RANK_MIN      drop candidates scoring below this (default 0.05; 0 keeps everything)
+#   SCRAPER_SKU_DOWNLOADS     at most this many downloads per SKU (default 12; 0 = no limit)
+#   SCRAPER_SKU_BYTES         stop downloading a SKU's candidates after this many bytes (default 0 = no limit)
+#
+# Usage:
+#   python url_ranker.py train [--data ../MLModel/Output/dataset] [--context "Context URLs.xlsx"]
+#   python url_ranker.py score --manufacturer Timken --part-number 30205 <url> [<url> ...]
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from urllib.parse import unquote, urlsplit
+
+try:
+    from rapidfuzz import fuzz
+except Exception:
+    fuzz = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEIGHTS_FILE = os.getenv("SCRAPER_URL_RANKER", os.path.join(HERE, "url_ranker.json"))
+RANK_MIN_SCORE = float(os.getenv("SCRAPER_URL_RANK_MIN", "0.05"))
+SKU_DOWNLOAD_BUDGET = int(os.getenv("SCRAPER_SKU_DOWNLOADS", "12"))
+SKU_BYTE_BUDGET = int(os.getenv("SCRAPER_SKU_BYTES", "0"))
+IMAGE_INDEX = "image_metadata"  # feedback docs point here (original_id) for the part number
+
+FEATURES = [
+    "bias", "mfr_sim", "pn_in_name", "pn_in_url", "host_oem", "host_enterprise", "host_distributor",
+    "neg_keyword", "pos_keyword", "small_hint", "large_hint", "ext_vector",
+]
+# Hand-set starting point: a logo/thumbnail URL ends up below RANK_MIN_SCORE unless it also
+# carries the part number
+DEFAULT_WEIGHTS = {
+    "bias": -0.5, "mfr_sim": 1.0, "pn_in_name": 2.0, "pn_in_url": 1.0,
+    "host_oem": 1.0, "host_enterprise": 0.5, "host_distributor": 0.2,
+    "neg_keyword": -4.0, "pos_keyword": 0.5, "small_hint": -2.5, "large_hint": 0.5, "ext_vector": -3.0,
+}
+
+NEG_KEYWORDS = {
+    "logo", "logos", "icon", "icons", "favicon", "thumb", "thumbs", "thumbnail", "thumbnails", "banner", "banners",
+    "sprite", "sprites", "placeholder", "noimage", "avatar", "badge", "footer", "social", "flag",
+    "spinner", "loading", "blank", "certificate", "award",
+}
+POS_KEYWORDS = {"product", "products", "zoom", "large", "hires", "full", "original", "main", "detail", "xl", "xxl"}
+VECTOR_EXTENSIONS = (".svg", ".gif", ".ico", ".bmp")
+SMALL_DIM = 400  # download_images rejects anything smaller
+LARGE_DIM = 800
+
+_TOKEN = re.compile(r"[a-z]+")
+_NOT_ALNUM = re.compile(r"[^a-z0-9]+")
+_DIMS = re.compile(r"(?<![0-9])([0-9]{2,4})x([0-9]{2,4})(?![0-9])")
+_SIZE_PARAM = re.compile(r"(?:^|[?&;,/_-])(?:w|width|h|height|wid|hei|size|sz|resize)[=_]([0-9]{2,4})(?![0-9])")
+
+
+# === Features ===
+def _similarity(a, b):
+    if fuzz is not None:
+        return fuzz.token_set_ratio(a, b) / 100.0
+    from difflib import SequenceMatcher  # same scale, cruder; only without rapidfuzz
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _host_tier(host, ctx_hosts):
+    """Source type of the context-sheet host `host` belongs to (exact or subdomain), else None."""
+    for ctx_host, source_type in ctx_hosts or ():
+        ctx_host = (ctx_host or "").lower()
+        if ctx_host.startswith("www."):
+            ctx_host = ctx_host[4:]
+        if ctx_host and (host == ctx_host or host.endswith("." + ctx_host)):
+            return source_type
+    return None
+
+
+def url_features(url, manufacturer, part_number=None, ctx_hosts=()):
+    """Feature dict for one candidate URL (keys as in FEATURES)."""
+    parts = urlsplit(url)
+    host = parts.netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    path = unquote(parts.path).lower()
+    name = os.path.splitext(os.path.basename(path))[0]
+    rest = path + "?" + unquote(parts.query).lower()
+    tokens = set(_TOKEN.findall(rest))
+
+    manufacturer_clean = str(manufacturer or "").replace("(", "").replace(")", "").lower()
+    pn = _NOT_ALNUM.sub("", str(part_number or "").lower())
+    pn_in_name = len(pn) >= 3 and pn in _NOT_ALNUM.sub("", name)
+    pn_in_url = len(pn) >= 3 and not pn_in_name and pn in _NOT_ALNUM.sub("", rest)
+
+    dims = [max(int(w), int(h)) for w, h in _DIMS.findall(rest)]
+    dims += [int(v) for v in _SIZE_PARAM.findall(rest)]
+    tier = _host_tier(host, ctx_hosts)
+
+    return {
+        "bias": 1.0,
+        "mfr_sim": _similarity(manufacturer_clean, name) if manufacturer_clean and name else 0.0,
+        "pn_in_name": float(pn_in_name),
+        "pn_in_url": float(pn_in_url),
+        "host_oem": float(tier == "OEM"),
+        "host_enterprise": float(tier == "Enterprise"),
+        "host_distributor": float(tier == "Distributor"),
+        "neg_keyword": float(bool(tokens & NEG_KEYWORDS)),
+        "pos_keyword": float(bool(tokens & POS_KEYWORDS)),
+        "small_hint": float(bool(dims) and max(dims) < SMALL_DIM),
+        "large_hint": float(bool(dims) and max(dims) >= LARGE_DIM),
+        "ext_vector": float(path.endswith(VECTOR_EXTENSIONS)),
+    }
+
+
+# === Model ===
+def _sigmoid(z):
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class UrlRanker:
+    """Logistic score over url_features; missing weights count as 0."""
+
+    def __init__(self, weights=None, info=None):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.info = info or {"source": "defaults"}
+
+    @classmethod
+    def load(cls, path=WEIGHTS_FILE):
+        """Weights from `path`, or the defaults if there is no such file."""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        info = {k: v for k, v in data.items() if k != "weights"}
+        info["source"] = path
+        return cls(data["weights"], info)
+
+    def save(self, path=WEIGHTS_FILE):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**{k: v for k, v in self.info.items() if k != "source"}, "weights": self.weights}, f, indent=2)
+        os.replace(tmp, path)
+
+    def score_features(self, feats):
+        return _sigmoid(sum(self.weights.get(k, 0.0) * v for k, v in feats.items()))
+
+    def score(self, url, manufacturer, part_number=None, ctx_hosts=()):
+        return self.score_features(url_features(url, manufacturer, part_number, ctx_hosts))
+
+    def rank(self, urls, manufacturer, part_number=None, ctx_hosts=(), min_score=RANK_MIN_SCORE):
+        """
+        Returns (kept, pruned): lists of (url, score). `kept` is best first, ties in the
+        original order; `pruned` holds the candidates scoring below min_score.
+        """
+        scored = [(u, self.score(u, manufacturer, part_number, ctx_hosts)) for u in urls]
+        kept = sorted((s for s in scored if s[1] >= min_score), key=lambda s: -s[1])  # sort is stable
+        pruned = [s for s in scored if s[1] < min_score]
+        return kept, pruned
+
+
+_ranker = None
+_ranker_lock = threading.Lock()
+
+
+def get_ranker():
+    """The process-wide ranker, loaded from WEIGHTS_FILE on first use."""
+    global _ranker
+    if _ranker is None:
+        with _ranker_lock:
+            if _ranker is None:
+                try:
+                    _ranker = UrlRanker.load()
+                except Exception as e:
+                    from scraper_logging import log_err
+                    log_err(f"Could not load URL ranker weights from {WEIGHTS_FILE}: {e}; using defaults")
+                    _ranker = UrlRanker()
+    return _ranker
+
+
+def rank_candidates(urls, manufacturer, part_number=None, ctx_hosts=()):
+    """Candidate URLs best first, with the ones below RANK_MIN_SCORE removed (counted and logged)."""
+    import scraper_metrics as metrics
+    from scraper_logging import log_dbg, log_skip
+
+    kept, pruned = get_ranker().rank(urls, manufacturer, part_number, ctx_hosts)
+    for url, score in pruned:
+        metrics.CANDIDATES.inc(outcome="pruned_url")
+        log_skip(f"URL pre-rank {score:.3f} < {RANK_MIN_SCORE}: {url}")
+    for url, score in kept[:5]:
+        log_dbg(f"URL pre-rank {score:.3f}: {url}")
+    return [url for url, _ in kept]
+
+
+# === Training ===
+def fit_logistic(X, y, l2=1.0, iterations=25):
+    """L2-regularised logistic regression by Newton's method; the bias (column 0) is not penalised."""
+    import numpy as np
+
+    w = np.zeros(X.shape[1])
+    penalty = np.full(X.shape[1], l2)
+    penalty[0] = 0.0
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-np.clip(X @ w, -30, 30)))
+        grad = X.T @ (p - y) + penalty * w
+        hess = (X * (p * (1 - p))[:, None]).T @ X + np.diag(penalty + 1e-6)
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.max(np.abs(step)) < 1e-6:
+            break
+    return w
+
+
+def auc(y, scores):
+    """ROC AUC from ranks (ties averaged); None if only one class is present."""
+    import numpy as np
+
+    y = np.asarray(y, dtype=bool)
+    n_pos, n_neg = int(y.sum()), int((~y).sum())
+    if not n_pos or not n_neg:
+        return None
+    order = np.argsort(scores, kind="mergesort")
+    ranks = np.empty(len(scores))
+    sorted_scores = np.asarray(scores)[order]
+    i = 0
+    while i < len(sorted_scores):
+        j = i
+        while j + 1 < len(sorted_scores) and sorted_scores[j + 1] == sorted_scores[i]:
+            j += 1
+        ranks[order[i:j + 1]] = (i + j) / 2.0 + 1
+        i = j + 1
+    return float((ranks[y].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def _is_test(url, seed=42, test_size=0.2):
+    # same hash split as MLModel/model.py: an image stays in its bucket as the feedback grows
+    return int(hashlib.sha256(f"{seed}:{url}".encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF < test_size
+
+
+def part_numbers_from_es(es, original_ids, index=IMAGE_INDEX):
+    """{image_metadata _id: part_number} for the ids that have one."""
+    ids = sorted({i for i in original_ids if i})
+    if not ids:
+        return {}
+    resp = es.search(index=index, body={"size": len(ids), "query": {"ids": {"values": ids}},
+                                        "_source": ["part_number"]})
+    return {h["_id"]: h["_source"]["part_number"] for h in resp["hits"]["hits"]
+            if h.get("_source", {}).get("part_number")}
+
+
+def feedback_rows_from_es(index="feedback", batch_size=500, with_part_numbers=False):
+    """
+    (url, manufacturer, part_number, label) for every labelled feedback doc. part_number is None
+    unless with_part_numbers, which looks each page's documents up in image_metadata.
+    """
+    from es_client import get_es, iter_pit_pages
+
+    es = get_es()
+    source = ["PRIMARY_IMAGE", "MFR_NAME", "original_id", "Label"]
+    for hits in iter_pit_pages(es, index, {"exists": {"field": "Label"}}, batch_size,
+                               sort=[{"_shard_doc": "asc"}], source=source):
+        part_numbers = {}
+        if with_part_numbers:
+            part_numbers = part_numbers_from_es(es, [h["_source"].get("original_id") for h in hits])
+        for hit in hits:
+            s = hit["_source"]
+            yield s.get("PRIMARY_IMAGE"), s.get("MFR_NAME"), part_numbers.get(s.get("original_id")), s.get("Label")
+
+
+def feedback_rows_from_mirror(index="feedback", with_part_numbers=False):
+    """
+    Same rows from the local mirror of the feedback index (es_mirror.py). Part numbers come
+    from the image_metadata mirror, or from the cluster when that hasn't been synced.
+    """
+    import es_mirror
+
+    df = es_mirror.load(index, columns=["PRIMARY_IMAGE", "MFR_NAME", "original_id", "Label"])
+    df = df[df["Label"].notna()]
+    df = df.astype(object).where(df.notna(), None)
+    if not with_part_numbers:
+        yield from zip(df["PRIMARY_IMAGE"], df["MFR_NAME"], [None] * len(df), df["Label"])
+        return
+    if es_mirror.available(IMAGE_INDEX):
+        images = es_mirror.load(IMAGE_INDEX, columns=["part_number"])
+        images = images[images["part_number"].notna()]
+        part_numbers = dict(zip(images["_id"], images["part_number"]))
+    else:
+        from es_client import get_es
+
+        es, ids = get_es(), list(df["original_id"])
+        part_numbers = {}
+        for start in range(0, len(ids), 500):
+            part_numbers.update(part_numbers_from_es(es, ids[start:start + 500]))
+    part_number = [part_numbers.get(i) for i in df["original_id"]]
+    yield from zip(df["PRIMARY_IMAGE"], df["MFR_NAME"], part_number, df["Label"])
+
+
+def feedback_rows(index="feedback", live=False, with_part_numbers=False):
+    """
+    Feedback rows from the mirror when it has been synced, else (or with live=True) from ES.
+    with_part_numbers joins each row to its image_metadata doc (training needs it; it costs
+    cluster queries when image_metadata isn't mirrored).
+    """
+    import es_mirror
+
+    if not live and es_mirror.available(index):
+        return feedback_rows_from_mirror(index, with_part_numbers=with_part_numbers)
+    return feedback_rows_from_es(index, with_part_numbers=with_part_numbers)
+
+
+def feedback_rows_from_file(path):
+    """Rows from the training dataset (MLModel/Output/dataset), one of its Parquet files, or a CSV."""
+    if not path.endswith(".csv"):
+        import glob
+
+        import pandas as pd
+
+        paths = sorted(glob.glob(os.path.join(path, "*", "*.parquet"))) if os.path.isdir(path) else [path]
+        if not paths:
+            raise SystemExit(f"no Parquet files under {path}")
+        df = pd.concat([pd.read_parquet(p, columns=["PRIMARY_IMAGE", "MFR_NAME", "Label"]) for p in paths])
+        df = df.astype(object).where(df.notna(), None)
+        yield from zip(df["PRIMARY_IMAGE"], df["MFR_NAME"], [None] * len(df), df["Label"])
+        return
+
+    import csv
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield (row.get("PRIMARY_IMAGE"), row.get("MFR_NAME"), row.get("PART_NUMBER") or row.get("part_number"),
+                   row.get("Label"))
+
+
+def train(rows, context_urls=(), l2=1.0):
+    """
+    Fit a ranker on feedback rows. Returns (ranker, report); the report compares the held-out
+    AUC of the trained weights with the defaults.
+    """
+    import numpy as np
+    from image_scraper import resolve_context_hosts
+
+    hosts_by_mfr = {}
+    X, y, test = [], [], []
+    for url, manufacturer, part_number, label in rows:
+        if not url or label in (None, ""):
+            continue
+        try:
+            label = int(float(label))
+        except (TypeError, ValueError):
+            continue
+        if manufacturer not in hosts_by_mfr:
+            hosts_by_mfr[manufacturer] = resolve_context_hosts(manufacturer, context_urls) if context_urls else []
+        feats = url_features(url, manufacturer, part_number, hosts_by_mfr[manufacturer])
+        X.append([feats[k] for k in FEATURES])
+        y.append(1.0 if label > 0 else 0.0)
+        test.append(_is_test(url))
+    if not X:
+        raise ValueError("no labelled feedback rows")
+    X, y, test = np.array(X), np.array(y), np.array(test)
+
+    default_w = np.array([DEFAULT_WEIGHTS.get(k, 0.0) for k in FEATURES])
+    # a feature that is 0 in every row says nothing about its weight: keep the default
+    fitted = X.any(axis=0)
+
+    def fit(rows):
+        w = default_w.copy()
+        w[fitted] = fit_logistic(X[rows][:, fitted], y[rows], l2=l2)
+        return w
+
+    w = fit(~test)
+    report = {
+        "rows": int(len(y)),
+        "positives": int(y.sum()),
+        "test_rows": int(test.sum()),
+        "test_auc": auc(y[test], X[test] @ w),
+        "test_auc_defaults": auc(y[test], X[test] @ default_w),
+        "kept_default": [k for k, f in zip(FEATURES, fitted) if not f],
+    }
+    # refit on everything for the published weights
+    w = fit(np.ones(len(y), dtype=bool))
+    info = {"trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "features": FEATURES, **report}
+    return UrlRanker({k: round(float(v), 6) for k, v in zip(FEATURES, w)}, info), report
+
+
+def main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(description="URL-only candidate pre-ranker.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("train", help="Fit weights from the feedback index (or the training dataset)")
+    t.add_argument("--data", "--csv", dest="data", default="",
+                   help="Rows with PRIMARY_IMAGE, MFR_NAME, Label: the training dataset dir "
+                        "(../MLModel/Output/dataset), a Parquet file or a CSV")
+    t.add_argument("--index", default="feedback")
+    t.add_argument("--live", action="store_true", help="Query the feedback index even if a local mirror exists")
+    t.add_argument("--context", default="", help="Context URLs sheet, for the host-tier features")
+    t.add_argument("--l2", type=float, default=1.0)
+    t.add_argument("--out", default=WEIGHTS_FILE)
+    t.add_argument("--dry-run", action="store_true", help="Report only, don't write the weights file")
+    s = sub.add_parser("score", help="Score URLs with the current weights")
+    s.add_argument("--manufacturer", required=True)
+    s.add_argument("--part-number", default="")
+    s.add_argument("urls", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "score":
+        ranker = get_ranker()
+        print(f"weights: {ranker.info.get('source')}")
+        kept, pruned = ranker.rank(args.urls, args.manufacturer, args.part_number)
+        for url, score in kept:
+            print(f"{score:.3f}  {url}")
+        for url, score in pruned:
+            print(f"{score:.3f}  {url}  (pruned)")
+        return
+
+    context_urls = []
+    if args.context:
+        from excel_parse import get_context_urls
+        context_urls = get_context_urls(args.context)
+    rows = (feedback_rows_from_file(args.data) if args.data
+            else feedback_rows(args.index, args.live, with_part_numbers=True))
+    ranker, report = train(rows, context_urls, l2=args.l2)
+    print(json.dumps(report, indent=2))
+    for k in FEATURES:
+        print(f"  {k:<18}{ranker.weights[k]:>9.3f}")
+    if not args.dry_run:
+        ranker.save(args.out)
+        print(f"weights written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
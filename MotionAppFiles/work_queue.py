@@ -0,0 +1,529 @@
+# work_queue.py
+# Leased job queue so several headless scrapers can share one catalog.
+#
+# Every spreadsheet row becomes a job (keyed by its Motion id, so enqueueing the same
+# sheet twice is a no-op). A worker leases one job at a time; while it works a
+# heartbeat keeps extending the lease. If the worker dies the lease runs out and
+# the job goes back to the queue. Failed jobs are retried with exponential backoff.
+# After MAX_ATTEMPTS tries a job is moved to the dead-letter state, where it waits
+# for `python work_queue.py requeue --state dead`.
+#
+# Backends (picked by open_queue from the queue URL):
+#   /path/jobs.sqlite or sqlite:///path   one host; SQLite's file lock serialises workers
+#   redis://host:6379/0                   several hosts; leases are Lua scripts (needs `pip install redis`)
+#
+# Environment:
+#   SCRAPER_QUEUE_URL          default queue for image_scraper.py --enqueue / --worker
+#   SCRAPER_QUEUE_LEASE_S      lease length in seconds (default 300; heartbeats every third of it)
+#   SCRAPER_QUEUE_MAX_ATTEMPTS tries before a job is dead-lettered (default 3)
+#   SCRAPER_QUEUE_BACKOFF_S    first retry delay, doubled per attempt (default 30, capped at 1 h)
+#
+# Usage (from MotionAppFiles/):
+#   python image_scraper.py --enqueue --queue jobs.sqlite --input list.xlsx --context ctx.xlsx
+#   python image_scraper.py --worker --queue jobs.sqlite --output out/     # run as many as you like
+#   python work_queue.py stats --queue jobs.sqlite
+#   python work_queue.py dead --queue jobs.sqlite
+#   python work_queue.py requeue --queue jobs.sqlite --state dead
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+DEFAULT_QUEUE_URL = os.getenv("SCRAPER_QUEUE_URL", "scraper_queue.sqlite")
+LEASE_SECONDS = float(os.getenv("SCRAPER_QUEUE_LEASE_S", "300"))
+MAX_ATTEMPTS = int(os.getenv("SCRAPER_QUEUE_MAX_ATTEMPTS", "3"))
+BACKOFF_SECONDS = float(os.getenv("SCRAPER_QUEUE_BACKOFF_S", "30"))
+MAX_BACKOFF_SECONDS = 3600.0
+
+STATES = ("pending", "leased", "done", "dead")
+
+
+class Job:
+    """One leased job. `token` identifies this lease; a worker whose lease was taken over can't complete the job."""
+
+    def __init__(self, id, key, payload, attempts, token):
+        self.id = id
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.token = token
+
+    def __repr__(self):
+        return f"Job(id={self.id}, key={self.key!r}, attempts={self.attempts})"
+
+
+def retry_delay(attempts, base=BACKOFF_SECONDS):
+    """Seconds before a job that has failed `attempts` times may be leased again."""
+    return min(base * (2 ** max(attempts - 1, 0)), MAX_BACKOFF_SECONDS)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# === SQLite backend ===
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue        TEXT NOT NULL,
+    key          TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    state        TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner  TEXT,
+    lease_token  TEXT,
+    lease_until  REAL,
+    last_error   TEXT,
+    result       TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL,
+    UNIQUE (queue, key)
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, state, available_at)"
+
+
+class SQLiteQueue:
+    """
+    Queue in one SQLite file. Leasing runs in a BEGIN IMMEDIATE transaction, so any number of
+    worker processes on the host can share the file. Don't put it on a network share: SQLite
+    file locking is unreliable there. Use Redis for several hosts.
+    """
+
+    def __init__(self, path, name="default", lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()  # the heartbeat thread shares the connection
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute(_INDEX)
+
+    def _write(self, fn):
+        """Run fn(conn) in an IMMEDIATE transaction (takes the write lock up front, no upgrade deadlocks)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return out
+
+    def enqueue(self, jobs):
+        """Add (key, payload) pairs; keys already in the queue are skipped. Returns how many were added."""
+        now = time.time()
+        rows = [(self.name, str(key), json.dumps(payload), now, now, now) for key, payload in jobs]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (queue, key, payload, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return conn.total_changes - before
+
+        return self._write(insert)
+
+    def lease(self, worker_id):
+        """Lease the oldest available job (expired leases count as available); None if there is nothing to do."""
+        now = time.time()
+        token = uuid.uuid4().hex
+
+        def take(conn):
+            # leases that ran out on their last attempt go straight to the dead letters
+            conn.execute(
+                "UPDATE jobs SET state = 'dead', last_error = 'lease expired (worker lost)', lease_token = NULL, "
+                "updated_at = ? WHERE queue = ? AND state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.name, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id, key, payload, attempts FROM jobs WHERE queue = ? AND "
+                "((state = 'pending' AND available_at <= ?) OR (state = 'leased' AND lease_until < ?)) "
+                "ORDER BY id LIMIT 1",
+                (self.name, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_owner = ?, lease_token = ?, "
+                "lease_until = ?, updated_at = ? WHERE id = ?",
+                (worker_id, token, now + self.lease_seconds, now, row[0]),
+            )
+            return Job(row[0], row[1], json.loads(row[2]), row[3] + 1, token)
+
+        return self._write(take)
+
+    def _update_leased(self, job, sql, params):
+        def update(conn):
+            cur = conn.execute(sql + " WHERE id = ? AND lease_token = ? AND state = 'leased'",
+                               (*params, job.id, job.token))
+            return cur.rowcount == 1
+
+        return self._write(update)
+
+    def heartbeat(self, job):
+        """Extend the lease; False if it was lost (expired and taken by another worker)."""
+        now = time.time()
+        return self._update_leased(job, "UPDATE jobs SET lease_until = ?, updated_at = ?",
+                                   (now + self.lease_seconds, now))
+
+    def complete(self, job, result=None):
+        """Mark the job done; False if the lease was lost (another worker may run it again)."""
+        return self._update_leased(
+            job, "UPDATE jobs SET state = 'done', result = ?, lease_token = NULL, lease_until = NULL, updated_at = ?",
+            (None if result is None else json.dumps(result), time.time()),
+        )
+
+    def fail(self, job, error):
+        """Record a failure: back to pending after retry_delay(), or dead after max_attempts. Returns the new state."""
+        now = time.time()
+        state = "dead" if job.attempts >= self.max_attempts else "pending"
+        ok = self._update_leased(
+            job, "UPDATE jobs SET state = ?, last_error = ?, available_at = ?, lease_token = NULL, "
+                 "lease_until = NULL, updated_at = ?",
+            (state, str(error)[:2000], now + retry_delay(job.attempts), now),
+        )
+        return state if ok else None
+
+    def release(self, job):
+        """Hand the job back untouched (worker shutting down); the attempt isn't counted."""
+        now = time.time()
+        return self._update_leased(
+            job, "UPDATE jobs SET state = 'pending', attempts = attempts - 1, available_at = ?, "
+                 "lease_token = NULL, lease_until = NULL, updated_at = ?",
+            (now, now),
+        )
+
+    def stats(self):
+        """{state: count} for every state, plus "retrying" (pending jobs waiting out a backoff)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE queue = ? GROUP BY state", (self.name,)
+            ).fetchall()
+            retrying = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = 'pending' AND available_at > ?",
+                (self.name, time.time()),
+            ).fetchone()[0]
+        out = dict.fromkeys(STATES, 0)
+        out.update(rows)
+        out["retrying"] = retrying
+        return out
+
+    def jobs(self, state, limit=100):
+        """Jobs in one state, oldest first: [{"id", "key", "attempts", "last_error", "payload"}, ...]."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, key, attempts, last_error, payload FROM jobs WHERE queue = ? AND state = ? "
+                "ORDER BY id LIMIT ?",
+                (self.name, state, limit),
+            ).fetchall()
+        return [{"id": r[0], "key": r[1], "attempts": r[2], "last_error": r[3], "payload": json.loads(r[4])}
+                for r in rows]
+
+    def requeue(self, state="dead"):
+        """Move every job in `state` (dead or done) back to pending with a fresh attempt budget."""
+        if state not in ("dead", "done"):
+            raise ValueError(f"can only requeue dead or done jobs, not {state!r}")
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+            "WHERE queue = ? AND state = ?",
+            (now, now, self.name, state),
+        ).rowcount)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# === Redis backend ===
+# Layout under "scraper:queue:<name>:": jobs (hash id -> job JSON), keys (hash key -> id),
+# seq (id counter), ready (zset id -> available_at), leased (zset id -> lease_until),
+# done / dead (sets). Each operation is one Lua script, so it's atomic across hosts.
+_LUA_RECLAIM = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    local job = cjson.decode(redis.call('HGET', KEYS[1], id))
+    redis.call('ZREM', KEYS[2], id)
+    job.token = false
+    job.last_error = 'lease expired (worker lost)'
+    if job.attempts >= tonumber(ARGV[2]) then
+        job.state = 'dead'
+        redis.call('SADD', KEYS[4], id)
+    else
+        job.state = 'pending'
+        redis.call('ZADD', KEYS[3], ARGV[1], id)
+    end
+    redis.call('HSET', KEYS[1], id, cjson.encode(job))
+end
+"""
+
+_SCRIPTS = {
+    # KEYS: jobs keys seq ready; ARGV: now, then (key, payload) pairs
+    "enqueue": """
+local added = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[2], ARGV[i]) == 0 then
+        local id = tostring(redis.call('INCR', KEYS[3]))
+        redis.call('HSET', KEYS[2], ARGV[i], id)
+        redis.call('HSET', KEYS[1], id, cjson.encode({id = tonumber(id), key = ARGV[i], payload = ARGV[i + 1],
+                   state = 'pending', attempts = 0, token = false}))
+        redis.call('ZADD', KEYS[4], ARGV[1], id)
+        added = added + 1
+    end
+end
+return added
+""",
+    # KEYS: jobs leased ready dead; ARGV: now, max_attempts, lease_until, owner, token
+    "lease": _LUA_RECLAIM + """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then return false end
+local id = ids[1]
+local job = cjson.decode(redis.call('HGET', KEYS[1], id))
+redis.call('ZREM', KEYS[3], id)
+job.state = 'leased'
+job.attempts = job.attempts + 1
+job.owner = ARGV[4]
+job.token = ARGV[5]
+redis.call('HSET', KEYS[1], id, cjson.encode(job))
+redis.call('ZADD', KEYS[2], ARGV[3], id)
+return cjson.encode(job)
+""",
+    # KEYS: jobs leased ready done dead; ARGV: id, token, action, now, arg
+    #   action: heartbeat (arg = lease_until), complete (arg = result JSON), fail (arg = error; ARGV[6] state,
+    #   ARGV[7] available_at), release
+    "settle": """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then return 0 end
+local job = cjson.decode(raw)
+if job.state ~= 'leased' or job.token ~= ARGV[2] then return 0 end
+local action = ARGV[3]
+if action == 'heartbeat' then
+    redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+    return 1
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+job.token = false
+if action == 'complete' then
+    job.state = 'done'
+    job.result = ARGV[5]
+    redis.call('SADD', KEYS[4], ARGV[1])
+elseif action == 'fail' then
+    job.state = ARGV[6]
+    job.last_error = ARGV[5]
+    if ARGV[6] == 'dead' then
+        redis.call('SADD', KEYS[5], ARGV[1])
+    else
+        redis.call('ZADD', KEYS[3], ARGV[7], ARGV[1])
+    end
+else
+    job.state = 'pending'
+    job.attempts = job.attempts - 1
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(job))
+return 1
+""",
+    # KEYS: jobs from_set ready; ARGV: now
+    "requeue": """
+local ids = redis.call('SMEMBERS', KEYS[2])
+for _, id in ipairs(ids) do
+    local job = cjson.decode(redis.call('HGET', KEYS[1], id))
+    job.state = 'pending'
+    job.attempts = 0
+    redis.call('HSET', KEYS[1], id, cjson.encode(job))
+    redis.call('ZADD', KEYS[3], ARGV[1], id)
+end
+redis.call('DEL', KEYS[2])
+return #ids
+""",
+}
+
+
+class RedisQueue:
+    """Same interface as SQLiteQueue, shared by workers on any number of hosts."""
+
+    def __init__(self, url, name="default", lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        if redis is None:
+            raise RuntimeError("redis:// queues need the redis package (pip install redis)")
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._r = redis.Redis.from_url(url)
+        prefix = f"scraper:queue:{name}:"
+        self._k = {k: prefix + k for k in ("jobs", "keys", "seq", "ready", "leased", "done", "dead")}
+        self._scripts = {name: self._r.register_script(src) for name, src in _SCRIPTS.items()}
+
+    def _settle(self, job, action, arg="", *extra):
+        k = self._k
+        return bool(self._scripts["settle"](
+            keys=[k["jobs"], k["leased"], k["ready"], k["done"], k["dead"]],
+            args=[job.id, job.token, action, time.time(), arg, *extra],
+        ))
+
+    def enqueue(self, jobs):
+        k = self._k
+        added = 0
+        batch = []
+        for key, payload in jobs:
+            batch += [str(key), json.dumps(payload)]
+            if len(batch) >= 1000:
+                added += self._scripts["enqueue"](keys=[k["jobs"], k["keys"], k["seq"], k["ready"]],
+                                                  args=[time.time(), *batch])
+                batch = []
+        if batch:
+            added += self._scripts["enqueue"](keys=[k["jobs"], k["keys"], k["seq"], k["ready"]],
+                                              args=[time.time(), *batch])
+        return added
+
+    def lease(self, worker_id):
+        k = self._k
+        now = time.time()
+        token = uuid.uuid4().hex
+        raw = self._scripts["lease"](
+            keys=[k["jobs"], k["leased"], k["ready"], k["dead"]],
+            args=[now, self.max_attempts, now + self.lease_seconds, worker_id, token],
+        )
+        if not raw:
+            return None
+        job = json.loads(raw)
+        return Job(job["id"], job["key"], json.loads(job["payload"]), job["attempts"], token)
+
+    def heartbeat(self, job):
+        return self._settle(job, "heartbeat", time.time() + self.lease_seconds)
+
+    def complete(self, job, result=None):
+        return self._settle(job, "complete", "" if result is None else json.dumps(result))
+
+    def fail(self, job, error):
+        state = "dead" if job.attempts >= self.max_attempts else "pending"
+        ok = self._settle(job, "fail", str(error)[:2000], state, time.time() + retry_delay(job.attempts))
+        return state if ok else None
+
+    def release(self, job):
+        return self._settle(job, "release")
+
+    def stats(self):
+        k = self._k
+        now = time.time()
+        pipe = self._r.pipeline()
+        pipe.zcard(k["ready"])
+        pipe.zcount(k["ready"], f"({now}", "+inf")
+        pipe.zcard(k["leased"])
+        pipe.scard(k["done"])
+        pipe.scard(k["dead"])
+        pending, retrying, leased, done, dead = pipe.execute()
+        return {"pending": pending, "leased": leased, "done": done, "dead": dead, "retrying": retrying}
+
+    def jobs(self, state, limit=100):
+        k = self._k
+        if state in ("done", "dead"):
+            ids = sorted(self._r.smembers(k[state]), key=int)[:limit]
+        else:
+            ids = self._r.zrange(k["ready" if state == "pending" else "leased"], 0, limit - 1)
+        out = []
+        for raw in (self._r.hmget(k["jobs"], ids) if ids else []):
+            job = json.loads(raw)
+            out.append({"id": job["id"], "key": job["key"], "attempts": job["attempts"],
+                        "last_error": job.get("last_error") or None, "payload": json.loads(job["payload"])})
+        return out
+
+    def requeue(self, state="dead"):
+        if state not in ("dead", "done"):
+            raise ValueError(f"can only requeue dead or done jobs, not {state!r}")
+        k = self._k
+        return self._scripts["requeue"](keys=[k["jobs"], k[state], k["ready"]], args=[time.time()])
+
+    def close(self):
+        self._r.close()
+
+
+def open_queue(url=DEFAULT_QUEUE_URL, name="default", **kwargs):
+    """SQLiteQueue for a file path (or sqlite:///path), RedisQueue for redis:// / rediss:// URLs."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url, name=name, **kwargs)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteQueue(url, name=name, **kwargs)
+
+
+class Heartbeat:
+    """Extends a job's lease from a background thread while the `with` block runs."""
+
+    def __init__(self, queue, job, interval=None):
+        self.queue = queue
+        self.job = job
+        self.interval = interval or max(queue.lease_seconds / 3.0, 1.0)
+        self.lost = False  # set when the lease was taken over; the work may be repeated elsewhere
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.job):
+                    self.lost = True
+                    return
+            except Exception:
+                pass  # transient backend error; the next beat (or lease expiry) sorts it out
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.job.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+__all__ = [
+    "Job", "SQLiteQueue", "RedisQueue", "Heartbeat", "open_queue",
+    "retry_delay", "default_worker_id", "DEFAULT_QUEUE_URL",
+]
+
+
+# === CLI ===
+def main(argv=None):
+    import argparse
+
+    p = argparse.ArgumentParser(description="Inspect and manage the scraper work queue.")
+    p.add_argument("command", choices=("stats", "dead", "requeue"))
+    p.add_argument("--queue", default=DEFAULT_QUEUE_URL, help="SQLite path or redis:// URL")
+    p.add_argument("--name", default="default", help="Queue name within the backend")
+    p.add_argument("--state", default="dead", choices=("dead", "done"), help="requeue: which jobs to reset")
+    p.add_argument("--limit", type=int, default=50, help="dead: how many jobs to list")
+    args = p.parse_args(argv)
+
+    queue = open_queue(args.queue, name=args.name)
+    try:
+        if args.command == "stats":
+            print(json.dumps(queue.stats()))
+        elif args.command == "dead":
+            for job in queue.jobs("dead", limit=args.limit):
+                print(f"{job['id']:>8}  {job['key']:<16} attempts={job['attempts']}  {job['last_error']}")
+        else:
+            print(f"requeued {queue.requeue(args.state)} {args.state} job(s)")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,74 @@ const client = new Client({
     : undefined,
 });
 
+// Per-(manufacturer, status) counts maintained by the pipeline (MotionAppFiles/rollups.py).
+// Set ROLLUP_INDEX="" to always aggregate image_metadata instead.
+const ROLLUP_INDEX = process.env.ROLLUP_INDEX ?? "image_metadata_rollups";
+const ROLLUP_BUCKET_PCT = 5; // confidence_buckets width, as a percentage
+
+type RollupDoc = {
+  manufacturer: string;
+  status: string;
+  count: number;
+  confidence_buckets?: number[];
+};
+
+// Facet buckets from the rollups, or null when they can't answer exactly (other fields or
+// filters, a min_confidence between bucket edges, no rollup index yet) and the caller should
+// aggregate image_metadata. Rollups are keyed by the exact manufacturer name, while the
+// products endpoint matches manufacturer as analysed text, so a manufacturer filter always
+// aggregates.
+async function facetFromRollups(
+  field: string,
+  status: string | null,
+  minConfidence: string | null
+): Promise<{ key: string; doc_count: number }[] | null> {
+  if (!ROLLUP_INDEX || (field !== "manufacturer" && field !== "status")) return null;
+
+  let fromBucket = -1; // -1: no confidence filter, count every doc
+  const num = minConfidence ? Number(minConfidence) : NaN;
+  if (!Number.isNaN(num)) {
+    if (num % ROLLUP_BUCKET_PCT !== 0) return null;
+    fromBucket = Math.max(0, num / ROLLUP_BUCKET_PCT);
+    // The last bucket holds 0.95 <= confidence <= 1.0, so ">= 1.0" has no bucket boundary
+    if (fromBucket >= 100 / ROLLUP_BUCKET_PCT) return null;
+  }
+
+  const filter: estypes.QueryDslQueryContainer[] = [];
+  if (status && status !== "any") filter.push({ term: { status } });
+
+  try {
+    const raw = await client.search<RollupDoc>({
+      index: ROLLUP_INDEX,
+      size: 10000,
+      track_total_hits: true,
+      query: filter.length ? { bool: { filter } } : { match_all: {} },
+    });
+    const hits = raw.hits.hits;
+    if (hits.length === 0) return null;
+    const total = typeof raw.hits.total === "number" ? raw.hits.total : raw.hits.total?.value ?? 0;
+    if (total > hits.length) return null; // more groups than one page: aggregate instead
+
+    const counts = new Map<string, number>();
+    for (const hit of hits) {
+      const doc = hit._source;
+      if (!doc) continue;
+      const key = field === "manufacturer" ? doc.manufacturer : doc.status;
+      if (!key) continue; // docs without the field have no terms bucket either
+      const n =
+        fromBucket < 0
+          ? doc.count
+          : (doc.confidence_buckets ?? []).slice(fromBucket).reduce((a, b) => a + b, 0);
+      if (n > 0) counts.set(key, (counts.get(key) ?? 0) + n);
+    }
+    return [...counts.entries()]
+      .sort(([a], [b]) => (a < b ? -1 : a > b ? 1 : 0))
+      .map(([key, doc_count]) => ({ key, doc_count }));
+  } catch {
+    return null; // rollup index missing or unreachable: aggregate instead
+  }
+}
+
 export async function GET(req: NextRequest) {
   const { searchParams } = new URL(req.url);
 
@@ -32,6 +100,12 @@ export async function GET(req: NextRequest) {
   const to = searchParams.get("to");
 
   try {
+    const noManufacturer = !manufacturer || manufacturer === "All";
+    if (noManufacturer && (!sku_number || sku_number === "All") && !sku_prefix && !from && !to) {
+      const buckets = await facetFromRollups(field, status, min_confidence);
+      if (buckets) return NextResponse.json({ buckets });
+    }
+
     const must: estypes.QueryDslQueryContainer[] = [];
     const should: estypes.QueryDslQueryContainer[] = [];
 